@@ -0,0 +1,65 @@
+"""
+Консолидация объединённых таблиц (ConsolidatorV2): время на миллионе строк
+с дублями, разным регистром/пробелами, синонимами единиц и количествами вида "1 500,5".
+
+Запуск из корня проекта:
+    python benchmarks/bench_consolidation.py --rows 1000000 --positions 50000
+    python benchmarks/bench_consolidation.py --rows 200000 --positions 20000 --fuzzy
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from specs.services.processing.consolidator_v2 import ConsolidatorV2  # noqa: E402
+
+UNITS = ["шт", "шт.", "Штук", "штука", "кг", "компл."]
+QUANTITIES = ["1", "2,5", "1 000", "10", "по потребности", ""]
+TECH_SPECS = ["", "ГОСТ 7798-70", "оцинкованный", "ГОСТ 5915-70"]
+
+
+def make_merged(rows: int, positions: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, positions, rows)
+    upper = rng.random(rows) < 0.5
+    names = np.where(upper, "БОЛТ  М", "болт м").astype(object) + (ids % 977).astype(str)
+    return pd.DataFrame({
+        "Обозначение": np.char.add("ГОСТ-", ids.astype(str)).astype(object),
+        "Наименование": names,
+        "Ед. изм.": rng.choice(UNITS, rows).astype(object),
+        "Требуемое кол-во, в ед. изм.": rng.choice(QUANTITIES, rows, p=[0.4, 0.2, 0.2, 0.17, 0.01, 0.02]).astype(object),
+        "Техническое задание": rng.choice(TECH_SPECS, rows).astype(object),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--positions", type=int, default=50_000)
+    parser.add_argument("--fuzzy", action="store_true", help="замерить и нечёткое объединение (fuzzy_dedupe)")
+    args = parser.parse_args()
+
+    df = make_merged(args.rows, args.positions)
+    consolidator = ConsolidatorV2(consolidate=True)
+
+    started = time.perf_counter()
+    result = consolidator._consolidate(df)
+    elapsed = time.perf_counter() - started
+
+    print(f"input: {len(df)} rows -> {len(result)} positions")
+    print(f"consolidate: {elapsed:.2f} s ({len(df) / elapsed / 1e6:.2f}M rows/s)")
+
+    if args.fuzzy:
+        started = time.perf_counter()
+        merged = consolidator._fuzzy_merge(result)
+        elapsed = time.perf_counter() - started
+        print(f"fuzzy merge: {len(result)} -> {len(merged)} positions in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
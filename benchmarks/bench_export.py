@@ -0,0 +1,94 @@
+"""
+Запись итоговой таблицы: прежний DataFrame.to_excel против потокового
+exporter.table_exporter (xlsx write_only, а также csv/parquet).
+Каждый вариант запускается в отдельном процессе, чтобы пик RSS не смешивался.
+
+Запуск из корня проекта:
+    python benchmarks/bench_export.py --rows 100000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from specs.services.exporter.table_exporter import export_dataframe  # noqa: E402
+
+VARIANTS = ("to_excel", "xlsx", "csv", "parquet")
+
+
+def make_result(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, rows, rows)
+    return pd.DataFrame({
+        "Обозначение": np.char.add("ГОСТ 7798-70 М", ids.astype(str)).astype(object),
+        "Наименование": np.char.add("Болт с шестигранной головкой М", (ids % 977).astype(str)).astype(object),
+        "Ед. изм.": rng.choice(["шт.", "кг", "компл."], rows).astype(object),
+        "Требуемое кол-во, в ед. изм.": rng.integers(1, 5000, rows).astype(str).astype(object),
+        "Техническое задание": rng.choice(["", "оцинкованный", "класс прочности 8.8 | оцинкованный"], rows).astype(object),
+    })
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(variant: str, rows: int, output_dir: str) -> dict:
+    df = make_result(rows)
+    baseline = _max_rss_mb()
+    output_path = str(Path(output_dir) / f"result_{variant}.{'xlsx' if variant == 'to_excel' else variant}")
+
+    started = time.perf_counter()
+    if variant == "to_excel":
+        df.to_excel(output_path, index=False)
+    else:
+        export_dataframe(df, output_path, fmt=variant)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "variant": variant,
+        "seconds": elapsed,
+        "peak_rss_mb": _max_rss_mb(),
+        "rss_growth_mb": _max_rss_mb() - baseline,
+        "size_mb": Path(output_path).stat().st_size / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.rows, args.output_dir)))
+        return
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for variant in VARIANTS:
+            completed = subprocess.run(
+                [sys.executable, __file__, "--rows", str(args.rows), "--variant", variant, "--output-dir", output_dir],
+                capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                print(f"{variant:9s} failed: {completed.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(
+                f"{variant:9s} {result['seconds']:6.2f} s  peak RSS {result['peak_rss_mb']:7.1f} MB "
+                f"(+{result['rss_growth_mb']:.1f} MB while writing)  file {result['size_mb']:.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
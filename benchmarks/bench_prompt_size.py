@@ -0,0 +1,41 @@
+"""
+Размер пользовательской части запроса к GPT: прежний формат
+(DataFrame.to_csv со всеми пустыми колонками, «Вот сырой CSV: ...») против prompt_builder.
+Токены оцениваются так же, как при нарезке на пачки (chunking.estimate_tokens).
+
+Запуск из корня проекта:
+    python benchmarks/bench_prompt_size.py --rows 2000 --cols 12
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_table_cleaning import make_sheet  # noqa: E402
+from specs.services.ai.chunking import estimate_tokens  # noqa: E402
+from specs.services.ai.prompt_builder import build_table_prompt  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--cols", type=int, default=12)
+    args = parser.parse_args()
+
+    df = make_sheet(args.rows, args.cols)
+    table = df.iloc[3:].copy()
+    table.columns = df.iloc[2]
+
+    legacy = f"Вот сырой CSV: {table.to_csv(index=False, sep=';')}. Приведи данные к указанному шаблону."
+    prompt = build_table_prompt([list(table.columns)] + table.values.tolist())
+    compact = f"Приведи данные к указанному шаблону.\nДанные:\n{prompt.text}"
+
+    legacy_tokens, compact_tokens = estimate_tokens(legacy), estimate_tokens(compact)
+    print(f"table: {len(table)} rows x {len(table.columns)} cols, unique rows sent: {len(prompt.counts) - 1}")
+    print(f"legacy:  {legacy_tokens:8d} tokens")
+    print(f"compact: {compact_tokens:8d} tokens ({(1 - compact_tokens / legacy_tokens) * 100:.1f}% less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Микро-бенчмарк очистки таблиц ExcelParser: старая построчная реализация
+(apply + lambda по ячейкам, iterrows) против векторной из table_cleaning.
+
+Запуск из корня проекта:
+    python benchmarks/bench_table_cleaning.py --rows 50000 --cols 12
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from specs.services.processing.table_cleaning import clean_table, find_header_row, non_empty_mask  # noqa: E402
+
+CELL_VALUES = np.array(
+    ["", "", " ", "Болт М10х40", "12", "  шт. ", "ГОСТ 7798-70 оцинкованный", "1 500,5", "7610.95000"],
+    dtype=object,
+)
+
+
+def make_sheet(rows: int, cols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.choice(CELL_VALUES, size=(rows, cols)))
+    # первые колонки заполнены всегда (реальные данные), остальные — разреженный мусор
+    dense = max(cols // 2, 2)
+    df.iloc[:, :dense] = rng.choice(CELL_VALUES[3:], size=(rows, dense))
+    # шапка документа, пустая строка и заголовок таблицы
+    df.iloc[0] = ["Спецификация"] + [""] * (cols - 1)
+    df.iloc[1] = [""] * cols
+    df.iloc[2] = [f"Колонка {j}" for j in range(cols)]
+    return df
+
+
+def legacy_clean(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Реализация ExcelParser.parse_sheet до векторизации (для сравнения).
+    """
+    header_idx = 0
+    for i, row in df.iterrows():
+        filled = row.astype(str).str.strip()
+        non_empty = filled[filled != ""]
+        if len(non_empty) >= 2 and not all(s.isdigit() for s in non_empty):
+            header_idx = i
+            break
+
+    table = df.iloc[header_idx + 1:].copy()
+    table.columns = df.iloc[header_idx]
+
+    table = table.dropna(how="all")
+    table = table[~table.apply(lambda r: all(v.strip() == "" for v in r), axis=1)]
+    table = table[table.apply(lambda r: sum(str(v).strip() != "" for v in r) >= 2, axis=1)]
+    table = table.dropna(axis=1, how="all")
+    table = table.loc[:, ~(table.apply(lambda col: col.astype(str).str.strip().eq("").all()))]
+    table = table.loc[:, table.apply(lambda col: sum(str(v).strip() == "" for v in col) < 5)]
+    table = table[table.apply(lambda r: sum(str(v).strip() == "" for v in r) < 3, axis=1)]
+    return table
+
+
+def vectorized_clean(df: pd.DataFrame) -> pd.DataFrame:
+    mask = non_empty_mask(df)
+    header_idx = find_header_row(df, mask)
+
+    table = df.iloc[header_idx + 1:].copy()
+    table.columns = df.iloc[header_idx]
+    return clean_table(table, mask[header_idx + 1:])
+
+
+def best_of(func, df: pd.DataFrame, repeat: int) -> tuple[float, pd.DataFrame]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--cols", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_sheet(args.rows, args.cols)
+
+    legacy_time, legacy_result = best_of(legacy_clean, df, args.repeat)
+    vector_time, vector_result = best_of(vectorized_clean, df, args.repeat)
+
+    pd.testing.assert_frame_equal(legacy_result, vector_result)
+
+    print(f"sheet: {args.rows} rows x {args.cols} cols, result: {vector_result.shape}")
+    print(f"legacy:     {legacy_time * 1000:8.1f} ms")
+    print(f"vectorized: {vector_time * 1000:8.1f} ms")
+    print(f"speedup:    {legacy_time / vector_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -100,3 +100,18 @@ MEDIA_ROOT = BASE_DIR / 'media'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# --- Фоновая обработка спецификаций ---
+# thread — пул потоков внутри веб-процесса, db — отдельные воркеры `manage.py run_spec_workers`
+SPECS_JOB_BACKEND = os.getenv('SPECS_JOB_BACKEND', 'thread')
+SPECS_JOB_WORKERS = int(os.getenv('SPECS_JOB_WORKERS', '2'))
+# Как часто воркер отмечается в выполняемом запуске, сек.
+SPECS_JOB_HEARTBEAT_INTERVAL = float(os.getenv('SPECS_JOB_HEARTBEAT_INTERVAL', '30'))
+# Запуск, воркер которого не отмечался (или который ждёт) дольше стольких секунд,
+# считается брошенным умершим процессом и возвращается в очередь (jobs.recover_runs)
+SPECS_JOB_STALE_TIMEOUT = int(os.getenv('SPECS_JOB_STALE_TIMEOUT', '300'))
+# Выполнять запуск сразу в запросе (для тестов и отладки)
+SPECS_JOBS_EAGER = os.getenv('SPECS_JOBS_EAGER', 'False') == 'True'
+# Размер страницы результата по умолчанию и максимальный (API строк результата)
+SPECS_RESULTS_PAGE_SIZE = int(os.getenv('SPECS_RESULTS_PAGE_SIZE', '100'))
+SPECS_RESULTS_MAX_PAGE_SIZE = int(os.getenv('SPECS_RESULTS_MAX_PAGE_SIZE', '500'))
@@ -2,3 +2,8 @@ import os
 from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartspec.settings')
 application = get_wsgi_application()
+
+# запуски, брошенные прошлым процессом (перезапуск, убитый воркер), снова в очередь
+from specs.jobs import recover_runs_safely  # noqa: E402
+
+recover_runs_safely()
@@ -0,0 +1,331 @@
+"""
+Фоновая обработка спецификаций.
+
+Очередью служит таблица ProcessingRun: загрузка создаёт запись в статусе
+``pending``, а воркер атомарно «забирает» её (pending -> running) и
+прогоняет пайплайн. Воркеры бывают двух видов:
+
+- пул потоков внутри веб-процесса (SPECS_JOB_BACKEND = "thread");
+- отдельные процессы ``python manage.py run_spec_workers``, опрашивающие БД
+  (SPECS_JOB_BACKEND = "db").
+
+Внешний брокер не нужен.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from openai import APIConnectionError, APIError, AuthenticationError
+
+from specs.models import ProcessingRun
+from specs.results import store_rows
+from specs.services.ai.resilience import AIServiceError, CircuitOpenError, DeadlineExceededError
+from specs.services.ai.streaming import stream_rows_to
+from specs.services.ai.usage import collect_usage
+from specs.services.processing.artifacts import RunArtifacts
+from specs.services.processing.ingest import IngestedFile
+from specs.services.processing.pipeline import SourceFile, process_file, process_files
+from specs.services.processing.row_log import RowLog
+from specs.services.utils.concurrency import collect_skipped_parts
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SPECS_JOB_WORKERS,
+                thread_name_prefix="spec-job",
+            )
+        return _executor
+
+
+def submit_upload(ingested: IngestedFile) -> ProcessingRun:
+    """
+    Создаёт запуск для загруженного файла. Если такой же файл (по sha256)
+    уже успешно обрабатывался, результат переиспользуется без повторной обработки.
+    """
+    run = ProcessingRun.objects.create(
+        input_filename=ingested.original_name,
+        input_path=ingested.path,
+        file_hash=ingested.sha256,
+    )
+
+    previous = _find_previous_result(ingested.sha256) if ingested.is_duplicate else None
+    if previous is not None:
+        run.status = ProcessingRun.STATUS_DONE
+        run.result_file = previous.result_file
+        run.message = f"Файл {ingested.original_name} уже обрабатывался (запуск #{previous.id}), результат взят из него."
+        run.started_at = run.finished_at = timezone.now()
+        run.save(update_fields=["status", "result_file", "message", "started_at", "finished_at"])
+        return run
+
+    enqueue_run(run.id)
+    return run
+
+
+def submit_batch(ingested: list[IngestedFile]) -> ProcessingRun:
+    """
+    Создаёт один запуск на несколько файлов: они разбираются параллельно,
+    а позиции всех файлов консолидируются в одну таблицу с колонкой исходного файла.
+    """
+    run = ProcessingRun.objects.create(
+        input_filename=", ".join(item.original_name for item in ingested)[:255],
+        sources=[{"path": item.path, "name": item.original_name} for item in ingested],
+    )
+    enqueue_run(run.id)
+    return run
+
+
+def _find_previous_result(file_hash: str) -> Optional[ProcessingRun]:
+    candidates = (
+        ProcessingRun.objects.filter(file_hash=file_hash, status=ProcessingRun.STATUS_DONE, partial=False)
+        .exclude(result_file="")
+        .order_by("-finished_at")
+    )
+    for candidate in candidates:
+        if os.path.exists(os.path.join(settings.MEDIA_ROOT, candidate.result_file)):
+            return candidate
+    return None
+
+
+def enqueue_run(run_id: int) -> None:
+    """
+    Ставит запуск в очередь. В eager-режиме выполняет его сразу (тесты, отладка).
+    """
+    if settings.SPECS_JOBS_EAGER:
+        execute_run(run_id)
+        return
+
+    if settings.SPECS_JOB_BACKEND == "db":
+        # запись уже лежит в БД со статусом pending — её заберёт run_spec_workers
+        return
+
+    _get_executor().submit(_execute_in_thread, run_id)
+
+
+def retry_run(run_id: int) -> bool:
+    """
+    Повторно ставит в очередь упавший или частично обработанный запуск.
+    Готовые этапы и полученные ответы GPT берутся из его артефактов.
+    Возвращает False, если запуск нельзя повторить (ещё идёт или обработан полностью).
+    """
+    updated = ProcessingRun.objects.filter(
+        Q(status=ProcessingRun.STATUS_FAILED) | Q(status=ProcessingRun.STATUS_DONE, partial=True),
+        pk=run_id,
+    ).exclude(input_path="", sources=[]).update(status=ProcessingRun.STATUS_PENDING, message="", finished_at=None)
+    if updated != 1:
+        return False
+
+    enqueue_run(run_id)
+    return True
+
+
+def recover_runs() -> int:
+    """
+    Возвращает в очередь запуски, брошенные умершим процессом: running, воркер
+    которого не отмечался (heartbeat_at) дольше SPECS_JOB_STALE_TIMEOUT секунд,
+    снова становятся pending. Живой воркер отмечается каждые
+    SPECS_JOB_HEARTBEAT_INTERVAL секунд, поэтому долгий запуск не забирается повторно.
+    С бэкендом thread ожидающие запуски заново отправляются в пул этого процесса
+    (забрать запуск может только один воркер — повторная отправка безопасна).
+    Возвращает число восстановленных running-запусков.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SPECS_JOB_STALE_TIMEOUT)
+    silent = Q(heartbeat_at__isnull=True) & (Q(started_at__lt=cutoff) | Q(started_at__isnull=True))
+    stale = ProcessingRun.objects.filter(status=ProcessingRun.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | silent
+    )
+    recovered = stale.update(status=ProcessingRun.STATUS_PENDING, started_at=None, heartbeat_at=None)
+    if recovered:
+        logger.warning(f"{recovered} stale running runs returned to the queue")
+
+    if settings.SPECS_JOB_BACKEND != "db" and not settings.SPECS_JOBS_EAGER:
+        pending = ProcessingRun.objects.filter(status=ProcessingRun.STATUS_PENDING).order_by("created_at", "id")
+        for run_id in pending.values_list("id", flat=True):
+            enqueue_run(run_id)
+    return recovered
+
+
+def recover_runs_safely() -> None:
+    """
+    recover_runs при старте процесса: ошибка БД (например, миграции ещё
+    не применены) не должна мешать запуску веб-приложения.
+    """
+    try:
+        recover_runs()
+    except DatabaseError:
+        logger.exception("Could not recover stale runs at startup")
+    finally:
+        close_old_connections()
+
+
+def is_stale(run: ProcessingRun) -> bool:
+    """
+    Запуск, который давно не сдвигается с места (ждёт дольше SPECS_JOB_STALE_TIMEOUT
+    или выполняется, а воркер столько же не отмечался) — вероятно, его процесс умер.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.SPECS_JOB_STALE_TIMEOUT)
+    if run.status == ProcessingRun.STATUS_RUNNING:
+        last_seen = run.heartbeat_at or run.started_at
+        return last_seen is None or last_seen < cutoff
+    return run.status == ProcessingRun.STATUS_PENDING and run.created_at < cutoff
+
+
+def claim_run(run_id: int) -> bool:
+    """
+    Атомарно переводит запуск из pending в running.
+    Возвращает False, если запуск уже забрал другой воркер.
+    """
+    updated = ProcessingRun.objects.filter(
+        pk=run_id, status=ProcessingRun.STATUS_PENDING
+    ).update(status=ProcessingRun.STATUS_RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now())
+    return updated == 1
+
+
+def touch_run(run_id: int) -> None:
+    """
+    Отметка воркера: запуск ещё выполняется.
+    """
+    ProcessingRun.objects.filter(pk=run_id, status=ProcessingRun.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+
+
+@contextmanager
+def heartbeat(run_id: int):
+    """
+    Пока выполняется блок, фоновый поток раз в SPECS_JOB_HEARTBEAT_INTERVAL
+    секунд отмечается в запуске (touch_run).
+    """
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.SPECS_JOB_HEARTBEAT_INTERVAL):
+                try:
+                    touch_run(run_id)
+                except DatabaseError:
+                    logger.exception(f"Run {run_id}: heartbeat failed")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name=f"spec-heartbeat-{run_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def claim_next_run() -> Optional[int]:
+    """
+    Забирает самый старый ожидающий запуск. Возвращает его id или None.
+    """
+    while True:
+        run_id = (
+            ProcessingRun.objects.filter(status=ProcessingRun.STATUS_PENDING)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+        if run_id is None:
+            return None
+        if claim_run(run_id):
+            return run_id
+
+
+def execute_run(run_id: int) -> None:
+    """
+    Забирает запуск и выполняет его, если он ещё никем не взят.
+    """
+    if claim_run(run_id):
+        run_claimed(run_id)
+
+
+def run_claimed(run_id: int) -> None:
+    """
+    Выполняет уже забранный (running) запуск и сохраняет результат в БД.
+    """
+    run = ProcessingRun.objects.get(pk=run_id)
+
+    output_dir = os.path.join(settings.MEDIA_ROOT, "output")
+    if run.sources:
+        base_name = "batch"
+        label = f"Пакет из {len(run.sources)} файлов"
+    else:
+        base_name = os.path.splitext(os.path.basename(run.input_filename or run.input_path))[0]
+        label = f"Файл {run.input_filename}"
+    output_path = os.path.join(output_dir, f"{base_name}_{run.id}_consolidated.xlsx")
+
+    try:
+        # части документа, упавшие после всех повторов, пропускаются, остальное сохраняется;
+        # строки от GPT по мере получения пишутся в журнал запуска (для живого просмотра)
+        # этапы и ответы GPT сохраняются в артефакты запуска — повтор продолжит с места сбоя
+        row_log = RowLog.for_run(settings.MEDIA_ROOT, run.id)
+        artifacts = RunArtifacts.for_run(settings.MEDIA_ROOT, run.id)
+        with heartbeat(run.id), collect_skipped_parts() as skipped, stream_rows_to(row_log.append), \
+                collect_usage() as usage:
+            if run.sources:
+                sources = [SourceFile(**source) for source in run.sources]
+                df = process_files(sources, output_path, row_log=row_log, artifacts=artifacts)
+            else:
+                df = process_file(run.input_path, output_path, filename=run.input_filename, artifacts=artifacts)
+        logger.info(f"Run {run.id} GPT usage: {usage}")
+        # строки результата — в БД, для постраничного просмотра
+        store_rows(run, df)
+
+        run.status = ProcessingRun.STATUS_DONE
+        run.result_file = os.path.relpath(output_path, settings.MEDIA_ROOT).replace("\\", "/")
+        run.partial = bool(skipped)
+        if skipped:
+            logger.warning(f"Run {run.id}: {len(skipped)} parts skipped: {skipped}")
+            run.message = (
+                f"{label} обработан частично: {len(skipped)} фрагмент(ов) "
+                f"пропущено из-за ошибок AI. Повторите загрузку позже, чтобы обработать их."
+            )
+        else:
+            run.message = f"{label} успешно обработан!"
+    except Exception as e:
+        logger.exception(f"Run {run.id} failed")
+        run.status = ProcessingRun.STATUS_FAILED
+        run.message = describe_error(e)
+
+    run.finished_at = timezone.now()
+    run.save(update_fields=["status", "result_file", "message", "partial", "finished_at"])
+
+
+def describe_error(e: Exception) -> str:
+    """
+    Человекочитаемое сообщение об ошибке для пользователя.
+    """
+    if isinstance(e, CircuitOpenError):
+        return "⚠️ AI-сервис временно недоступен. Попробуйте позже."
+    if isinstance(e, DeadlineExceededError):
+        return "⚠️ AI-сервис не ответил вовремя (превышен лимит запросов или времени). Попробуйте позже."
+    if isinstance(e, AuthenticationError):
+        return "⚠️ AI-сервис отклонил API-ключ. Проверьте OPENAI_API_KEY."
+    if isinstance(e, (AIServiceError, APIConnectionError)):
+        return "⚠️ Ошибка соединения с AI. Попробуйте позже."
+    if isinstance(e, APIError):
+        return f"⚠️ AI-сервис вернул ошибку: {e}"
+    return f"Ошибка при обработке: {str(e)}"
+
+
+def _execute_in_thread(run_id: int) -> None:
+    try:
+        execute_run(run_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from specs.services.ai.prompts import SYSTEM_PROMPT
+from specs.services.ai.response_cache import get_default_cache
+
+
+class Command(BaseCommand):
+    help = "Статистика и очистка кэша ответов GPT."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Удалить все записи и счётчики")
+
+    def handle(self, *args, **options):
+        cache = get_default_cache(SYSTEM_PROMPT)
+        if cache is None:
+            raise CommandError("AI cache is disabled (AI_CACHE_ENABLED=False)")
+
+        if options["clear"]:
+            cache.clear()
+            self.stdout.write("AI cache cleared")
+            return
+
+        stats = cache.stats()
+        total = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / total * 100 if total else 0.0
+        self.stdout.write(
+            f"{cache.path}\n"
+            f"entries: {stats['entries']} ({stats['size_bytes'] / 1024:.1f} KB)\n"
+            f"hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {hit_rate:.1f}%"
+        )
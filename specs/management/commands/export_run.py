@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from specs.models import ProcessingRun
+from specs.services.exporter.table_exporter import EXPORTERS, export_dataframe
+from specs.services.processing.artifacts import STAGE_CONSOLIDATED, RunArtifacts
+
+
+class Command(BaseCommand):
+    help = "Выгрузка итоговой таблицы запуска в другой формат из его артефактов (без повторной обработки)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("run_id", type=int)
+        parser.add_argument("--format", choices=sorted(EXPORTERS), default="csv", help="Формат выгрузки")
+        parser.add_argument("--output", help="Путь к файлу (по умолчанию рядом с xlsx запуска)")
+
+    def handle(self, *args, **options):
+        run = ProcessingRun.objects.filter(pk=options["run_id"]).first()
+        if run is None:
+            raise CommandError(f"Run {options['run_id']} not found")
+
+        artifacts = RunArtifacts.for_run(settings.MEDIA_ROOT, run.id)
+        if not artifacts.completed(STAGE_CONSOLIDATED):
+            raise CommandError(f"Run {run.id} has no consolidated artifacts, process or retry it first")
+
+        output = options["output"]
+        if not output:
+            result = Path(settings.MEDIA_ROOT) / (run.result_file or f"output/run_{run.id}.xlsx")
+            output = str(result.with_suffix(f".{options['format']}"))
+
+        df = artifacts.load_frame()
+        export_dataframe(df, output, fmt=options["format"])
+        self.stdout.write(f"Run {run.id}: {len(df)} rows -> {output}")
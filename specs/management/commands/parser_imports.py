@@ -0,0 +1,60 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from specs.services.parser.registry import PARSERS
+
+# Общая часть, которая в воркере загружена до любого парсера
+BASE_MODULE = "specs.services.processing.pipeline"
+
+# Импорт модуля в чистом интерпретаторе: время (сек.) и прирост RSS (КБ; Linux — текущий
+# по /proc, прочие Unix — пиковый, Windows — не измеряется)
+_MEASURE_SCRIPT = """
+import importlib, os, sys, time
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+for module in sys.argv[1:-1]:
+    importlib.import_module(module)
+before = rss()
+started = time.perf_counter()
+importlib.import_module(sys.argv[-1])
+print(time.perf_counter() - started, rss() - before)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Время и память импорта каждого парсера: каждый модуль импортируется в отдельном "
+        "чистом интерпретаторе после общей части пайплайна."
+    )
+
+    def _measure(self, *modules: str) -> tuple[float, int]:
+        result = subprocess.run(
+            [sys.executable, "-c", _MEASURE_SCRIPT, *modules],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Import of {modules[-1]} failed:\n{result.stderr}")
+        seconds, rss_kb = result.stdout.split()
+        return float(seconds), int(rss_kb)
+
+    def handle(self, *args, **options):
+        seconds, rss_kb = self._measure(BASE_MODULE)
+        self.stdout.write(f"{'base':<8} {seconds:7.3f}s {rss_kb / 1024:7.1f} MB  {BASE_MODULE}")
+
+        for spec in PARSERS:
+            seconds, rss_kb = self._measure(BASE_MODULE, spec.module)
+            self.stdout.write(f"{spec.name:<8} {seconds:7.3f}s {rss_kb / 1024:7.1f} MB  {spec.module}")
@@ -0,0 +1,85 @@
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from specs.services.ai.batch import BatchAIHelper, BatchRunner, write_batch_input
+from specs.services.exporter.table_exporter import EXPORTERS, export_dataframe
+from specs.services.parser.registry import SUPPORTED_EXTENSIONS
+from specs.services.processing.consolidator_v2 import ConsolidatorV2
+from specs.services.processing.pipeline import parse_file
+from specs.services.utils.concurrency import collect_skipped_parts
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пакетная обработка каталога спецификаций через OpenAI Batch API: "
+        "запросы к GPT всех файлов отправляются одним заданием, результаты консолидируются в xlsx/csv/parquet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input_dir", help="Каталог с файлами спецификаций (обходится рекурсивно)")
+        parser.add_argument("--output-dir", help="Куда сохранять результаты (по умолчанию MEDIA_ROOT/output/batch)")
+        parser.add_argument("--format", choices=sorted(EXPORTERS), default="xlsx", help="Формат результатов")
+        parser.add_argument("--batch-id", help="Не отправлять новое задание, а дождаться уже отправленного")
+        parser.add_argument("--poll-interval", type=float, default=60.0, help="Пауза между опросами статуса, сек.")
+        parser.add_argument("--dry-run", action="store_true", help="Только собрать JSONL с запросами, не отправлять")
+
+    def handle(self, *args, **options):
+        input_dir = Path(options["input_dir"])
+        if not input_dir.is_dir():
+            raise CommandError(f"Directory not found: {input_dir}")
+
+        output_dir = Path(options["output_dir"] or Path(settings.MEDIA_ROOT) / "output" / "batch")
+        files = sorted(p for p in input_dir.rglob("*") if p.suffix.lower() in SUPPORTED_EXTENSIONS)
+        if not files:
+            raise CommandError(f"No supported files in {input_dir}")
+
+        # 1. сбор запросов к GPT (ответы, уже лежащие в кэше, в задание не попадают)
+        collector = BatchAIHelper()
+        if not options["batch_id"]:
+            for path in files:
+                self._parse(path, collector)
+            self.stdout.write(f"{len(files)} files, {len(collector.requests)} GPT requests collected")
+
+        runner = BatchRunner(collector.client, poll_interval=options["poll_interval"])
+        answers = {}
+        if options["batch_id"] or collector.requests:
+            batch_id = options["batch_id"]
+            if not batch_id:
+                input_path = write_batch_input(collector.requests, output_dir / "batch_input.jsonl")
+                if options["dry_run"]:
+                    self.stdout.write(f"Batch input written to {input_path}")
+                    return
+                batch_id = runner.submit(input_path)
+                self.stdout.write(f"Batch {batch_id} submitted, waiting for results")
+
+            answers = runner.fetch_answers(runner.wait(batch_id))
+            self.stdout.write(f"{len(answers)} batch results received")
+
+        # 2. повторный прогон парсеров с готовыми ответами, консолидация и сохранение
+        answering = BatchAIHelper(answers=answers, client=collector.client)
+        for idx, path in enumerate(files, start=1):
+            with collect_skipped_parts() as skipped:
+                csv_tables = [csv_text for csv_text in self._parse(path, answering) if csv_text]
+            if not csv_tables:
+                self.stderr.write(f"{path}: no tables")
+                continue
+
+            df = ConsolidatorV2().merge_and_consolidate(csv_tables)
+            # номер файла в каталоге: одноимённые файлы из разных папок не перетирают друг друга
+            output_path = output_dir / f"{path.stem}_{idx}_consolidated.{options['format']}"
+            export_dataframe(df, str(output_path), fmt=options["format"])
+
+            note = f", {len(skipped)} parts skipped" if skipped else ""
+            self.stdout.write(f"{path}: {len(df)} rows -> {output_path}{note}")
+
+    def _parse(self, path: Path, ai_helper: BatchAIHelper) -> list[str]:
+        try:
+            return parse_file(path.read_bytes(), path.name, ai_helper)
+        except Exception as e:
+            logger.warning(f"{path}: parsing failed: {e}")
+            return []
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from specs.jobs import claim_next_run, recover_runs, run_claimed
+from specs.services.ai.client_registry import check_health
+
+# Как часто простаивающий воркер ищет брошенные запуски, сек.
+RECOVER_INTERVAL = 60.0
+
+
+class Command(BaseCommand):
+    help = "Запускает пул воркеров, которые забирают ожидающие ProcessingRun из БД и обрабатывают их."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Количество потоков-воркеров")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Пауза между опросами БД, сек.")
+        parser.add_argument("--once", action="store_true", help="Обработать очередь и выйти")
+
+    def handle(self, *args, **options):
+        workers = [
+            threading.Thread(
+                target=self._worker_loop,
+                args=(options["poll_interval"], options["once"]),
+                name=f"spec-worker-{i}",
+                daemon=True,
+            )
+            for i in range(options["workers"])
+        ]
+        self.stdout.write(f"Starting {len(workers)} spec workers")
+        recovered = recover_runs()
+        if recovered:
+            self.stdout.write(f"{recovered} stale runs returned to the queue")
+        if not check_health():
+            self.stderr.write("OpenAI API is unreachable, runs needing GPT will fail until it recovers")
+
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping spec workers")
+
+    def _worker_loop(self, poll_interval: float, once: bool):
+        last_recover = time.monotonic()
+        while True:
+            try:
+                run_id = claim_next_run()
+                if run_id is None:
+                    if once:
+                        return
+                    if time.monotonic() - last_recover >= RECOVER_INTERVAL:
+                        recover_runs()
+                        last_recover = time.monotonic()
+                    time.sleep(poll_interval)
+                    continue
+
+                self.stdout.write(f"Processing run {run_id}")
+                run_claimed(run_id)
+            finally:
+                close_old_connections()
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.24 on 2026-10-18 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('input_filename', models.CharField(blank=True, max_length=255, null=True)),
+                ('input_path', models.CharField(blank=True, default='', max_length=500)),
+                ('status', models.CharField(default='pending', max_length=50)),
+                ('message', models.TextField(blank=True, default='')),
+                ('result_file', models.CharField(blank=True, default='', max_length=500)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
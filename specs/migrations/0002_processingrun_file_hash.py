@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingrun',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0002_processingrun_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingrun',
+            name='partial',
+            field=models.BooleanField(default=False),
+        ),
+    ]
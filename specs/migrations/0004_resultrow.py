@@ -0,0 +1,35 @@
+# Generated by Django 4.2.24 on 2026-10-18 20:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0003_processingrun_partial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('designation', models.TextField(blank=True, default='')),
+                ('name', models.TextField(blank=True, default='')),
+                ('unit', models.CharField(blank=True, default='', max_length=100)),
+                ('quantity', models.CharField(blank=True, default='', max_length=100)),
+                ('quantity_value', models.FloatField(blank=True, null=True)),
+                ('tech_spec', models.TextField(blank=True, default='')),
+                ('merged_from', models.TextField(blank=True, default='')),
+                ('designation_key', models.TextField(blank=True, default='')),
+                ('name_key', models.TextField(blank=True, default='')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='specs.processingrun')),
+            ],
+            options={
+                'ordering': ['run', 'position'],
+                'indexes': [models.Index(fields=['run', 'position'], name='specs_resul_run_id_303312_idx')],
+            },
+        ),
+    ]
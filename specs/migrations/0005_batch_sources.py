@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0004_resultrow'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingrun',
+            name='sources',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='resultrow',
+            name='source',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
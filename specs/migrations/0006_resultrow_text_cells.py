@@ -0,0 +1,23 @@
+# Generated by Django 4.2.24 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0005_batch_sources'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='resultrow',
+            name='quantity',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='resultrow',
+            name='unit',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
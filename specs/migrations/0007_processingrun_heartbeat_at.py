@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specs', '0006_resultrow_text_cells'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processingrun',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
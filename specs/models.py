@@ -3,9 +3,59 @@ from django.db import models
 # Add models here if you want to persist spec data, processing runs, etc.
 
 class ProcessingRun(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
     created_at = models.DateTimeField(auto_now_add=True)
     input_filename = models.CharField(max_length=255, blank=True, null=True)
-    status = models.CharField(max_length=50, default='pending')
+    input_path = models.CharField(max_length=500, blank=True, default='')
+    file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=50, default=STATUS_PENDING)
+    message = models.TextField(blank=True, default='')
+    # часть документа пропущена из-за ошибок AI — такой результат не переиспользуется
+    partial = models.BooleanField(default=False)
+    result_file = models.CharField(max_length=500, blank=True, default='')
+    # пакетный запуск: [{"path": ..., "name": ...}] по файлу; у обычного запуска пусто
+    sources = models.JSONField(default=list, blank=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # воркер обновляет отметку, пока выполняет запуск: давно молчащий running брошен
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
 
     def __str__(self):
         return f"Run {self.id} - {self.status}"
+
+
+class ResultRow(models.Model):
+    """
+    Строка итоговой таблицы запуска — для постраничной выдачи результата.
+    """
+    run = models.ForeignKey(ProcessingRun, on_delete=models.CASCADE, related_name='rows')
+    position = models.PositiveIntegerField()
+    designation = models.TextField(blank=True, default='')
+    name = models.TextField(blank=True, default='')
+    # ячейки от GPT бывают любой длины: TextField, иначе PostgreSQL отвергнет строку
+    unit = models.TextField(blank=True, default='')
+    quantity = models.TextField(blank=True, default='')
+    # количество числом — для сортировки; None, если оно не числовое
+    quantity_value = models.FloatField(blank=True, null=True)
+    tech_spec = models.TextField(blank=True, default='')
+    merged_from = models.TextField(blank=True, default='')
+    source = models.TextField(blank=True, default='')
+    # нормализованные (регистр, ё/е, пробелы) копии для поиска и сортировки:
+    # LIKE в SQLite не сравнивает кириллицу без учёта регистра
+    designation_key = models.TextField(blank=True, default='')
+    name_key = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['run', 'position']
+        indexes = [models.Index(fields=['run', 'position'])]
+
+    def __str__(self):
+        return f"Run {self.run_id} row {self.position}"
@@ -0,0 +1,165 @@
+"""
+Итоговая таблица запуска в БД (ResultRow) и её постраничная выдача.
+
+Таблица сохраняется построчно после обработки; страница результата
+отдаётся JSON-ом ограниченного размера, с сортировкой и фильтром по
+обозначению и наименованию — вместо HTML всей таблицы.
+"""
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import F, Q
+
+from specs.models import ProcessingRun, ResultRow
+from specs.services.processing.consolidator_v2 import (
+    FUZZY_AUDIT_COLUMN,
+    SOURCE_COLUMN,
+    ConsolidatorV2,
+    parse_quantities,
+    text_key,
+)
+
+logger = logging.getLogger(__name__)
+
+# колонка итоговой таблицы -> поле ResultRow
+COLUMN_FIELDS = {
+    ConsolidatorV2.HEADERS["designation"]: "designation",
+    ConsolidatorV2.HEADERS["name"]: "name",
+    ConsolidatorV2.HEADERS["unit"]: "unit",
+    ConsolidatorV2.HEADERS["quantity"]: "quantity",
+    ConsolidatorV2.HEADERS["tech_spec"]: "tech_spec",
+    FUZZY_AUDIT_COLUMN: "merged_from",
+    SOURCE_COLUMN: "source",
+}
+# колонки, которые показываются, только если они заполнены хотя бы у одной строки
+OPTIONAL_FIELDS = ("merged_from", "source")
+SORT_FIELDS = {
+    "position": "position",
+    "designation": "designation_key",
+    "name": "name_key",
+    "unit": "unit",
+    "quantity": "quantity_value",
+    "tech_spec": "tech_spec",
+}
+# длинные ячейки обрезаются, чтобы размер страницы не зависел от содержимого
+MAX_CELL_LENGTH = 2000
+BULK_BATCH_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class RowsPage:
+    count: int
+    page: int
+    num_pages: int
+    page_size: int
+    columns: list[str]
+    rows: list[list[str]]
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "page": self.page,
+            "num_pages": self.num_pages,
+            "page_size": self.page_size,
+            "columns": self.columns,
+            "rows": self.rows,
+        }
+
+
+@transaction.atomic
+def store_rows(run: ProcessingRun, df: pd.DataFrame) -> int:
+    """
+    Сохраняет итоговую таблицу запуска (прежние строки запуска заменяются).
+    Колонок, которых нет в таблице, строки получают пустыми.
+    """
+    ResultRow.objects.filter(run=run).delete()
+    if df is None or df.empty:
+        return 0
+
+    table = df.reindex(columns=list(COLUMN_FIELDS), fill_value="").fillna("").astype(str)
+    table.columns = list(COLUMN_FIELDS.values())
+    table["designation_key"] = table["designation"].map(text_key)
+    table["name_key"] = table["name"].map(text_key)
+    quantity_values = [None if pd.isna(v) else float(v) for v in parse_quantities(table["quantity"])]
+
+    rows = (
+        ResultRow(run=run, position=position, quantity_value=quantity_value, **values)
+        for position, (values, quantity_value) in enumerate(zip(table.to_dict("records"), quantity_values))
+    )
+    ResultRow.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+    return len(table)
+
+
+def ensure_rows(run: ProcessingRun) -> None:
+    """
+    Запускам, строки которых не сохранялись (результат взят у прежнего
+    запуска или получен до появления ResultRow), строки загружаются из xlsx.
+    """
+    if not run.result_file or ResultRow.objects.filter(run=run).exists():
+        return
+
+    path = os.path.join(settings.MEDIA_ROOT, run.result_file)
+    if not os.path.exists(path):
+        return
+    count = store_rows(run, pd.read_excel(path, dtype=str, keep_default_na=False))
+    logger.info(f"Run {run.id}: {count} result rows loaded from {run.result_file}")
+
+
+def _clip(value: str) -> str:
+    return value if len(value) <= MAX_CELL_LENGTH else value[:MAX_CELL_LENGTH] + "…"
+
+
+def query_rows(
+    run: ProcessingRun,
+    page: int = 1,
+    page_size: Optional[int] = None,
+    sort: str = "position",
+    query: str = "",
+    name: str = "",
+    designation: str = "",
+) -> RowsPage:
+    """
+    Страница строк результата.
+    sort — поле из SORT_FIELDS, с «-» в начале — по убыванию;
+    query ищет подстроку в обозначении или наименовании,
+    name / designation — фильтры по соответствующим колонкам.
+    """
+    page_size = min(max(1, page_size or settings.SPECS_RESULTS_PAGE_SIZE), settings.SPECS_RESULTS_MAX_PAGE_SIZE)
+
+    rows = ResultRow.objects.filter(run=run)
+    if query:
+        rows = rows.filter(Q(name_key__contains=text_key(query)) | Q(designation_key__contains=text_key(query)))
+    if name:
+        rows = rows.filter(name_key__contains=text_key(name))
+    if designation:
+        rows = rows.filter(designation_key__contains=text_key(designation))
+
+    descending = sort.startswith("-")
+    field = SORT_FIELDS.get(sort.lstrip("-"), "position")
+    order = F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+    rows = rows.order_by(order, "position")
+
+    fields = list(COLUMN_FIELDS.values())
+    paginator = Paginator(rows.values_list(*fields), page_size)
+    current = paginator.get_page(page)
+
+    # аудит нечёткого объединения и исходный файл показываются, только если заполнены
+    shown = [
+        idx for idx, field in enumerate(fields)
+        if field not in OPTIONAL_FIELDS or ResultRow.objects.filter(run=run).exclude(**{field: ""}).exists()
+    ]
+    columns = list(COLUMN_FIELDS)
+    return RowsPage(
+        count=paginator.count,
+        page=current.number,
+        num_pages=paginator.num_pages,
+        page_size=page_size,
+        columns=[columns[idx] for idx in shown],
+        rows=[[_clip(row[idx]) for idx in shown] for row in current.object_list],
+    )
@@ -1,22 +1,64 @@
 import base64
+import hashlib
+import logging
 import os
+import threading
+from typing import Optional
 
-import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
 
-from specs.services.ai.prompts import SYSTEM_PROMPT
+from specs.services.ai.client_registry import OPENAI_TIMEOUT, get_client
+from specs.services.ai.prompt_builder import build_table_prompt, expand_result
+from specs.services.ai.prompts import STRUCTURED_OUTPUT_NOTE, SYSTEM_PROMPT
+from specs.services.ai.resilience import ResilientCaller, get_default_caller
+from specs.services.ai.streaming import AI_STREAMING_ENABLED, CsvRowAssembler, emit_rows, get_row_sink, parse_rows
+from specs.services.ai.response_cache import ResponseCache, get_default_cache, make_response_key
+from specs.services.ai.usage import record_usage
+from specs.services.processing.artifacts import get_response_store
+from specs.services.processing.spec_table import NormalizedTable, SpecTable
+from specs.services.utils.image_prep import prepare_image
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Ответ GPT — JSON по схеме SpecTable вместо CSV-текста
+AI_STRUCTURED_OUTPUT = os.getenv("AI_STRUCTURED_OUTPUT", "False") == "True"
+# Отправлять повторяющиеся строки таблицы один раз (с последующим размножением ответа)
+AI_DEDUPE_ROWS = os.getenv("AI_DEDUPE_ROWS", "True") == "True"
+
+# Одинаковый ключ для всех запросов с этим системным промптом — провайдер
+# направляет их туда, где префикс промпта уже закэширован
+SYSTEM_PROMPT_HASH = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+PROMPT_CACHE_KEY = "smartspec-" + SYSTEM_PROMPT_HASH[:16]
+
+# Значение cache по умолчанию — общий кэш процесса; явный cache=None отключает кэш
+_DEFAULT_CACHE = object()
+
+_helpers: dict[str, "AIHelper"] = {}
+_helpers_lock = threading.Lock()
+
 
 class AIHelper:
-    def __init__(self, model: str = "gpt-5-mini"):
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY не найден. Проверьте .env файл.")
-        self.client = OpenAI(api_key=api_key)
+    # True — ответы приходят позже (BatchAIHelper): пустой результат ничего не значит,
+    # а каждый запрос должен быть одинаковым при сборе и при разборе ответов
+    deferred = False
+
+    def __init__(
+        self,
+        model: str = "gpt-5-mini",
+        cache: Optional[ResponseCache] = _DEFAULT_CACHE,
+        client: Optional[OpenAI] = None,
+        resilience: Optional[ResilientCaller] = None,
+        structured: Optional[bool] = None,
+    ):
+        # клиент с пулом соединений общий для процесса (client_registry)
+        self.client = client or get_client()
+        # повторы, лимит запросов и circuit breaker тоже общие для процесса
+        self.resilience = resilience or get_default_caller()
         self.model = model
+        self.structured = AI_STRUCTURED_OUTPUT if structured is None else structured
         self.system_prompt = {
             "role": "system",
             "content": [
@@ -26,117 +68,193 @@ class AIHelper:
                 }
             ]
         }
+        self.cache = get_default_cache(SYSTEM_PROMPT) if cache is _DEFAULT_CACHE else cache
 
-    def extract_table_from_image(self, image_path: str) -> str:
+    def _create_response(self, content: list[dict], cache_kind: str, cache_payload: str | bytes) -> NormalizedTable:
         """
-        Отправляет изображение в GPT (Responses API)
-        и получает табличные данные в CSV в нужном шаблоне
+        Отправляет запрос в Responses API (системный промпт + content пользователя).
+        Сначала ищет ответ в артефактах текущего запуска, затем в кэше (по хэшу входа);
+        новый ответ сохраняет и туда, и туда.
+        Запрос идёт через ResilientCaller: временные ошибки повторяются,
+        при недоступности API вызов быстро падает с AIServiceError.
+        В режиме structured возвращает SpecTable, иначе — CSV-текст.
         """
-        with open(image_path, "rb") as img_file:
-            image_b64 = base64.b64encode(img_file.read()).decode("utf-8")
+        if self.structured:
+            cache_kind = f"{cache_kind}:json"
 
-        response = self.client.responses.create(
-            model=self.model,
-            input=[
+        # ответы, уже полученные этим запуском (артефакты запуска, см. record_responses_to)
+        run_store = get_response_store()
+        run_key = None
+        if run_store is not None:
+            run_key = make_response_key(self.model, SYSTEM_PROMPT_HASH, cache_kind, cache_payload)
+            stored = run_store.get_response(run_key)
+            if stored is not None:
+                logger.info(f"AI response reused from run artifacts ({cache_kind})")
+                return self._to_result(stored, from_cache=True)
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, cache_kind, cache_payload)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"AI cache hit ({cache_kind})")
+                if run_key is not None:
+                    run_store.put_response(run_key, cached)
+                return self._to_result(cached, from_cache=True)
+
+        output_text = self._send(content, cache_kind)
+        result = self._to_result(output_text, from_cache=False)
+
+        if output_text:
+            if cache_key is not None:
+                self.cache.set(cache_key, output_text)
+            if run_key is not None:
+                run_store.put_response(run_key, output_text)
+        return result
+
+    def _to_result(self, output_text: str, from_cache: bool) -> NormalizedTable:
+        """
+        CSV-ответ отдаётся как есть (строки в приёмник уже ушли при потоковом чтении),
+        JSON-ответ проверяется по схеме и становится SpecTable без разбора CSV.
+        """
+        if not self.structured:
+            if from_cache:
+                emit_rows(parse_rows(output_text))
+            return output_text
+
+        table = SpecTable.model_validate_json(output_text) if output_text else SpecTable(rows=[])
+        emit_rows(table.as_rows())
+        return table
+
+    def _request_body(self, content: list[dict]) -> dict:
+        # неизменная часть (системный промпт) всегда идёт первой, данные — последними
+        body = {
+            "model": self.model,
+            "prompt_cache_key": PROMPT_CACHE_KEY,
+            "input": [
                 self.system_prompt,
                 {
                     "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": (
-                                "Распознай таблицу с этого изображения и приведи её к указанному шаблону."
-                            )
-                        },
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/png;base64,{image_b64}"
-                        }
-                    ]
+                    "content": content
                 }
-            ]
+            ],
+        }
+        if self.structured:
+            body["input"][1]["content"] = content + [{"type": "input_text", "text": STRUCTURED_OUTPUT_NOTE}]
+            body["text"] = {"format": SpecTable.response_format()}
+        return body
+
+    def _send(self, content: list[dict], kind: str) -> str:
+        """
+        Сам запрос к API (без кэша). Переопределяется в BatchAIHelper.
+        kind — вид запроса (text, image, ...) для учёта расхода токенов.
+        Если у текущего запуска есть приёмник строк (streaming.stream_rows_to),
+        ответ читается потоком и готовые строки отдаются сразу.
+        """
+        body = self._request_body(content)
+        if AI_STREAMING_ENABLED and not self.structured and get_row_sink() is not None:
+            return self.resilience.call(lambda timeout: self._stream(body, min(timeout, OPENAI_TIMEOUT), kind))
+
+        response = self.resilience.call(
+            lambda timeout: self.client.responses.create(**body, timeout=min(timeout, OPENAI_TIMEOUT))
         )
+        record_usage(response.usage, kind)
         return response.output_text
 
-    def normalize_table_from_text(self, table: list[list[str]]) -> str:
+    def _stream(self, body: dict, timeout: float, kind: str) -> str:
+        """
+        Читает ответ как поток событий. При повторе после обрыва строки
+        могут прийти повторно — живой просмотр это допускает, итоговый
+        результат собирается из полного текста.
+        """
+        assembler = CsvRowAssembler()
+        chunks = []
+        with self.client.responses.create(**body, stream=True, timeout=timeout) as stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    chunks.append(event.delta)
+                    emit_rows(assembler.feed(event.delta))
+                elif event.type == "response.completed":
+                    record_usage(event.response.usage, kind)
+        emit_rows(assembler.close())
+        return "".join(chunks)
+
+    def extract_table_from_image(self, image_path: str) -> NormalizedTable:
+        """
+        Отправляет изображение в GPT (Responses API)
+        и получает табличные данные в CSV в нужном шаблоне
+        """
+        with open(image_path, "rb") as img_file:
+            image = prepare_image(img_file.read())
+
+        return self.extract_table_from_image_b64(image.b64, mime_type=image.mime_type)
+
+    def normalize_table_from_text(self, table: list[list[str]]) -> NormalizedTable:
         """
         Отправляет текстовую таблицу в GPT для нормализации к шаблону (CSV).
+        Таблица сжимается (prompt_builder): пустые ячейки и колонки убираются,
+        повторяющиеся строки отправляются один раз, а в ответе размножаются обратно.
+        Для отложенных ответов (deferred) дубли не сжимаются: повторный запрос
+        без сжатия при сборе не попал бы в задание.
         """
+        prompt = build_table_prompt(table, dedupe=AI_DEDUPE_ROWS and not self.deferred)
+        result = self._normalize_prompt_text(prompt.text)
+        if not prompt.has_duplicates or not result:
+            return result
 
-        try:
-            r = httpx.get(
-                "https://api.openai.com/v1/models",
-                headers={"Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}"},
-                timeout=10
-            )
-            print("OpenAI connectivity test:", r.status_code, r.text[:100])
-        except Exception as e:
-            print("Connectivity error:", e)
+        expanded = expand_result(result, prompt)
+        if expanded is not None:
+            return expanded
 
-        table_text = "\n".join([";".join(row) for row in table])
+        # строки ответа не сопоставляются с входными — повторяем запрос без сжатия дублей
+        logger.info("Deduplicated table could not be re-expanded, resending it in full")
+        return self._normalize_prompt_text(build_table_prompt(table, dedupe=False).text)
 
-        response = self.client.responses.create(
-            model=self.model,
-            input=[
-                self.system_prompt,
+    def _normalize_prompt_text(self, table_text: str) -> NormalizedTable:
+        return self._create_response(
+            content=[
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": f"Приведи данные к указанному шаблону. \nДанные: {table_text}"
-                        }
-                    ]
+                    "type": "input_text",
+                    "text": f"Приведи данные к указанному шаблону.\nДанные:\n{table_text}"
                 }
-            ]
+            ],
+            cache_kind="text",
+            cache_payload=table_text,
         )
-        return response.output_text
 
-    def normalize_table_from_csv(self, csv_text: str) -> str:
+    def normalize_table_from_csv(self, csv_text: str) -> NormalizedTable:
         """
         Принимает CSV-текст (разделители ; или , неважно),
         отправляет в GPT для приведения к шаблону.
         Возвращает CSV с фиксированными колонками:
         №;Обозначение;Наименование;Ед. изм.;Требуемое кол-во, в ед. изм.;Техническое задание
         """
-        response = self.client.responses.create(
-            model=self.model,
-            input=[
-                self.system_prompt,
+        return self._create_response(
+            content=[
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": f"Вот сырой CSV: {csv_text}. Приведи данные к указанному шаблону."
-                        }
-                    ]
+                    "type": "input_text",
+                    "text": f"Приведи данные к указанному шаблону.\nСырой CSV:\n{csv_text}"
                 }
-            ]
+            ],
+            cache_kind="csv",
+            cache_payload=csv_text,
         )
-        return response.output_text
 
-    def extract_table_from_image_b64(self, image_b64: str) -> str:
+    def extract_table_from_image_b64(self, image_b64: str, mime_type: str = "image/png") -> NormalizedTable:
         """
-        Принимает чистую base64-строку (без 'data:image') и отправляет в GPT.
+        Принимает чистую base64-строку (без 'data:image') и её MIME-тип, отправляет в GPT.
         Возвращает CSV в нужном шаблоне.
         """
-        response = self.client.responses.create(
-            model=self.model,
-            input=[
-                self.system_prompt,
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text",
-                         "text": "Распознай таблицу с этого изображения и приведи её к указанному шаблону."},
-                        {"type": "input_image",
-                         "image_url": f"data:image/png;base64,{image_b64}"}
-                    ]
-                }
-            ]
+        return self._create_response(
+            content=[
+                {"type": "input_text",
+                 "text": "Распознай таблицу с этого изображения и приведи её к указанному шаблону."},
+                {"type": "input_image",
+                 "image_url": f"data:{mime_type};base64,{image_b64}"}
+            ],
+            cache_kind="image",
+            cache_payload=base64.b64decode(image_b64),
         )
-        return response.output_text
 
     def send_image_and_get_text(self, prompt: str, image_b64: str) -> str:
         """
@@ -160,3 +278,15 @@ class AIHelper:
             ]
         )
         return response.choices[0].message.content.strip()
+
+
+def get_ai_helper(model: str = "gpt-5-mini") -> AIHelper:
+    """
+    Общий для процесса AIHelper (один на модель): парсеры получают его
+    вместо того, чтобы создавать свой клиент на каждый файл.
+    """
+    with _helpers_lock:
+        helper = _helpers.get(model)
+        if helper is None:
+            helper = _helpers[model] = AIHelper(model=model)
+        return helper
@@ -0,0 +1,146 @@
+"""
+Пакетная нормализация через OpenAI Batch API (дешевле и без лимитов
+интерактивных запросов, но ответ приходит в течение часов).
+
+Документы прогоняются через обычные парсеры дважды:
+1) BatchAIHelper в режиме сбора запоминает все запросы к GPT вместо их отправки;
+2) запросы уходят одним Batch-заданием (JSONL);
+3) BatchAIHelper с полученными ответами отдаёт их парсерам, и дальше
+   всё идёт как обычно — консолидация и сохранение результата.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from openai import OpenAI
+
+from specs.services.ai.ai_helper import AIHelper
+from specs.services.ai.resilience import AIServiceError
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/responses"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchAIHelper(AIHelper):
+    """
+    AIHelper, который не ходит в API сам.
+    answers=None — режим сбора: запросы копятся в self.requests, парсеру отдаётся "".
+    answers={custom_id: text} — режим ответов: текст берётся из результатов Batch;
+    для запроса без ответа выбрасывается AIServiceError (часть документа будет пропущена).
+    В обоих режимах парсеры должны пройти одним путём (deferred): дубли строк
+    не сжимаются, а PDF в режиме auto не уходит в разбор текста из-за пустых ответов.
+    """
+
+    deferred = True
+
+    def __init__(self, answers: Optional[dict[str, str]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.answers = answers
+        self.requests: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def request_id(body: dict) -> str:
+        payload = json.dumps(body, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _send(self, content: list[dict], kind: str) -> str:
+        body = self._request_body(content)
+        custom_id = self.request_id(body)
+
+        if self.answers is None:
+            with self._lock:
+                self.requests[custom_id] = body
+            return ""
+
+        if custom_id not in self.answers:
+            raise AIServiceError(f"No batch result for request {custom_id[:12]}")
+        return self.answers[custom_id]
+
+
+def write_batch_input(requests: dict[str, dict], path: Path) -> Path:
+    """
+    Пишет запросы в JSONL формата Batch API (одна строка — один запрос).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests.items():
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    return path
+
+
+def _output_text(body: dict) -> str:
+    # аналог Response.output_text для «сырого» JSON ответа
+    return "".join(
+        part.get("text", "")
+        for item in body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
+    )
+
+
+def parse_batch_output(lines: Iterable[str]) -> dict[str, str]:
+    """
+    Разбирает JSONL с результатами Batch: {custom_id: текст ответа}.
+    Неуспешные запросы логируются и в результат не попадают.
+    """
+    answers = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            logger.warning(f"Batch request {item.get('custom_id')} failed: {item.get('error') or response}")
+            continue
+        answers[item["custom_id"]] = _output_text(response.get("body") or {})
+    return answers
+
+
+class BatchRunner:
+    """
+    Отправка JSONL в Batch API, ожидание и загрузка результатов.
+    """
+
+    def __init__(self, client: OpenAI, poll_interval: float = 60.0, completion_window: str = "24h"):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    def submit(self, input_path: Path) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        logger.info(f"Batch {batch.id} submitted from {input_path}")
+        return batch.id
+
+    def wait(self, batch_id: str):
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in BATCH_FINAL_STATUSES:
+                logger.info(f"Batch {batch_id} finished with status {batch.status}")
+                return batch
+            logger.info(f"Batch {batch_id}: {batch.status}, waiting {self.poll_interval:.0f}s")
+            time.sleep(self.poll_interval)
+
+    def fetch_answers(self, batch) -> dict[str, str]:
+        if batch.status != "completed" or not batch.output_file_id:
+            raise AIServiceError(f"Batch {batch.id} finished with status {batch.status}")
+
+        answers = parse_batch_output(self.client.files.content(batch.output_file_id).text.splitlines())
+        if batch.error_file_id:
+            # в файле ошибок только неуспешные запросы — разбираем ради логов
+            parse_batch_output(self.client.files.content(batch.error_file_id).text.splitlines())
+        return answers
@@ -0,0 +1,45 @@
+import math
+import os
+
+import pandas as pd
+
+# Бюджет входных токенов на один запрос нормализации
+DEFAULT_CHUNK_MAX_TOKENS = int(os.getenv("AI_CHUNK_MAX_TOKENS", "4000"))
+
+# Грубая оценка: для смешанного русского/латинского текста ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Приблизительное число токенов в тексте (без вызова токенизатора).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_dataframe_by_token_budget(df: pd.DataFrame, max_tokens: int = DEFAULT_CHUNK_MAX_TOKENS) -> list[pd.DataFrame]:
+    """
+    Режет таблицу на пачки строк так, чтобы CSV каждой пачки вместе
+    с заголовком укладывался в max_tokens. Строка, которая одна превышает
+    бюджет, попадает в отдельную пачку. Порядок строк сохраняется.
+    """
+    if df.empty:
+        return [df]
+
+    header_tokens = estimate_tokens(";".join(map(str, df.columns)))
+
+    # длина строки в CSV: сумма длин ячеек + разделители + перевод строки
+    row_chars = df.astype(str).apply(lambda col: col.str.len()).sum(axis=1) + len(df.columns)
+    row_tokens = (row_chars / CHARS_PER_TOKEN).to_numpy()
+
+    budget = max(max_tokens - header_tokens, 1)
+    batches = []
+    start = 0
+    used = 0.0
+    for i, tokens in enumerate(row_tokens):
+        if i > start and used + tokens > budget:
+            batches.append(df.iloc[start:i])
+            start, used = i, 0.0
+        used += tokens
+    batches.append(df.iloc[start:])
+    return batches
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+# Повторы делает ResilientCaller (resilience.py), встроенные повторы SDK по умолчанию выключены
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+# Сколько секунд считать результат проверки доступности API актуальным
+OPENAI_HEALTH_TTL = float(os.getenv("OPENAI_HEALTH_TTL", "300"))
+
+_clients: dict[tuple[str, Optional[str]], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+_health: dict[tuple[str, Optional[str]], tuple[float, bool]] = {}
+_health_lock = threading.Lock()
+
+
+def _resolve_api_key(api_key: Optional[str]) -> str:
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY не найден. Проверьте .env файл.")
+    return api_key
+
+
+def _build_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    timeout = httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    http_client = httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=OPENAI_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def get_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> OpenAI:
+    """
+    Общий для процесса клиент OpenAI (один на ключ и base_url).
+    Клиент держит пул keep-alive соединений, поэтому TLS-рукопожатие
+    делается один раз, а не на каждый парсер. Клиент потокобезопасен.
+    """
+    key = (_resolve_api_key(api_key), base_url or os.getenv("OPENAI_BASE_URL"))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _build_client(*key)
+        return client
+
+
+def check_health(api_key: Optional[str] = None, force: bool = False) -> bool:
+    """
+    Проверяет доступность API запросом списка моделей.
+    Результат кэшируется на OPENAI_HEALTH_TTL секунд, так что проверку
+    можно вызывать часто — в сеть уходит не больше одного запроса за период.
+    """
+    client = get_client(api_key)
+    key = (client.api_key, str(client.base_url))
+    now = time.monotonic()
+
+    with _health_lock:
+        cached = _health.get(key)
+        if cached is not None and not force and now - cached[0] < OPENAI_HEALTH_TTL:
+            return cached[1]
+
+    try:
+        client.with_options(timeout=OPENAI_CONNECT_TIMEOUT, max_retries=0).models.list()
+        healthy = True
+    except Exception as e:
+        logger.warning(f"OpenAI API health check failed: {e}")
+        healthy = False
+
+    with _health_lock:
+        _health[key] = (now, healthy)
+    return healthy
+
+
+def reset_clients():
+    """
+    Закрывает и забывает все клиенты (например, после fork или в тестах).
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+    with _health_lock:
+        _health.clear()
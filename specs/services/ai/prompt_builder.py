@@ -0,0 +1,136 @@
+"""
+Компактное представление таблицы для запроса к GPT.
+
+- пробелы внутри ячеек схлопываются, пустые строки и колонки выбрасываются;
+- одинаковые строки отправляются один раз, после ответа размножаются обратно
+  (expand_result), чтобы количество позиций в результате не изменилось;
+  строка ответа находится по наименованию, неоднозначное совпадение — отказ.
+  Схлопываются только самостоятельные позиции: строка с количеством, за которой
+  не идут строки-продолжения (их модель приклеивает к позиции выше, и ответ
+  перестаёт соответствовать входу строка в строку).
+"""
+import csv
+import io
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from specs.services.ai.streaming import parse_rows
+from specs.services.processing.spec_table import NormalizedTable, SpecRow, SpecTable, rows_to_csv
+
+logger = logging.getLogger(__name__)
+
+# Ячейка-количество: число, возможно с пробелами-разделителями тысяч и дробной частью
+_QUANTITY_CELL_RE = re.compile(r"^\d[\d\s]*(?:[.,]\d+)?$")
+
+
+@dataclass(frozen=True)
+class TablePrompt:
+    text: str
+    # кратность каждой отправленной строки (в порядке отправки)
+    counts: tuple[int, ...]
+    # сами отправленные строки — по ним expand_result находит строки ответа
+    rows: tuple[tuple[str, ...], ...] = ()
+
+    @property
+    def has_duplicates(self) -> bool:
+        return any(count > 1 for count in self.counts)
+
+
+def compact_rows(rows: list[list]) -> list[list[str]]:
+    """
+    Схлопывает пробелы в ячейках, убирает пустые строки, колонки,
+    пустые во всех строках, и пустые ячейки в конце строк.
+    """
+    cells = [[" ".join(str(cell).split()) if cell is not None else "" for cell in row] for row in rows]
+    cells = [row for row in cells if any(row)]
+    if not cells:
+        return []
+
+    width = max(map(len, cells))
+    keep = [j for j in range(width) if any(j < len(row) and row[j] for row in cells)]
+
+    compact = []
+    for row in cells:
+        row = [row[j] if j < len(row) else "" for j in keep]
+        while row and not row[-1]:
+            row.pop()
+        compact.append(row)
+    return compact
+
+
+def build_table_prompt(rows: list[list], dedupe: bool = True) -> TablePrompt:
+    """
+    Текст таблицы для запроса (CSV с разделителем `;`: ячейка с `;` или кавычкой
+    берётся в кавычки и не сдвигает колонки).
+    При dedupe повторяющиеся самостоятельные позиции остаются в одном экземпляре
+    на месте первого появления; строки-продолжения и позиции с ними отправляются как есть.
+    """
+    compact = compact_rows(rows)
+
+    if not dedupe:
+        return TablePrompt(_to_text(compact), tuple([1] * len(compact)), tuple(map(tuple, compact)))
+
+    has_quantity = [_has_quantity(row) for row in compact]
+    order: dict[tuple[str, ...], int] = {}
+    sent: list[list[str]] = []
+    counts: list[int] = []
+    for idx, row in enumerate(compact):
+        # продолжение относится к строке над ним: важна только следующая строка
+        standalone = has_quantity[idx] and (idx == len(compact) - 1 or has_quantity[idx + 1])
+        key = tuple(row)
+        if standalone and key in order:
+            counts[order[key]] += 1
+            continue
+        if standalone:
+            order[key] = len(counts)
+        sent.append(row)
+        counts.append(1)
+
+    return TablePrompt(_to_text(sent), tuple(counts), tuple(map(tuple, sent)))
+
+
+def _to_text(rows: list[list[str]]) -> str:
+    buf = io.StringIO()
+    csv.writer(buf, delimiter=";", lineterminator="\n").writerows(rows)
+    return buf.getvalue().rstrip("\n")
+
+
+def _has_quantity(row: list[str]) -> bool:
+    # первая ячейка — номер позиции или наименование, количество ищется в остальных
+    return any(_QUANTITY_CELL_RE.match(cell) for cell in row[1:])
+
+
+def _match_key(text: str) -> str:
+    return " ".join(text.replace('"', "").casefold().split())
+
+
+def expand_result(result: NormalizedTable, prompt: TablePrompt) -> Optional[NormalizedTable]:
+    """
+    Размножает строки ответа по кратности соответствующих входных строк.
+    Строка ответа для повторявшейся входной строки ищется по наименованию:
+    оно должно встречаться в этой входной строке и ни в какой другой,
+    и подходить должна ровно одна строка ответа. Иначе (модель склеила,
+    потеряла или переименовала позиции) — None.
+    """
+    out_rows = result.rows if isinstance(result, SpecTable) else parse_rows(result)
+    names = [_match_key((row.as_row() if isinstance(row, SpecRow) else row)[1]) for row in out_rows]
+    sent = [_match_key(" ".join(row)) for row in prompt.rows]
+
+    multiplicity = [1] * len(out_rows)
+    for text, count in zip(sent, prompt.counts):
+        if count == 1:
+            continue
+        matches = [j for j, name in enumerate(names) if name and name in text]
+        if len(matches) != 1:
+            return None
+        j = matches[0]
+        if multiplicity[j] != 1 or sum(names[j] in other for other in sent) != 1:
+            return None
+        multiplicity[j] = count
+
+    expanded = [row for row, count in zip(out_rows, multiplicity) for _ in range(count)]
+    if isinstance(result, SpecTable):
+        return SpecTable(rows=expanded)
+    return rows_to_csv(expanded)
@@ -1,3 +1,5 @@
+import textwrap
+
 SYSTEM_PROMPT: str = (
     """
     Ты — модуль нормализации табличных данных. На вход подаются:
@@ -204,4 +206,16 @@ SYSTEM_PROMPT_OLD: str = (
 
     Результат — только валидный CSV.
     """
-)
\ No newline at end of file
+)
+
+# Отступы из исходника не отправляем — это лишние токены в каждом запросе.
+# Текст после этой обработки одинаков байт-в-байт, что нужно для кэша промптов провайдера.
+SYSTEM_PROMPT = textwrap.dedent(SYSTEM_PROMPT).strip()
+
+# Добавляется к запросу в режиме structured outputs (AI_STRUCTURED_OUTPUT=True)
+STRUCTURED_OUTPUT_NOTE: str = (
+    "Верни результат не CSV, а JSON по заданной схеме: каждая запись — элемент rows "
+    "с полями designation (Обозначение), name (Наименование), unit (Ед. изм.), "
+    "quantity (Требуемое кол-во, число или null) и tech_spec (Техническое задание). "
+    "Правила разбора записей и колонок те же."
+)
@@ -0,0 +1,253 @@
+"""
+Устойчивость вызовов OpenAI: общий для процесса лимитер запросов (token bucket),
+circuit breaker и повторы с экспоненциальной задержкой и джиттером
+на 429/5xx/таймаутах — в пределах общего дедлайна на вызов.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+AI_RATE_LIMIT_RPS = float(os.getenv("AI_RATE_LIMIT_RPS", "5"))
+AI_RATE_LIMIT_BURST = int(os.getenv("AI_RATE_LIMIT_BURST", "10"))
+AI_RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "5"))
+AI_RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "1"))
+AI_RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "30"))
+# Общий дедлайн одного вызова вместе со всеми повторами, сек.
+AI_CALL_DEADLINE = float(os.getenv("AI_CALL_DEADLINE", "300"))
+AI_CIRCUIT_FAILURES = int(os.getenv("AI_CIRCUIT_FAILURES", "5"))
+AI_CIRCUIT_RESET = float(os.getenv("AI_CIRCUIT_RESET", "60"))
+
+
+class AIServiceError(RuntimeError):
+    """
+    Вызов AI не удался после всех повторов.
+    """
+
+
+class CircuitOpenError(AIServiceError):
+    """
+    API признан недоступным, вызовы временно отклоняются без обращения к сети.
+    """
+
+
+class DeadlineExceededError(AIServiceError):
+    """
+    Вызов не уложился в отведённое время вместе с повторами.
+    """
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True  # APITimeoutError — подкласс APIConnectionError
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    Потокобезопасный лимитер: rate запросов в секунду со всплеском до capacity.
+    pause() задерживает всех ожидающих — так 429 от API притормаживает
+    сразу все потоки процесса, а не только получивший его.
+    """
+
+    def __init__(self, rate: float = AI_RATE_LIMIT_RPS, capacity: int = AI_RATE_LIMIT_BURST):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _wait_time(self, now: float) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ждёт свободный токен. Возвращает False, если за timeout не дождались.
+        """
+        if self.rate <= 0:
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                wait = self._wait_time(now)
+            if wait == 0:
+                return True
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold ошибок подряд «размыкается» на reset_timeout секунд:
+    вызовы сразу получают CircuitOpenError. Затем пропускается один пробный
+    вызов — успех замыкает цепь, ошибка снова размыкает её.
+    """
+
+    def __init__(self, failure_threshold: int = AI_CIRCUIT_FAILURES, reset_timeout: float = AI_CIRCUIT_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        Пропускает вызов или выбрасывает CircuitOpenError.
+        Возвращает True, если это пробный вызов после размыкания.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe_in_flight:
+                raise CircuitOpenError("AI API временно недоступен (circuit breaker разомкнут)")
+            self._probe_in_flight = True
+            return True
+
+    def release_probe(self):
+        """
+        Пробный вызов так и не дошёл до API: цепь остаётся разомкнутой,
+        следующий вызов снова может стать пробным.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probe_in_flight:
+                    logger.warning(f"AI circuit breaker opened after {self._failures} failures")
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class ResilientCaller:
+    """
+    Выполняет вызов API через лимитер и circuit breaker, повторяя его
+    на временных ошибках с экспоненциальной задержкой и джиттером.
+    func получает оставшееся до дедлайна время — его нужно передать как timeout запроса.
+    """
+
+    def __init__(
+        self,
+        bucket: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = AI_RETRY_ATTEMPTS,
+        base_delay: float = AI_RETRY_BASE_DELAY,
+        max_delay: float = AI_RETRY_MAX_DELAY,
+        deadline: float = AI_CALL_DEADLINE,
+    ):
+        self.bucket = bucket or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)  # джиттер, чтобы потоки не повторяли синхронно
+        return max(delay, _retry_after(error) or 0)
+
+    def call(self, func: Callable[[float], R]) -> R:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+
+        while True:
+            probe = self.breaker.before_call()
+
+            acquired = False
+            try:
+                acquired = self.bucket.acquire(timeout=deadline - time.monotonic())
+            finally:
+                if probe and not acquired:
+                    self.breaker.release_probe()
+            if not acquired:
+                raise DeadlineExceededError(f"AI call deadline of {self.deadline:.0f}s exceeded while rate limited")
+
+            try:
+                result = func(max(deadline - time.monotonic(), 1.0))
+            except Exception as e:
+                if not is_retryable(e):
+                    if isinstance(e, openai.APIStatusError):
+                        self.breaker.record_success()  # API ответил — ошибка в запросе, а не в доступности
+                    elif probe:
+                        self.breaker.release_probe()  # локальная ошибка о доступности API ничего не говорит
+                    raise
+
+                delay = self._backoff(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    # API доступен, просто просит сбавить темп: притормаживаем лимитер, цепь не размыкаем
+                    self.breaker.record_success()
+                    self.bucket.pause(delay)
+                else:
+                    self.breaker.record_failure()
+
+                if attempt + 1 == self.max_attempts:
+                    raise AIServiceError(f"AI call failed after {self.max_attempts} attempts: {e}") from e
+                if time.monotonic() + delay > deadline:
+                    raise DeadlineExceededError(f"AI call deadline of {self.deadline:.0f}s exceeded: {e}") from e
+
+                logger.info(f"AI call attempt {attempt + 1}/{self.max_attempts} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+
+_default_caller: Optional[ResilientCaller] = None
+_default_caller_lock = threading.Lock()
+
+
+def get_default_caller() -> ResilientCaller:
+    """
+    Общие для процесса лимитер и circuit breaker: все потоки-воркеры
+    и все документы делят один бюджет запросов к API.
+    """
+    global _default_caller
+    with _default_caller_lock:
+        if _default_caller is None:
+            _default_caller = ResilientCaller()
+        return _default_caller
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[3]
+
+DEFAULT_CACHE_PATH = os.getenv("AI_CACHE_PATH", str(BASE_DIR / ".cache" / "ai_responses.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL", str(30 * 24 * 3600)))
+DEFAULT_MAX_BYTES = int(float(os.getenv("AI_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+
+def _sha256(data: str | bytes) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к каноническому виду для ключа кэша:
+    схлопывает пробелы внутри строк и убирает пустые строки.
+    """
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_response_key(model: str, prompt_hash: str, kind: str, payload: str | bytes) -> str:
+    """
+    Ключ ответа. Текст нормализуется, байты (изображения) хэшируются как есть.
+    """
+    if isinstance(payload, str):
+        payload = normalize_text(payload)
+    return _sha256("\x1f".join([model, prompt_hash, kind, _sha256(payload)]))
+
+
+class ResponseCache:
+    """
+    Персистентный кэш ответов GPT в SQLite:
+    - ключ — хэш (модель, системный промпт, тип запроса, нормализованный вход);
+    - записи старше ttl_seconds считаются промахом и удаляются;
+    - при превышении max_bytes вытесняются давно не использованные записи (LRU);
+    - при смене системного промпта старые записи удаляются при открытии кэша;
+    - счётчики попаданий/промахов хранятся в той же БД.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        system_prompt: str = "",
+        ttl_seconds: Optional[int] = DEFAULT_TTL_SECONDS,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES,
+    ):
+        self.path = Path(path)
+        self.prompt_hash = _sha256(system_prompt)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    prompt_hash TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+            stale = conn.execute(
+                "DELETE FROM responses WHERE prompt_hash != ?", (self.prompt_hash,)
+            ).rowcount
+            if stale:
+                logger.info(f"AI cache: system prompt changed, dropped {stale} entries")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def make_key(self, model: str, kind: str, payload: str | bytes) -> str:
+        return make_response_key(model, self.prompt_hash, kind, payload)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self._increment(conn, "misses")
+                return None
+
+            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._increment(conn, "hits")
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, prompt_hash, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.prompt_hash, value, size, now, now),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self.max_bytes is None:
+            return
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"AI cache: evicted {evicted} least recently used entries")
+
+    @staticmethod
+    def _increment(conn: sqlite3.Connection, name: str) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def stats(self) -> dict:
+        with self._lock, self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+            conn.execute("DELETE FROM counters")
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache(system_prompt: str) -> Optional[ResponseCache]:
+    """
+    Общий кэш процесса. Отключается переменной окружения AI_CACHE_ENABLED=False.
+    """
+    global _default_cache
+    if os.getenv("AI_CACHE_ENABLED", "True") != "True":
+        return None
+
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.prompt_hash != _sha256(system_prompt):
+            _default_cache = ResponseCache(system_prompt=system_prompt)
+        return _default_cache
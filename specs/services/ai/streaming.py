@@ -0,0 +1,96 @@
+"""
+Потоковая выдача строк результата: ответ GPT читается по мере генерации,
+готовые CSV-строки разбираются сразу и отдаются в «приёмник» текущего запуска
+(например, в журнал строк, который страница опрашивает через run_live_rows).
+"""
+import contextvars
+import csv
+import os
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from specs.services.processing.rule_mapper import OUTPUT_HEADER
+
+AI_STREAMING_ENABLED = os.getenv("AI_STREAMING_ENABLED", "True") == "True"
+
+RowSink = Callable[[list[list[str]]], None]
+
+_row_sink: contextvars.ContextVar[Optional[RowSink]] = contextvars.ContextVar("row_sink", default=None)
+
+
+@contextmanager
+def stream_rows_to(sink: RowSink) -> Iterator[None]:
+    """
+    Пока контекст открыт, все строки, получаемые от GPT (в том числе во вложенных
+    map_concurrently), передаются в sink по мере появления.
+    """
+    token = _row_sink.set(sink)
+    try:
+        yield
+    finally:
+        _row_sink.reset(token)
+
+
+def get_row_sink() -> Optional[RowSink]:
+    return _row_sink.get()
+
+
+def emit_rows(rows: list[list[str]]):
+    sink = _row_sink.get()
+    if sink is not None and rows:
+        sink(rows)
+
+
+class CsvRowAssembler:
+    """
+    Инкрементальный разбор CSV (`;`) из потока фрагментов текста.
+    feed() возвращает строки, которые уже завершились; строка с незакрытой
+    кавычкой ждёт продолжения. Заголовок шаблона и markdown-ограды пропускаются.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, delta: str) -> list[list[str]]:
+        self._buffer += delta
+        rows = []
+        while True:
+            end = self._complete_line_end()
+            if end is None:
+                break
+            line, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+            row = self._parse_line(line)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def close(self) -> list[list[str]]:
+        line, self._buffer = self._buffer, ""
+        row = self._parse_line(line)
+        return [row] if row is not None else []
+
+    def _complete_line_end(self) -> Optional[int]:
+        # перевод строки внутри кавычек — часть значения, а не конец записи
+        start = 0
+        while True:
+            end = self._buffer.find("\n", start)
+            if end == -1:
+                return None
+            if self._buffer.count('"', 0, end) % 2 == 0:
+                return end
+            start = end + 1
+
+    @staticmethod
+    def _parse_line(line: str) -> Optional[list[str]]:
+        line = line.strip()
+        if not line or line.startswith("```") or line == OUTPUT_HEADER:
+            return None
+        return next(csv.reader([line], delimiter=";"))
+
+
+def parse_rows(text: str) -> list[list[str]]:
+    """
+    Все строки данных из готового CSV-ответа.
+    """
+    assembler = CsvRowAssembler()
+    return assembler.feed(text) + assembler.close()
@@ -0,0 +1,83 @@
+import contextvars
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+
+    def __post_init__(self):
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens: int, cached_tokens: int, output_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+
+    def merge(self, other: "TokenUsage"):
+        with self._lock:
+            self.calls += other.calls
+            self.input_tokens += other.input_tokens
+            self.cached_tokens += other.cached_tokens
+            self.output_tokens += other.output_tokens
+
+    def __str__(self) -> str:
+        return (
+            f"{self.calls} calls, input {self.input_tokens} tokens "
+            f"({self.cached_tokens} cached), output {self.output_tokens} tokens"
+        )
+
+
+# Итог по процессу (для статистики) и по текущему запуску (collect_usage)
+TOTAL_USAGE = TokenUsage()
+_run_usage: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("run_usage", default=None)
+
+
+@contextmanager
+def collect_usage() -> Iterator[TokenUsage]:
+    usage = TokenUsage()
+    token = _run_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _run_usage.reset(token)
+
+
+def record_usage(usage, kind: str):
+    """
+    Учитывает usage из ответа Responses API (input/output токены и попадания
+    в кэш промптов на стороне провайдера).
+    """
+    if usage is None:
+        return
+
+    details = getattr(usage, "input_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    input_tokens, output_tokens = usage.input_tokens or 0, usage.output_tokens or 0
+    logger.info(f"AI call ({kind}): input {input_tokens} tokens ({cached} cached), output {output_tokens} tokens")
+
+    TOTAL_USAGE.add(input_tokens, cached, output_tokens)
+    run_usage = _run_usage.get()
+    if run_usage is not None:
+        run_usage.add(input_tokens, cached, output_tokens)
+
+
+def merge_usage(usage: TokenUsage):
+    """
+    Учитывает расход, посчитанный в другом процессе (пакетный разбор в пуле процессов).
+    """
+    TOTAL_USAGE.merge(usage)
+    run_usage = _run_usage.get()
+    if run_usage is not None:
+        run_usage.merge(usage)
@@ -0,0 +1,131 @@
+"""
+Сохранение итоговой таблицы в xlsx / csv / parquet.
+
+xlsx пишется openpyxl в режиме write_only: строки уходят во временный файл
+по одной, поэтому память не растёт с числом строк (в отличие от DataFrame.to_excel,
+который держит в памяти все ячейки листа). Ширина колонок подбирается по выборке строк.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк просматривается при подборе ширины колонок
+EXPORT_WIDTH_SAMPLE_ROWS = int(os.getenv("EXPORT_WIDTH_SAMPLE_ROWS", "1000"))
+MIN_COLUMN_WIDTH = 6
+MAX_COLUMN_WIDTH = 60
+SHEET_NAME = "Спецификация"
+
+_HEADER_FONT = Font(bold=True)
+_HEADER_FILL = PatternFill("solid", fgColor="DDEBF7")
+_HEADER_ALIGNMENT = Alignment(wrap_text=True, vertical="top")
+
+
+def sample_rows(df: pd.DataFrame, sample_size: int = EXPORT_WIDTH_SAMPLE_ROWS) -> pd.DataFrame:
+    """
+    Начало таблицы и равномерная выборка по всей её длине.
+    """
+    if len(df) <= sample_size:
+        return df
+    head = sample_size // 2
+    spread = np.linspace(head, len(df) - 1, sample_size - head, dtype=np.int64)
+    return df.iloc[np.concatenate([np.arange(head), spread])]
+
+
+def column_widths(df: pd.DataFrame, sample_size: int = EXPORT_WIDTH_SAMPLE_ROWS) -> list[float]:
+    """
+    Ширина колонок по самому длинному значению выборки (и заголовку),
+    в пределах MIN_COLUMN_WIDTH..MAX_COLUMN_WIDTH.
+    """
+    sample = sample_rows(df, sample_size)
+    widths = []
+    for idx, column in enumerate(df.columns):
+        values = sample.iloc[:, idx].dropna().astype(str)
+        longest = max(len(str(column)), int(values.str.len().max()) if len(values) else 0)
+        widths.append(float(min(max(longest + 2, MIN_COLUMN_WIDTH), MAX_COLUMN_WIDTH)))
+    return widths
+
+
+def _cell_value(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _iter_rows(df: pd.DataFrame) -> Iterator[list]:
+    for row in df.itertuples(index=False, name=None):
+        yield [_cell_value(value) for value in row]
+
+
+def write_xlsx(df: pd.DataFrame, output_path: str, sheet_name: str = SHEET_NAME) -> str:
+    """
+    Потоковая запись xlsx: оформленный заголовок с автофильтром и закреплением,
+    ширина колонок по выборке строк.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+
+    for idx, width in enumerate(column_widths(df), start=1):
+        sheet.column_dimensions[get_column_letter(idx)].width = width
+    sheet.freeze_panes = "A2"
+    if len(df.columns):
+        sheet.auto_filter.ref = f"A1:{get_column_letter(len(df.columns))}{len(df) + 1}"
+
+    header = []
+    for column in df.columns:
+        cell = WriteOnlyCell(sheet, value=str(column))
+        cell.font, cell.fill, cell.alignment = _HEADER_FONT, _HEADER_FILL, _HEADER_ALIGNMENT
+        header.append(cell)
+    sheet.append(header)
+
+    for row in _iter_rows(df):
+        sheet.append(row)
+
+    workbook.save(output_path)
+    return output_path
+
+
+def write_csv(df: pd.DataFrame, output_path: str) -> str:
+    df.to_csv(output_path, sep=";", index=False, encoding="utf-8")
+    return output_path
+
+
+def write_parquet(df: pd.DataFrame, output_path: str) -> str:
+    """
+    Нужен pyarrow (или fastparquet) — в requirements не входит.
+    """
+    df.to_parquet(output_path, index=False)
+    return output_path
+
+
+EXPORTERS: dict[str, Callable[[pd.DataFrame, str], str]] = {
+    "xlsx": write_xlsx,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
+
+
+def export_dataframe(df: pd.DataFrame, output_path: str, fmt: Optional[str] = None) -> str:
+    """
+    Сохраняет таблицу в формате fmt (по умолчанию — по расширению файла).
+    """
+    fmt = (fmt or Path(output_path).suffix.lstrip(".")).lower()
+    exporter = EXPORTERS.get(fmt)
+    if exporter is None:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    exporter(df, output_path)
+    logger.info(f"Exported {len(df)} rows to {output_path}")
+    return output_path
@@ -1,19 +1,31 @@
-import base64
 import logging
 import os
 from typing import Optional
 
 from docx import Document
 from wand.image import Image as WandImage
-from specs.services.ai.ai_helper import AIHelper
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.parser.source import SpecSource, open_source, read_source
+from specs.services.processing.rule_mapper import RuleBasedNormalizer
+from specs.services.processing.spec_table import NormalizedTable
+from specs.services.utils.concurrency import map_concurrently
+from specs.services.utils.image_prep import PreparedImage, prepare_image
 
 logger = logging.getLogger(__name__)
 
 class DocxParser:
-    def __init__(self, path: str, ai_helper: Optional[AIHelper] = None):
-        self.path = path
-        self.doc = Document(path)
-        self.ai = ai_helper or AIHelper()
+    def __init__(
+        self,
+        path: SpecSource,
+        ai_helper: Optional[AIHelper] = None,
+        max_concurrency: Optional[int] = None,
+        rule_normalizer: Optional[RuleBasedNormalizer] = None,
+    ):
+        self.path, data = read_source(path)
+        self.doc = Document(open_source(self.path, data))
+        self.ai = ai_helper or get_ai_helper()
+        self.max_concurrency = max_concurrency
+        self.rules = rule_normalizer or RuleBasedNormalizer()
 
     def extract_raw_tables(self) -> list[list[list[str]]]:
         """
@@ -25,19 +37,19 @@ class DocxParser:
             results.append(rows)
         return results
 
-    def extract_images_as_base64(self) -> list[str]:
+    def extract_images(self) -> list[PreparedImage]:
         """
-        Извлекает все изображения из DOCX и возвращает список base64-строк (без префикса)
+        Извлекает все изображения из DOCX, уменьшает и перекодирует их для GPT (image_prep).
         EMF конвертируется в PNG в памяти через Wand
         """
-        images_b64 = []
+        images = []
         rels = self.doc.part._rels
         for rel in rels:
             rel = rels[rel]
             if "image" not in rel.target_ref.lower():
                 continue
 
-            img_bytes = rel.target_part.blob
+            img_bytes = original_bytes = rel.target_part.blob
             ext = os.path.splitext(rel.target_ref)[1].lower()
 
             # EMF → PNG конвертация in-memory
@@ -50,33 +62,60 @@ class DocxParser:
                     logger.info(f"[WARNING] Не удалось конвертировать EMF {rel.target_ref}: {e}")
                     continue
 
-            # base64
-            img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            images_b64.append(img_b64)
+            try:
+                image = prepare_image(img_bytes)
+            except Exception as e:
+                logger.warning(f"Не удалось подготовить изображение {rel.target_ref}: {e}")
+                continue
+            images.append(PreparedImage(image.b64, image.mime_type, len(original_bytes), image.encoded_size))
 
-        return images_b64
+        if images:
+            original_size = sum(image.original_size for image in images)
+            saved = sum(image.saved_bytes for image in images)
+            logger.info(f"{len(images)} images prepared: {original_size} bytes, {saved} saved")
+        return images
 
-    def normalize_tables(self, raw_tables: list[list[list[str]]]) -> list[str]:
+    def normalize_tables(self, raw_tables: list[list[list[str]]]) -> list[NormalizedTable]:
         """
-        Прогоняет все текстовые таблицы через GPT для нормализации к CSV
+        Нормализует все текстовые таблицы к CSV.
+        Таблицы с распознаваемыми колонками обрабатываются локально,
+        остальные отправляются в GPT параллельно (не более max_concurrency запросов).
+        Порядок сохраняется, упавшие таблицы пропускаются.
         """
-        normalized = []
-        for table in raw_tables:
-            csv_table = self.ai.normalize_table_from_text(table)
-            normalized.append(csv_table)
-        return normalized
+        results = [self.rules.try_normalize(table) for table in raw_tables]
+
+        pending = [idx for idx, csv_table in enumerate(results) if csv_table is None]
+        if pending:
+            gpt_results = map_concurrently(
+                self.ai.normalize_table_from_text,
+                [raw_tables[idx] for idx in pending],
+                self.max_concurrency,
+            )
+            for idx, csv_table in zip(pending, gpt_results):
+                results[idx] = csv_table
+
+        return self._collect(results, "table")
 
-    def normalize_images(self, b64_images: list[str]) -> list[str]:
+    def normalize_images(self, images: list[PreparedImage]) -> list[NormalizedTable]:
         """
-        Прогоняет все изображения через GPT для получения CSV
+        Прогоняет все изображения через GPT для получения CSV (параллельно, как и таблицы)
         """
-        normalized = []
-        for img_b64 in b64_images:
-            csv_table = self.ai.extract_table_from_image_b64(img_b64)
-            normalized.append(csv_table)
+        results = map_concurrently(
+            lambda image: self.ai.extract_table_from_image_b64(image.b64, mime_type=image.mime_type),
+            images,
+            self.max_concurrency,
+        )
+        return self._collect(results, "image")
+
+    @staticmethod
+    def _collect(results: list[Optional[NormalizedTable]], kind: str) -> list[NormalizedTable]:
+        normalized = [csv_table for csv_table in results if csv_table]
+        skipped = len(results) - len(normalized)
+        if skipped:
+            logger.warning(f"{skipped} of {len(results)} {kind}(s) were skipped after GPT errors")
         return normalized
 
-    def parse_all(self) -> list[str]:
+    def parse_all(self) -> list[NormalizedTable]:
         """
         Основной пайплайн:
         1) Пытаемся получить таблицы из текста
@@ -88,12 +127,12 @@ class DocxParser:
             return self.normalize_tables(raw_tables)
 
         # Если нет текстовых таблиц — пробуем изображения
-        images_b64 = self.extract_images_as_base64()
-        if not images_b64:
+        images = self.extract_images()
+        if not images:
             logger.info("[INFO] Таблицы и изображения не найдены.")
             return []
 
-        return self.normalize_images(images_b64)
+        return self.normalize_images(images)
 
 
 # Пример использования
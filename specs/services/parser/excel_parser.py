@@ -1,51 +1,110 @@
 import logging
+import os
 
+import openpyxl
 import pandas as pd
-from pathlib import Path
 from typing import Optional
 
-from specs.services.ai.ai_helper import AIHelper
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.ai.chunking import DEFAULT_CHUNK_MAX_TOKENS, split_dataframe_by_token_budget
+from specs.services.parser.source import SpecSource, open_source, read_source
+from specs.services.processing.csv_utils import join_csv_tables
+from specs.services.processing.rule_mapper import RuleBasedNormalizer
+from specs.services.processing.spec_table import NormalizedTable
+from specs.services.processing.table_cleaning import clean_table, find_header_row, non_empty_mask
+from specs.services.utils.concurrency import map_concurrently
 
 logger = logging.getLogger(__name__)
 
+# Начиная с этого размера .xlsx читается потоково (openpyxl read-only)
+STREAMING_THRESHOLD_BYTES = int(os.getenv("EXCEL_STREAMING_THRESHOLD_MB", "20")) * 1024 * 1024
+
+
+def _cell_to_str(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
 class ExcelParser:
     """
     Парсер Excel-таблиц с постобработкой и нормализацией через AIHelper.
+    Книга читается один раз, листы обрабатываются параллельно.
     """
 
-    def __init__(self, path: str, ai_helper: Optional[AIHelper] = None):
-        self.input_file = Path(path)
-        self.ai = ai_helper or AIHelper()
-
-        if not self.input_file.exists():
+    def __init__(
+        self,
+        path: SpecSource,
+        ai_helper: Optional[AIHelper] = None,
+        max_chunk_tokens: int = DEFAULT_CHUNK_MAX_TOKENS,
+        max_concurrency: Optional[int] = None,
+        rule_normalizer: Optional[RuleBasedNormalizer] = None,
+        streaming: Optional[bool] = None,
+    ):
+        self.input_file, self.data = read_source(path)
+        self.ai = ai_helper or get_ai_helper()
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_concurrency = max_concurrency
+        self.rules = rule_normalizer or RuleBasedNormalizer()
+
+        if self.input_file is not None and not self.input_file.exists():
             raise FileNotFoundError(f"Excel file not found: {self.input_file}")
 
-    def _find_header_row(self, df: pd.DataFrame) -> int:
+        # None — решаем по размеру файла
+        self.streaming = streaming if streaming is not None else self._is_large_xlsx()
+
+    def _is_large_xlsx(self) -> bool:
+        if self.data is not None:
+            return self.data[:2] == b"PK" and len(self.data) >= STREAMING_THRESHOLD_BYTES
+        return self.input_file.suffix.lower() == ".xlsx" and self.input_file.stat().st_size >= STREAMING_THRESHOLD_BYTES
+
+    def load_sheets(self) -> dict[str, pd.DataFrame]:
+        """
+        Читает все листы книги за один проход.
+        Возвращает {имя листа: DataFrame из строк} без заголовков.
+        """
+        if self.streaming:
+            return self._load_sheets_streaming()
+
+        sheets = pd.read_excel(open_source(self.input_file, self.data), sheet_name=None, header=None, dtype=str)
+        return {name: df.fillna("").map(str) for name, df in sheets.items()}
+
+    def _load_sheets_streaming(self) -> dict[str, pd.DataFrame]:
         """
-        Ищем строку, которая похожа на заголовок.
-        Эвристика: содержит >= 2 непустых ячеек и НЕ состоит только из чисел.
+        Потоковое чтение .xlsx через openpyxl в read-only режиме:
+        XML листов разбирается построчно, без построения полной модели книги.
         """
-        for i, row in df.iterrows():
-            filled = row.astype(str).str.strip()
-            non_empty = filled[filled != ""]
-            if len(non_empty) >= 2 and not all(s.isdigit() for s in non_empty):
-                return i
-        return 0  # fallback — первая строка
-
-    def parse_sheet(self, sheet_name: str) -> str | None:
+        workbook = openpyxl.load_workbook(open_source(self.input_file, self.data), read_only=True, data_only=True)
+        try:
+            sheets = {}
+            for ws in workbook.worksheets:
+                rows = [[_cell_to_str(v) for v in row] for row in ws.iter_rows(values_only=True)]
+                sheets[ws.title] = pd.DataFrame(rows, dtype=str).fillna("")
+            return sheets
+        finally:
+            workbook.close()
+
+    def parse_sheet(self, sheet_name: str, df: Optional[pd.DataFrame] = None) -> Optional[NormalizedTable]:
         """
         Обрабатывает один лист Excel, нормализует через GPT и сохраняет в CSV.
+        df — уже прочитанный лист (из load_sheets); если не передан, лист читается из файла.
         Возвращает путь к итоговому файлу или None, если лист пуст/невалиден.
         """
-        df = pd.read_excel(self.input_file, sheet_name=sheet_name, header=None, dtype=str)
-        df = df.fillna("").map(str)
+        if df is None:
+            df = pd.read_excel(open_source(self.input_file, self.data), sheet_name=sheet_name, header=None, dtype=str)
+            df = df.fillna("").map(str)
+
+        # маска непустых ячеек считается один раз и переиспользуется ниже
+        mask = non_empty_mask(df)
 
         # Если весь лист пустой
-        if df.replace("", pd.NA).dropna(how="all").empty:
+        if not mask.any():
             logger.info(f"Sheet '{sheet_name}' is empty, skipping")
             return None
 
-        header_idx = self._find_header_row(df)
+        header_idx = find_header_row(df, mask)
         if header_idx >= len(df):
             logger.info(f"No valid header found in '{sheet_name}', skipping")
             return None
@@ -59,45 +118,49 @@ class ExcelParser:
         table.columns = header
 
         # --- очистка ---
-        table = table.dropna(how="all")
-        table = table[~table.apply(lambda r: all(v.strip() == "" for v in r), axis=1)]
-        table = table[table.apply(lambda r: sum(str(v).strip() != "" for v in r) >= 2, axis=1)]
-        table = table.dropna(axis=1, how="all")
-        table = table.loc[:, ~(table.apply(lambda col: col.astype(str).str.strip().eq("").all()))]
-        table = table.loc[:, table.apply(lambda col: sum(str(v).strip() == "" for v in col) < 5)]
-        table = table[table.apply(lambda r: sum(str(v).strip() == "" for v in r) < 3, axis=1)]
+        table = clean_table(table, mask[header_idx + 1:])
 
-        # --- в CSV ---
-        csv_raw = table.to_csv(index=False, sep=";", encoding="utf-8-sig")
+        # --- быстрый путь без GPT ---
+        rule_csv = self.rules.try_normalize([list(table.columns)] + table.values.tolist())
+        if rule_csv:
+            return rule_csv
 
         # --- GPT нормализация ---
-        normalized_csv = self.ai.normalize_table_from_csv(csv_raw)
-
-        return normalized_csv
+        return self._normalize_in_batches(table, sheet_name)
 
-    def parse_all_sheets(self) -> Optional[str]:
+    def _normalize_in_batches(self, table: pd.DataFrame, sheet_name: str) -> Optional[NormalizedTable]:
         """
-        Прогоняет все листы Excel, собирает все CSV-строки и объединяет в один общий CSV.
-        Если ни один лист не дал результата, возвращает None.
+        Режет таблицу на пачки строк по бюджету токенов (заголовок повторяется
+        в каждой пачке), нормализует пачки параллельно и склеивает результат по порядку.
         """
-        xls = pd.ExcelFile(self.input_file)
-        csv_list = []
+        batches = split_dataframe_by_token_budget(table, self.max_chunk_tokens)
+        row_batches = [[list(batch.columns)] + batch.values.tolist() for batch in batches]
 
-        for sheet_name in xls.sheet_names:
-            csv_data = self.parse_sheet(sheet_name)
-            if csv_data:
-                csv_list.append(csv_data)
+        if len(row_batches) == 1:
+            return self.ai.normalize_table_from_text(row_batches[0])
 
-        if not csv_list:
-            return None
+        logger.info(f"Sheet '{sheet_name}': {len(table)} rows split into {len(row_batches)} batches")
+        results = map_concurrently(self.ai.normalize_table_from_text, row_batches, self.max_concurrency)
 
-        # Берем заголовок из первого CSV
-        header, *first_rows = csv_list[0].splitlines()
+        normalized = [csv for csv in results if csv]
+        if len(normalized) < len(results):
+            logger.warning(f"Sheet '{sheet_name}': {len(results) - len(normalized)} batches skipped after GPT errors")
+        return join_csv_tables(normalized)
+
+    def parse_all_sheets(self) -> Optional[NormalizedTable]:
+        """
+        Прогоняет все листы Excel, собирает все CSV-строки и объединяет в один общий CSV.
+        Книга читается один раз, независимые листы обрабатываются параллельно
+        (порядок листов сохраняется).
+        Если ни один лист не дал результата, возвращает None.
+        """
+        sheets = self.load_sheets()
 
-        # Остальные CSV — берем только строки без заголовка
-        rows = first_rows.copy()
-        for csv in csv_list[1:]:
-            rows.extend(csv.splitlines()[1:])  # пропускаем заголовок
+        results = map_concurrently(
+            lambda item: self.parse_sheet(*item),
+            list(sheets.items()),
+            self.max_concurrency,
+        )
+        csv_list = [csv_data for csv_data in results if csv_data]
 
-        # Собираем обратно
-        return "\n".join([header] + rows)
+        return join_csv_tables(csv_list)
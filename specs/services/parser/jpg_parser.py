@@ -1,13 +1,15 @@
-import base64
 import logging
-from io import BytesIO
-from pathlib import Path
 from typing import Optional
 
-import pandas as pd
 from PIL import Image
 
-from specs.services.ai.ai_helper import AIHelper
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.parser.source import SpecSource, open_source, read_source
+from specs.services.processing.csv_utils import join_overlapping_csv_tables
+from specs.services.processing.spec_table import NormalizedTable
+from specs.services.utils.concurrency import map_concurrently
+from specs.services.utils.image_prep import PreparedImage, prepare_image
+from specs.services.utils.image_tiling import DEFAULT_TILE_HEIGHT, DEFAULT_TILE_OVERLAP, plan_image_tiles
 
 
 logger = logging.getLogger(__name__)
@@ -16,49 +18,65 @@ class JpgParser:
     """
     Парсер JPG/JPEG изображений:
     - открытие изображения
-    - разрезание на части
-    - отправка каждой части в GPT через AIHelper
-    - парсинг ответа (markdown-таблица)
-    - сбор и возврат CSV
+    - высокий скан режется на перекрывающиеся плитки по промежуткам между строками
+    - плитки уменьшаются и перекодируются в компактный формат (image_prep)
+    - плитки параллельно отправляются в GPT через AIHelper (ответ — CSV по шаблону)
+    - CSV плиток склеиваются, строки из зоны перекрытия не дублируются
     """
 
-    def __init__(self, path: str, ai_helper: Optional[AIHelper] = None):
-        self.input_file = Path(path)
-        self.ai = ai_helper or AIHelper()
+    def __init__(
+        self,
+        path: SpecSource,
+        ai_helper: Optional[AIHelper] = None,
+        tile_height: int = DEFAULT_TILE_HEIGHT,
+        tile_overlap: int = DEFAULT_TILE_OVERLAP,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.input_file, self.data = read_source(path)
+        self.ai = ai_helper or get_ai_helper()
+        self.tile_height = tile_height
+        self.tile_overlap = tile_overlap
+        self.max_concurrency = max_concurrency
 
+        if self.input_file is None:
+            return
+
+        # формат определён по содержимому (registry), расширение имени не проверяется
         if not self.input_file.exists():
             raise FileNotFoundError(f"JPG/JPEG file not found: {self.input_file}")
 
-        if self.input_file.suffix.lower() not in (".jpg", ".jpeg"):
-            raise ValueError(f"Unsupported image type: {self.input_file.suffix}")
-
-    def parse(self) -> str:
+    def parse(self) -> Optional[NormalizedTable]:
         """
-        Основной метод: обрабатывает изображение (режет -> GPT -> парсинг -> CSV).
+        Основной метод: обрабатывает изображение (плитки -> GPT -> склейка CSV).
         """
-        logger.info(f"Extracting table from image: {self.input_file}")
+        logger.info(f"Extracting table from image: {self.input_file or 'buffer'}")
+
+        image = Image.open(open_source(self.input_file, self.data)).convert("RGB")
+        bands, overlap_lines = plan_image_tiles(image, self.tile_height, self.tile_overlap)
+        if len(bands) == 1:
+            tile = prepare_image(image)
+            self._log_savings([tile])
+            return self._extract(tile)
 
-        image = Image.open(self.input_file).convert("RGB")
+        tiles = [prepare_image(image.crop((0, top, image.width, bottom))) for top, bottom in bands]
+        self._log_savings(tiles)
 
-        image_64 = self._encode_image(image)
-        response_text = self.ai.extract_table_from_image_b64(image_b64=image_64)
-        return response_text
+        logger.info(f"Image {image.width}x{image.height} split into {len(tiles)} tiles")
+        results = map_concurrently(self._extract, tiles, self.max_concurrency)
+
+        kept = [i for i, csv_text in enumerate(results) if csv_text]
+        if len(kept) < len(results):
+            logger.warning(f"{len(results) - len(kept)} image tiles skipped after GPT errors")
+        # после пропущенной плитки соседние части уже не перекрываются
+        overlap_rows = [overlap_lines[i] if j == i + 1 else 0 for i, j in zip(kept, kept[1:])]
+        return join_overlapping_csv_tables([results[i] for i in kept], overlap_rows)
 
     # --- Внутренние методы ---
 
-    @staticmethod
-    def _encode_image(pil_img) -> str:
-        buf = BytesIO()
-        pil_img.save(buf, format="JPEG")
-        return base64.b64encode(buf.getvalue()).decode("utf-8")
-
-    @staticmethod
-    def _parse_markdown_table(md_text: str):
-        lines = [line.strip() for line in md_text.split("\n") if line.strip()]
-        rows = []
-        for line in lines:
-            if line.startswith("|") and "|" in line[1:]:
-                parts = [p.strip() for p in line.strip("|").split("|")]
-                if len(parts) >= 2 and parts[0].lower() != "название":
-                    rows.append(parts[:2])
-        return rows
\ No newline at end of file
+    def _extract(self, tile: PreparedImage) -> NormalizedTable:
+        return self.ai.extract_table_from_image_b64(image_b64=tile.b64, mime_type=tile.mime_type)
+
+    def _log_savings(self, tiles: list[PreparedImage]):
+        original_size = len(self.data) if self.data is not None else self.input_file.stat().st_size
+        encoded_size = sum(tile.encoded_size for tile in tiles)
+        logger.info(f"Image payload: {original_size} -> {encoded_size} bytes ({original_size - encoded_size} saved)")
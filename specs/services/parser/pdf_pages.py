@@ -0,0 +1,153 @@
+"""
+Постраничное извлечение текста из PDF.
+
+Модуль намеренно лёгкий (без Django/OpenAI): его функции выполняются
+в дочерних процессах пула PDFParser.
+"""
+import re
+from io import BytesIO
+from typing import Union
+
+import pdfplumber
+import pypdfium2 as pdfium
+
+PdfSource = Union[str, bytes]
+
+BACKENDS = ("pdfplumber", "pdfium")
+
+
+def _open(source: PdfSource):
+    return BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _split_lines(text: str) -> list[str]:
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def count_pages(source: PdfSource) -> int:
+    pdf = pdfium.PdfDocument(_open(source))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _pdfium_lines(pdf, idx: int) -> list[str]:
+    page = pdf[idx]
+    textpage = page.get_textpage()
+    try:
+        return _split_lines(textpage.get_text_bounded())
+    finally:
+        textpage.close()
+        page.close()
+
+
+def extract_page_lines(source: PdfSource, start: int, stop: int, backend: str = "pdfplumber") -> list[list[str]]:
+    """
+    Извлекает строки текста со страниц [start, stop) (нумерация с 0).
+    Возвращает список строк для каждой страницы диапазона.
+    backend: "pdfplumber" (точнее раскладка) или "pdfium" (заметно быстрее).
+    """
+    if backend == "pdfium":
+        pdf = pdfium.PdfDocument(_open(source))
+        try:
+            return [_pdfium_lines(pdf, idx) for idx in range(start, stop)]
+        finally:
+            pdf.close()
+
+    if backend != "pdfplumber":
+        raise ValueError(f"Unknown PDF text backend: {backend}")
+
+    pages = []
+    with pdfplumber.open(_open(source), pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            pages.append(_split_lines(page.extract_text() or ""))
+            page.close()
+    return pages
+
+
+# Таблицы без линий ищем по выравниванию слов; такие «таблицы» принимаем,
+# только если в них хотя бы столько колонок и строк
+TEXT_TABLE_MIN_COLS = 3
+TEXT_TABLE_MIN_ROWS = 2
+# ... большинство строк заполнены хотя бы на TEXT_TABLE_MIN_COLS ячеек и есть
+# числовая колонка (количество, номер позиции) — выровненный абзац текста таким не бывает
+TEXT_TABLE_MIN_SHARE = 0.6
+TEXT_TABLE_SETTINGS = {"vertical_strategy": "text", "horizontal_strategy": "text"}
+
+_NUMBER_CELL_RE = re.compile(r"^\d+(?:[\s.,]\d+)*$")
+
+
+def _clean_table(table: list[list]) -> list[list[str]]:
+    rows = [[" ".join(str(cell).split()) if cell is not None else "" for cell in row] for row in table]
+    return [row for row in rows if any(row)]
+
+
+def is_number_cell(cell: str) -> bool:
+    return bool(_NUMBER_CELL_RE.match(cell))
+
+
+def _looks_like_text_table(table: list[list[str]]) -> bool:
+    if len(table) < TEXT_TABLE_MIN_ROWS or max(map(len, table)) < TEXT_TABLE_MIN_COLS:
+        return False
+    dense = [row for row in table if sum(1 for cell in row if cell) >= TEXT_TABLE_MIN_COLS]
+    if len(dense) < max(TEXT_TABLE_MIN_ROWS, TEXT_TABLE_MIN_SHARE * len(table)):
+        return False
+    width = max(map(len, dense))
+    return any(
+        sum(1 for row in dense if j < len(row) and is_number_cell(row[j])) >= TEXT_TABLE_MIN_SHARE * len(dense)
+        for j in range(width)
+    )
+
+
+def _page_tables(page) -> list[list[list[str]]]:
+    tables = [_clean_table(t) for t in page.extract_tables()]
+    tables = [t for t in tables if len(t) >= 1 and max(map(len, t)) >= 2]
+    if tables:
+        return tables
+    return [t for t in (_clean_table(t) for t in page.extract_tables(TEXT_TABLE_SETTINGS)) if _looks_like_text_table(t)]
+
+
+def extract_page_tables(source: PdfSource, start: int, stop: int) -> list[list[list[list[str]]]]:
+    """
+    Извлекает таблицы со страниц [start, stop) через pdfplumber.
+    Сначала ищутся таблицы по линиям разметки; если на странице их нет —
+    по кластеризации позиций слов (text-стратегия).
+    Возвращает для каждой страницы список таблиц (таблица — список строк ячеек).
+    """
+    pages = []
+    with pdfplumber.open(_open(source), pages=list(range(start + 1, stop + 1))) as pdf:
+        for page in pdf.pages:
+            pages.append(_page_tables(page))
+            page.close()
+    return pages
+
+
+def extract_page_content(
+    source: PdfSource, start: int, stop: int, backend: str = "pdfplumber"
+) -> list[tuple[list[list[list[str]]], list[str]]]:
+    """
+    Один проход для режима auto: для каждой страницы [start, stop) — (таблицы, строки текста).
+    Строки текста извлекаются только со страниц, на которых таблиц не нашлось.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {backend}")
+
+    pages = []
+    text_pdf = pdfium.PdfDocument(_open(source)) if backend == "pdfium" else None
+    try:
+        with pdfplumber.open(_open(source), pages=list(range(start + 1, stop + 1))) as pdf:
+            for idx, page in zip(range(start, stop), pdf.pages):
+                tables = _page_tables(page)
+                if tables:
+                    lines = []
+                elif text_pdf is not None:
+                    lines = _pdfium_lines(text_pdf, idx)
+                else:
+                    lines = _split_lines(page.extract_text() or "")
+                pages.append((tables, lines))
+                page.close()
+    finally:
+        if text_pdf is not None:
+            text_pdf.close()
+    return pages
@@ -1,63 +1,254 @@
 import logging
-from pathlib import Path
-from typing import Optional
-import pdfplumber
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional
 import pandas as pd
 import re
 
-from specs.services.ai.ai_helper import AIHelper
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.ai.chunking import DEFAULT_CHUNK_MAX_TOKENS, estimate_tokens
+from specs.services.parser.pdf_pages import (
+    count_pages,
+    extract_page_content,
+    extract_page_lines,
+    extract_page_tables,
+    is_number_cell,
+)
+from specs.services.parser.source import SpecSource, read_source
+from specs.services.processing.csv_utils import join_csv_tables
+from specs.services.processing.rule_mapper import RuleBasedNormalizer
+from specs.services.processing.spec_table import NormalizedTable
+from specs.services.utils.concurrency import DEFAULT_MAX_CONCURRENCY, map_concurrently, record_skipped_part
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TEXT_BACKEND = os.getenv("PDF_TEXT_BACKEND", "pdfplumber")
+# text — строки + регулярка, tables — только таблицы pdfplumber,
+# auto — постранично: страницы с таблицами как tables, остальные как text
+DEFAULT_PDF_MODE = os.getenv("PDF_MODE", "auto")
+DEFAULT_PDF_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+# Меньше этого числа страниц пул процессов не окупает запуск
+PROCESS_POOL_MIN_PAGES = 16
+
+
 class PDFParser:
     """
     Парсер PDF-файлов с табличными данными (например, коммерческих предложений),
     с возможностью постобработки и нормализации через AIHelper.
+
+    Режим tables: таблицы распознаются pdfplumber постранично, таблицы,
+    продолжающиеся на следующей странице, склеиваются; каждая таблица
+    нормализуется отдельно — локально, если колонки распознаны, иначе через GPT.
+
+    Режим text: текст извлекается диапазонами страниц (на больших PDF — в пуле
+    процессов), строки потоком идут в группировку, а готовые пачки позиций
+    отправляются на нормализацию, не дожидаясь конца документа.
+
+    Режим auto: за один проход по страницам у каждой страницы ищутся таблицы,
+    а страница без таблиц отдаёт свой текст в разбор режима text.
     """
 
-    def __init__(self, path: str, ai_helper: Optional[AIHelper] = None):
-        self.input_file = Path(path)
-        self.ai = ai_helper or AIHelper()
+    def __init__(
+        self,
+        path: SpecSource,
+        ai_helper: Optional[AIHelper] = None,
+        text_backend: str = DEFAULT_TEXT_BACKEND,
+        max_workers: int = DEFAULT_PDF_WORKERS,
+        pages_per_batch: int = 8,
+        max_chunk_tokens: int = DEFAULT_CHUNK_MAX_TOKENS,
+        max_concurrency: Optional[int] = None,
+        mode: str = DEFAULT_PDF_MODE,
+        rule_normalizer: Optional[RuleBasedNormalizer] = None,
+    ):
+        self.input_file, self.data = read_source(path)
+        self.ai = ai_helper or get_ai_helper()
+        self.mode = mode
+        self.rules = rule_normalizer or RuleBasedNormalizer()
+        self.text_backend = text_backend
+        self.max_workers = max(1, max_workers)
+        self.pages_per_batch = max(1, pages_per_batch)
+        self.max_chunk_tokens = max_chunk_tokens
+        self.max_concurrency = max_concurrency or DEFAULT_MAX_CONCURRENCY
 
-        if not self.input_file.exists():
+        if self.input_file is not None and not self.input_file.exists():
             raise FileNotFoundError(f"PDF file not found: {self.input_file}")
 
+    def _worker_source(self):
+        # путь к файлу или байты, если файла на диске нет
+        return self.data if self.data is not None else str(self.input_file)
+
+    @staticmethod
+    @contextmanager
+    def _spilled(source):
+        """
+        Путь для дочерних процессов: байты один раз сбрасываются во временный файл,
+        иначе они копировались бы в каждую задачу пула.
+        """
+        if not isinstance(source, bytes):
+            yield source
+            return
+
+        fd, path = tempfile.mkstemp(prefix="pdf-", suffix=".pdf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(source)
+            yield path
+        finally:
+            os.remove(path)
+
+    def _iter_pages(self, extractor: Callable) -> Iterator:
+        """
+        Отдаёт результаты extractor(source, start, stop) постранично, в порядке страниц.
+        Страницы обрабатываются диапазонами по pages_per_batch; при большом числе
+        страниц диапазоны обрабатываются параллельно в пуле процессов.
+        """
+        source = self._worker_source()
+        total_pages = count_pages(source)
+        ranges = [
+            (start, min(start + self.pages_per_batch, total_pages))
+            for start in range(0, total_pages, self.pages_per_batch)
+        ]
+
+        if self.max_workers == 1 or len(ranges) == 1 or total_pages < PROCESS_POOL_MIN_PAGES:
+            for start, stop in ranges:
+                yield from extractor(source, start, stop)
+        else:
+            yield from self._extract_pages_in_pool(extractor, source, ranges)
+
+    def _extract_pages_in_pool(self, extractor: Callable, source, ranges: list[tuple[int, int]]) -> Iterator:
+        """
+        Извлекает диапазоны страниц в пуле процессов. В работе одновременно
+        не больше 2 * max_workers диапазонов, результаты отдаются по порядку —
+        память ограничена окном, а не размером документа.
+        """
+        # spawn: веб-процесс многопоточный, fork в нём небезопасен
+        context = multiprocessing.get_context("spawn")
+        window = 2 * self.max_workers
+
+        with self._spilled(source) as source, \
+                ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context) as pool:
+            pending: deque[Future] = deque()
+            remaining = iter(ranges)
+
+            for start, stop in remaining:
+                pending.append(pool.submit(extractor, source, start, stop))
+                if len(pending) >= window:
+                    break
+
+            while pending:
+                pages = pending.popleft().result()
+                next_range = next(remaining, None)
+                if next_range is not None:
+                    pending.append(pool.submit(extractor, source, *next_range))
+                yield from pages
+
+    def _iter_text_lines(self) -> Iterator[str]:
+        """
+        Построчно отдаёт текст PDF в порядке страниц.
+        """
+        extractor = partial(extract_page_lines, backend=self.text_backend)
+        for page_num, page_lines in enumerate(self._iter_pages(extractor), start=1):
+            logger.debug(f"Page {page_num}: {len(page_lines)} lines extracted")
+            yield from page_lines
+
+    # --- Режим таблиц ---
+
+    def extract_tables(self) -> list[list[list[str]]]:
+        """
+        Извлекает структурированные таблицы всех страниц и склеивает
+        таблицы, разорванные переходом на следующую страницу.
+        """
+        return self._stitch_tables(list(self._iter_pages(extract_page_tables)))
+
+    @staticmethod
+    def _stitch_tables(pages: list[list[list[list[str]]]]) -> list[list[list[str]]]:
+        """
+        Первая таблица страницы продолжает последнюю таблицу предыдущей, если
+        у них одинаковое число колонок и она начинается не с заголовка — со строки
+        данных или с повтора заголовка предыдущей таблицы (повтор отбрасывается).
+        Таблица со своим заголовком — отдельная таблица.
+        """
+        tables: list[list[list[str]]] = []
+        prev_page_had_tail = False
+
+        for page_tables in pages:
+            for idx, table in enumerate(page_tables):
+                width = max(map(len, table))
+                prev = tables[-1] if idx == 0 and prev_page_had_tail else None
+                repeated_header = prev is not None and table[0] == prev[0]
+                if (
+                    prev is not None
+                    and max(map(len, prev)) == width
+                    and (repeated_header or not PDFParser._is_header_row(table[0]))
+                ):
+                    prev.extend(table[1:] if repeated_header else table)
+                else:
+                    tables.append([list(row) for row in table])
+            prev_page_had_tail = bool(page_tables)
+
+        return tables
+
+    @staticmethod
+    def _is_header_row(row: list[str]) -> bool:
+        # заголовок — несколько подписей без единого числа; строка данных содержит
+        # номер позиции или количество, строка-продолжение — обычно одну ячейку
+        cells = [cell for cell in row if cell]
+        return len(cells) >= 2 and not any(is_number_cell(cell) for cell in cells)
+
+    def _normalize_table(self, table: list[list[str]]) -> Optional[NormalizedTable]:
+        """
+        Таблица с распознаваемыми колонками нормализуется локально,
+        неоднозначная — отправляется в GPT.
+        """
+        return self.rules.try_normalize(table) or self.ai.normalize_table_from_text(table)
+
+    def parse_tables(self) -> Optional[NormalizedTable]:
+        """
+        Режим таблиц: каждая таблица нормализуется отдельно и параллельно.
+        Возвращает общий CSV или None, если таблиц не найдено.
+        """
+        return self._normalize_tables(self.extract_tables())
+
+    def _normalize_tables(self, tables: list[list[list[str]]]) -> Optional[NormalizedTable]:
+        if not tables:
+            return None
+
+        logger.info(f"Detected {len(tables)} tables in PDF")
+        results = map_concurrently(self._normalize_table, tables, self.max_concurrency)
+        return join_csv_tables([csv_text for csv_text in results if csv_text])
+
+    # --- Режим текста ---
+
     def _extract_text_lines(self) -> list[str]:
         """
         Извлекает все строки текста из PDF.
         """
-        lines = []
-        with pdfplumber.open(self.input_file) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                text = page.extract_text()
-                if not text:
-                    continue
-                page_lines = [line.strip() for line in text.split("\n") if line.strip()]
-                lines.extend(page_lines)
-                logger.debug(f"Page {page_num}: {len(page_lines)} lines extracted")
-        return lines
+        return list(self._iter_text_lines())
 
-    def _group_table_rows(self, lines: list[str]) -> list[str]:
+    def _group_table_rows(self, lines: Iterable[str]) -> Iterator[str]:
         """
         Группирует строки таблицы, объединяя многострочные описания в одну запись.
         Эвристика: строка начинается с числа — это начало новой позиции.
+        Работает потоково: запись отдаётся, как только началась следующая.
         """
-        rows = []
         buffer = ""
 
         for line in lines:
             # начало новой строки таблицы
             if re.match(r"^\d+\s", line):
                 if buffer:
-                    rows.append(buffer.strip())
+                    yield buffer.strip()
                 buffer = line
             else:
                 buffer += " " + line.strip()
         if buffer:
-            rows.append(buffer.strip())
-
-        logger.info(f"Grouped into {len(rows)} table rows")
-        return rows
+            yield buffer.strip()
 
     def _parse_rows_to_df(self, rows: list[str]) -> pd.DataFrame:
         """
@@ -89,30 +280,123 @@ class PDFParser:
         )
         return df
 
-    def parse(self) -> Optional[str]:
+    def _normalize_rows(self, rows: list[str]) -> Optional[NormalizedTable]:
         """
-        Основной метод: извлекает таблицу из PDF, нормализует и возвращает CSV.
+        Пачка сгруппированных строк -> DataFrame -> нормализация через GPT.
         """
-        lines = self._extract_text_lines()
+        df = self._parse_rows_to_df(rows)
 
-        if not lines:
-            logger.warning("PDF is empty or unreadable")
+        # очистка
+        df = df.dropna(how="all")
+        df = df[df["Наименование"].notna()]
+        if df.empty:
             return None
 
-        table_lines = self._group_table_rows(lines)
-        if not table_lines:
-            logger.warning("No table-like rows found in PDF")
-            return None
+        # нормализация через GPT (если нужно)
+        return self.ai.normalize_table_from_text([list(df.columns)] + df.fillna("").values.tolist())
 
-        df = self._parse_rows_to_df(table_lines)
+    def parse(self) -> Optional[NormalizedTable]:
+        """
+        Основной метод: извлекает таблицу из PDF, нормализует и возвращает CSV.
+        """
+        if self.mode == "tables":
+            return self.parse_tables()
+        if self.mode == "text":
+            return self.parse_text()
+        return self.parse_auto()
 
-        # очистка
-        df = df.dropna(how="all")
-        df = df[df["Наименование"].notna()]
+    def parse_auto(self) -> Optional[NormalizedTable]:
+        """
+        Режим auto: страницы извлекаются один раз. Таблицы страниц склеиваются
+        и нормализуются как в режиме tables, текст страниц без таблиц идёт
+        в разбор режима text. Решение принимается по содержимому страниц,
+        а не по ответам GPT, поэтому одинаково и для отложенных ответов (Batch).
+        """
+        page_tables: list[list[list[list[str]]]] = []
 
-        csv_raw = df.to_csv(index=False, sep=";", encoding="utf-8-sig")
+        def text_lines() -> Iterator[str]:
+            extractor = partial(extract_page_content, backend=self.text_backend)
+            for page_num, (tables, lines) in enumerate(self._iter_pages(extractor), start=1):
+                logger.debug(f"Page {page_num}: {len(tables)} tables, {len(lines)} text lines")
+                page_tables.append(tables)
+                yield from lines
 
-        # нормализация через GPT (если нужно)
-        normalized_csv = self.ai.normalize_table_from_csv(csv_raw)
+        text_result = self._normalize_lines(text_lines(), warn_if_empty=False)
+        tables_result = self._normalize_tables(self._stitch_tables(page_tables))
+        if tables_result is None and text_result is None:
+            logger.warning("No tables or table-like rows found in PDF")
+        return join_csv_tables([result for result in (tables_result, text_result) if result])
+
+    def parse_text(self) -> Optional[NormalizedTable]:
+        """
+        Режим текста: пачки строк (по бюджету токенов) уходят на нормализацию
+        по мере извлечения страниц; результаты склеиваются в исходном порядке.
+        """
+        return self._normalize_lines(self._iter_text_lines())
+
+    def _normalize_lines(self, lines: Iterable[str], warn_if_empty: bool = True) -> Optional[NormalizedTable]:
+        line_count = 0
+
+        def counted(lines: Iterable[str]) -> Iterator[str]:
+            nonlocal line_count
+            for line in lines:
+                line_count += 1
+                yield line
+
+        futures: list[Future] = []
+        row_count = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            batch: list[str] = []
+            batch_tokens = 0
+
+            for row in self._group_table_rows(counted(lines)):
+                row_count += 1
+                row_tokens = estimate_tokens(row)
+                if batch and batch_tokens + row_tokens > self.max_chunk_tokens:
+                    futures.append(pool.submit(self._normalize_rows, batch))
+                    batch, batch_tokens = [], 0
+                batch.append(row)
+                batch_tokens += row_tokens
+
+            if batch:
+                futures.append(pool.submit(self._normalize_rows, batch))
+
+            if not line_count:
+                if warn_if_empty:
+                    logger.warning("PDF is empty or unreadable")
+                return None
+
+            if not row_count:
+                if warn_if_empty:
+                    logger.warning("No table-like rows found in PDF")
+                return None
+
+            logger.info(f"Grouped into {row_count} table rows, {len(futures)} normalization batches")
+            return join_csv_tables(self._collect(futures))
+
+    @staticmethod
+    def _collect(futures: list[Future]) -> list[NormalizedTable]:
+        """
+        Результаты пачек по порядку. Упавшая пачка пропускается;
+        если упали все — пробрасывается последняя ошибка.
+        """
+        results = []
+        failed = []
+        last_error = None
+        for idx, future in enumerate(futures, start=1):
+            try:
+                csv_text = future.result()
+            except Exception as e:
+                logger.warning(f"PDF batch {idx}/{len(futures)} failed: {e}")
+                failed.append(f"PDF batch {idx}/{len(futures)}: {e}")
+                last_error = e
+                continue
+            if csv_text:
+                results.append(csv_text)
 
-        return normalized_csv
+        if last_error is not None and not results:
+            raise last_error
+        for description in failed:
+            record_skipped_part(description)
+        return results
@@ -0,0 +1,177 @@
+"""
+Реестр парсеров: формат файла -> парсер.
+
+Модуль парсера импортируется при первом файле своего формата, а не при
+старте процесса: pdfplumber/pypdfium2, python-docx, Wand и Pillow
+загружаются только в тех воркерах, которые такие файлы действительно
+обрабатывают. Время загрузки каждого парсера запоминается (loaded_parsers,
+команда `manage.py parser_imports`).
+
+Формат определяется по сигнатуре содержимого, а если она не распознана —
+по расширению имени файла: переименованный файл (xlsx с расширением .xls,
+PDF без расширения) всё равно попадает в свой парсер.
+"""
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from specs.services.parser.source import SpecSource, open_source, read_source
+from specs.services.processing.spec_table import NormalizedTable
+
+logger = logging.getLogger(__name__)
+
+# Сколько байт начала файла смотреть при определении формата
+SNIFF_BYTES = 8192
+
+
+def _single(table: Optional[NormalizedTable]) -> list[NormalizedTable]:
+    return [table] if table else []
+
+
+@dataclass(frozen=True)
+class ParserSpec:
+    name: str
+    module: str
+    class_name: str
+    extensions: tuple[str, ...]
+    # вызов парсера: экземпляр -> список нормализованных таблиц
+    run: Callable[[object], list[NormalizedTable]]
+
+
+PARSERS = (
+    ParserSpec("docx", "specs.services.parser.docx_parser", "DocxParser", (".docx",),
+               lambda parser: parser.parse_all()),
+    ParserSpec("excel", "specs.services.parser.excel_parser", "ExcelParser", (".xls", ".xlsx"),
+               lambda parser: _single(parser.parse_all_sheets())),
+    ParserSpec("txt", "specs.services.parser.txt_parser", "TxtParser", (".txt",),
+               lambda parser: [parser.normalize()]),
+    ParserSpec("pdf", "specs.services.parser.pdf_parser", "PDFParser", (".pdf",),
+               lambda parser: [parser.parse()]),
+    ParserSpec("jpg", "specs.services.parser.jpg_parser", "JpgParser", (".jpg", ".jpeg"),
+               lambda parser: [parser.parse()]),
+)
+_BY_NAME = {spec.name: spec for spec in PARSERS}
+_BY_EXTENSION = {ext: spec for spec in PARSERS for ext in spec.extensions}
+
+SUPPORTED_EXTENSIONS = tuple(_BY_EXTENSION)
+
+_loaded: dict[str, type] = {}
+_load_report: dict[str, dict] = {}
+_load_lock = threading.Lock()
+
+
+def _zip_format(source: SpecSource) -> Optional[str]:
+    # docx и xlsx — ZIP-контейнеры, различаются каталогом с содержимым
+    path, data = read_source(source)
+    try:
+        with zipfile.ZipFile(open_source(path, data)) as zf:
+            names = zf.namelist()
+    except zipfile.BadZipFile:
+        return None
+    if any(name.startswith("word/") for name in names):
+        return "docx"
+    if any(name.startswith("xl/") for name in names):
+        return "excel"
+    return None
+
+
+def _head(source: SpecSource) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:SNIFF_BYTES])
+    if hasattr(source, "read"):
+        position = source.tell()
+        head = source.read(SNIFF_BYTES)
+        source.seek(position)
+        return head
+    with open(source, "rb") as f:
+        return f.read(SNIFF_BYTES)
+
+
+def sniff_format(source: SpecSource) -> Optional[str]:
+    """
+    Имя парсера по сигнатуре содержимого или None, если формат не распознан.
+    Текст (UTF-8 без нулевых байтов) сигнатуры не имеет — его определяет guess_format.
+    """
+    head = _head(source)
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head.startswith(b"PK\x03\x04"):
+        return _zip_format(source)
+    # OLE2 (старые .xls и .doc): книга Excel содержит поток Workbook
+    if head.startswith(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1") and "Workbook".encode("utf-16-le") in head:
+        return "excel"
+    return None
+
+
+def _looks_like_text(head: bytes) -> bool:
+    if b"\0" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # начало файла может оборвать многобайтовый символ
+        return e.reason == "unexpected end of data"
+    return True
+
+
+def guess_format(source: SpecSource, filename: str) -> str:
+    """
+    Имя парсера для файла: по содержимому, иначе по расширению,
+    иначе txt для текстового содержимого.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    by_extension = _BY_EXTENSION.get(ext)
+    sniffed = sniff_format(source)
+
+    if sniffed is not None:
+        if by_extension is not None and by_extension.name != sniffed:
+            logger.warning(f"{filename}: content looks like {sniffed}, not {ext}")
+        return sniffed
+    if by_extension is not None:
+        return by_extension.name
+    if _looks_like_text(_head(source)):
+        return "txt"
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def get_parser_class(name: str) -> type:
+    """
+    Класс парсера; модуль импортируется при первом обращении.
+    """
+    spec = _BY_NAME[name]
+    with _load_lock:
+        if name not in _loaded:
+            modules_before = len(sys.modules)
+            started = time.perf_counter()
+            module = importlib.import_module(spec.module)
+            elapsed = time.perf_counter() - started
+            _loaded[name] = getattr(module, spec.class_name)
+            _load_report[name] = {"seconds": elapsed, "modules": len(sys.modules) - modules_before}
+            logger.info(f"Parser {name} loaded in {elapsed:.3f}s ({len(sys.modules) - modules_before} modules)")
+        return _loaded[name]
+
+
+def loaded_parsers() -> dict[str, dict]:
+    """
+    Загруженные в этом процессе парсеры: время импорта (сек.) и число новых модулей.
+    """
+    with _load_lock:
+        return {name: dict(info) for name, info in _load_report.items()}
+
+
+def parse_source(source: SpecSource, filename: str, ai_helper=None) -> list[NormalizedTable]:
+    """
+    Разбирает файл подходящим парсером и возвращает список таблиц.
+    ai_helper передаётся парсеру как есть (None — общий для процесса).
+    """
+    spec = _BY_NAME[guess_format(source, filename)]
+    parser = get_parser_class(spec.name)(source, ai_helper=ai_helper)
+    return spec.run(parser)
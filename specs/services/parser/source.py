@@ -0,0 +1,31 @@
+import os
+from io import BytesIO
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+# Источник для парсера: путь к файлу, байты или бинарный file-like объект
+SpecSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+
+def read_source(source: SpecSource) -> tuple[Optional[Path], Optional[bytes]]:
+    """
+    Разбирает источник парсера.
+    Возвращает (путь, None) для файла на диске или (None, байты) для буфера.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return Path(source), None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return None, bytes(source)
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return None, source.read()
+    raise TypeError(f"Unsupported parser source: {type(source).__name__}")
+
+
+def open_source(path: Optional[Path], data: Optional[bytes]) -> Union[Path, BytesIO]:
+    """
+    Возвращает то, что можно передать в Document / pd.read_excel / pdfplumber.open / Image.open:
+    путь к файлу или свежий BytesIO поверх буфера.
+    """
+    return BytesIO(data) if data is not None else path
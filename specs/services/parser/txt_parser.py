@@ -1,6 +1,10 @@
 import re
-from pathlib import Path
-from specs.services.ai.ai_helper import AIHelper
+from typing import Optional
+
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.parser.source import SpecSource, read_source
+from specs.services.processing.rule_mapper import RuleBasedNormalizer
+from specs.services.processing.spec_table import NormalizedTable
 
 
 class TxtParser:
@@ -8,14 +12,20 @@ class TxtParser:
     Простой TXT-парсер:
     1) Извлекает строки
     2) Пытается преобразовать в таблицы (по разделителям ; , \t | пробелы)
-    3) Прогоняет через GPT для нормализации
+    3) Если колонки распознаются локально — нормализует без GPT,
+       иначе прогоняет через GPT для нормализации
     """
 
-    def __init__(self, path: str, ai_helper: AIHelper = None):
-        self.path = Path(path)
-        self.ai = ai_helper or AIHelper()
+    def __init__(self, path: SpecSource, ai_helper: AIHelper = None, rule_normalizer: Optional[RuleBasedNormalizer] = None):
+        self.path, self.data = read_source(path)
+        self.ai = ai_helper or get_ai_helper()
+        self.rules = rule_normalizer or RuleBasedNormalizer()
 
     def extract_lines(self) -> list[str]:
+        if self.data is not None:
+            text = self.data.decode("utf-8", errors="ignore")
+            return [line.rstrip() for line in text.splitlines() if line.strip()]
+
         with open(self.path, "r", encoding="utf-8", errors="ignore") as f:
             return [line.rstrip() for line in f if line.strip()]
 
@@ -37,9 +47,9 @@ class TxtParser:
             rows.append([p.strip() for p in parts])
         return rows
 
-    def normalize(self) -> str:
+    def normalize(self) -> NormalizedTable:
         """
-        Возвращает одну CSV-таблицу (строка) после GPT-нормализации
+        Возвращает одну таблицу после GPT-нормализации (CSV-строка или SpecTable)
         """
         lines = self.extract_lines()
         if not lines:
@@ -47,9 +57,10 @@ class TxtParser:
 
         raw_rows = self.split_into_rows(lines)
 
-        # превращаем в CSV-текст
-        csv_text = "\n".join([";".join(row) for row in raw_rows])
+        # быстрый путь без GPT для уже структурированных таблиц
+        rule_csv = self.rules.try_normalize(raw_rows)
+        if rule_csv:
+            return rule_csv
 
         # нормализуем через GPT
-        normalized_csv = self.ai.normalize_table_from_csv(csv_text)
-        return normalized_csv
+        return self.ai.normalize_table_from_text(raw_rows)
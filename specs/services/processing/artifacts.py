@@ -0,0 +1,135 @@
+"""
+Промежуточные результаты запуска на диске (MEDIA_ROOT/runs/<id>/artifacts).
+
+- responses/ — ответы GPT по ключу запроса: повторный прогон того же запуска
+  не платит за уже полученные ответы, даже если общий кэш выключен или вытеснен;
+- tables/ — нормализованные таблицы файла (CSV-текст или JSON SpecTable),
+  у пакетного запуска — и sources.json с исходным файлом каждой таблицы;
+- consolidated.csv.gz — итоговая таблица после консолидации.
+
+manifest.json отмечает завершённые этапы: перезапуск продолжает с последнего
+завершённого, повторная выгрузка в другой формат не запускает обработку заново.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+
+from specs.services.processing.spec_table import NormalizedTable, SpecTable
+
+logger = logging.getLogger(__name__)
+
+STAGE_TABLES = "tables"
+STAGE_CONSOLIDATED = "consolidated"
+
+_response_store: contextvars.ContextVar[Optional["RunArtifacts"]] = contextvars.ContextVar(
+    "response_store", default=None
+)
+
+
+def _write_atomic(path: Path, data: bytes):
+    # запись во временный файл и переименование: оборванная запись не оставит битый артефакт
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class RunArtifacts:
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, media_root: str, run_id: int) -> "RunArtifacts":
+        return cls(os.path.join(media_root, "runs", str(run_id), "artifacts"))
+
+    # --- этапы ---
+
+    def _manifest(self) -> dict:
+        path = self.root / "manifest.json"
+        if not path.exists():
+            return {"stages": {}}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def completed(self, stage: str) -> bool:
+        return stage in self._manifest()["stages"]
+
+    def _mark(self, stage: str, **info):
+        with self._lock:
+            manifest = self._manifest()
+            manifest["stages"][stage] = {"completed_at": time.time(), **info}
+            _write_atomic(self.root / "manifest.json", json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+        logger.info(f"Artifacts {self.root}: stage {stage} completed")
+
+    # --- ответы GPT ---
+
+    def get_response(self, key: str) -> Optional[str]:
+        path = self.root / "responses" / f"{key}.txt"
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def put_response(self, key: str, text: str):
+        _write_atomic(self.root / "responses" / f"{key}.txt", text.encode("utf-8"))
+
+    # --- таблицы ---
+
+    def save_tables(self, tables: list[NormalizedTable], sources: Optional[list[str]] = None):
+        for idx, table in enumerate(tables):
+            if isinstance(table, SpecTable):
+                _write_atomic(self.root / STAGE_TABLES / f"{idx:04d}.json", table.model_dump_json().encode("utf-8"))
+            else:
+                _write_atomic(self.root / STAGE_TABLES / f"{idx:04d}.csv", (table or "").encode("utf-8"))
+        if sources is not None:
+            _write_atomic(self.root / STAGE_TABLES / "sources.json", json.dumps(sources, ensure_ascii=False).encode("utf-8"))
+        self._mark(STAGE_TABLES, count=len(tables))
+
+    def load_tables(self) -> list[NormalizedTable]:
+        tables: list[NormalizedTable] = []
+        for path in sorted((self.root / STAGE_TABLES).glob("[0-9]*.*")):
+            text = path.read_text(encoding="utf-8")
+            tables.append(SpecTable.model_validate_json(text) if path.suffix == ".json" else text)
+        return tables
+
+    def load_sources(self) -> Optional[list[str]]:
+        path = self.root / STAGE_TABLES / "sources.json"
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    # --- итоговая таблица ---
+
+    def save_frame(self, df: pd.DataFrame):
+        # все колонки итоговой таблицы — строки, поэтому CSV сохраняет их без потерь
+        path = self.root / f"{STAGE_CONSOLIDATED}.csv.gz"
+        tmp = path.with_name(f".{path.name}.tmp")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.to_csv(tmp, sep=";", index=False, encoding="utf-8", compression="gzip")
+        os.replace(tmp, path)
+        self._mark(STAGE_CONSOLIDATED, rows=len(df))
+
+    def load_frame(self) -> pd.DataFrame:
+        return pd.read_csv(
+            self.root / f"{STAGE_CONSOLIDATED}.csv.gz", sep=";", dtype=str, keep_default_na=False, compression="gzip"
+        )
+
+
+@contextmanager
+def record_responses_to(artifacts: Optional[RunArtifacts]) -> Iterator[None]:
+    """
+    Пока контекст открыт, AIHelper сначала ищет ответ в артефактах запуска
+    и сохраняет туда каждый новый ответ (в том числе из потоков map_concurrently).
+    """
+    token = _response_store.set(artifacts)
+    try:
+        yield
+    finally:
+        _response_store.reset(token)
+
+
+def get_response_store() -> Optional[RunArtifacts]:
+    return _response_store.get()
@@ -1,13 +1,86 @@
+import logging
+import os
+import re
+
 import numpy as np
 import pandas as pd
 from io import StringIO
+from typing import Optional
+
+from specs.services.processing.fuzzy_dedupe import DEFAULT_THRESHOLD, find_fuzzy_groups
+from specs.services.processing.rule_mapper import canonical_unit
+from specs.services.processing.spec_table import NormalizedTable, SpecTable, format_quantity
+
+logger = logging.getLogger(__name__)
+
+CONSOLIDATION_ENABLED = os.getenv("CONSOLIDATION_ENABLED", "True") == "True"
+# Нечёткое объединение похожих позиций после точного (fuzzy_dedupe)
+CONSOLIDATION_FUZZY = os.getenv("CONSOLIDATION_FUZZY", "False") == "True"
+FUZZY_AUDIT_COLUMN = "Объединено с"
+# Исходный файл позиции при пакетной обработке нескольких файлов
+SOURCE_COLUMN = "Источник"
+
+TECH_SPEC_SEPARATOR = " | "
+
+# пробелы-разделители разрядов: обычный, неразрывный, узкий неразрывный
+_THOUSANDS_SEP_RE = re.compile(r"[\s\u00a0\u202f]")
+
+
+def parse_quantities(values: pd.Series) -> pd.Series:
+    """
+    Количества из строк вида "1 500,5", "2.5", "10": убираются пробелы
+    между разрядами, запятая становится точкой. Нечисловые значения — NaN.
+    Строки чистятся по уникальным значениям, число — векторно pd.to_numeric.
+    """
+    cleaned = _map_unique(values.astype(str), lambda v: _THOUSANDS_SEP_RE.sub("", v).replace(",", "."))
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def _map_unique(values: pd.Series, func) -> pd.Series:
+    # функция применяется к уникальным значениям, а не к каждой строке
+    codes, uniques = pd.factorize(values, sort=False, use_na_sentinel=False)
+    mapped = np.array([func(v) for v in uniques], dtype=object)
+    return pd.Series(mapped[codes] if len(codes) else [], index=values.index, dtype=object)
+
+
+def _join_per_group(group: np.ndarray, values: np.ndarray, groups: int) -> np.ndarray:
+    """
+    Уникальные непустые значения каждой группы через TECH_SPEC_SEPARATOR в порядке появления.
+    Склейка — строковой суммой groupby (в C), а не вызовом join на каждую группу.
+    """
+    pairs = pd.DataFrame({"group": group, "value": values})
+    pairs = pairs[pairs["value"].ne("")].drop_duplicates()
+    joined = (TECH_SPEC_SEPARATOR + pairs["value"]).groupby(pairs["group"].to_numpy()).sum()
+    joined = joined.str.slice(len(TECH_SPEC_SEPARATOR))
+    return joined.reindex(range(groups), fill_value="").to_numpy()
+
+
+def _format_sum(value: float) -> str:
+    return "" if pd.isna(value) else format_quantity(value)
+
+
+def text_key(value: str) -> str:
+    """
+    Текст для сравнения: без учёта регистра, ё/е и лишних пробелов.
+    """
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def _normalize_key(values: pd.Series) -> pd.Series:
+    return _map_unique(values.astype(str), text_key)
+
+
+def _canonical_units(values: pd.Series) -> pd.Series:
+    return _map_unique(values.astype(str), canonical_unit)
+
 
 class ConsolidatorV2:
     """
     - Работает напрямую со списком CSV-строк (без промежуточных файлов)
+      или типизированных таблиц SpecTable (structured outputs, без разбора CSV)
     - Удаляет повторяющиеся заголовки
-    - Консолидирует дубли по ключевым полям
-    - Сортирует по № как числовому
+    - Консолидирует дубли по нормализованным ключевым полям (отключается CONSOLIDATION_ENABLED=False)
+    - Опционально объединяет почти одинаковые позиции (CONSOLIDATION_FUZZY=True)
     - Сбрасывает индекс и возвращает DataFrame в фиксированном виде
     """
 
@@ -25,17 +98,33 @@ class ConsolidatorV2:
         HEADERS["unit"],
     ]
 
-    def _load_tables(self, csv_tables: list[str]) -> pd.DataFrame:
+    def __init__(
+        self,
+        consolidate: Optional[bool] = None,
+        fuzzy: Optional[bool] = None,
+        fuzzy_threshold: float = DEFAULT_THRESHOLD,
+    ):
+        self.consolidate = CONSOLIDATION_ENABLED if consolidate is None else consolidate
+        self.fuzzy = CONSOLIDATION_FUZZY if fuzzy is None else fuzzy
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def _load_tables(self, csv_tables: list[NormalizedTable], sources: Optional[list[str]] = None) -> pd.DataFrame:
         dfs = []
-        for csv_text in csv_tables:
-            df = pd.read_csv(StringIO(csv_text), sep=";", dtype=str, keep_default_na=False)
+        for idx, csv_text in enumerate(csv_tables):
+            if isinstance(csv_text, SpecTable):
+                df = csv_text.to_dataframe()
+            else:
+                df = pd.read_csv(StringIO(csv_text), sep=";", dtype=str, keep_default_na=False)
+            if sources is not None:
+                df[SOURCE_COLUMN] = sources[idx]
             dfs.append(df)
 
         combined = pd.concat(dfs, ignore_index=True)
 
         # Удаляем строки, которые полностью равны заголовку
-        header_row = list(self.HEADERS.values())
-        combined = combined[~(combined.astype(str).eq(header_row).all(axis=1))]
+        header_row = [col for col in self.HEADERS.values() if col in combined.columns]
+        is_header = combined[header_row].astype(str).eq(pd.Series(header_row, index=header_row)).all(axis=1)
+        combined = combined[~is_header]
 
         return combined
 
@@ -51,41 +140,113 @@ class ConsolidatorV2:
 
     def _consolidate(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        Группирует по ключевым колонкам и суммирует количество.
+        Объединяет одинаковые позиции: суммирует количество, собирает
+        уникальные технические задания через TECH_SPEC_SEPARATOR.
+        Позиции совпадают, если совпадают нормализованные ключи
+        (регистр, пробелы, ё/е, синонимы единиц измерения).
+        Строки с нечисловым количеством («по потребности») не объединяются.
+        Всё считается векторно: ключи — через factorize уникальных значений,
+        агрегаты — groupby без Python-функций на группу.
+        """
+        ordered_columns = list(self.HEADERS.values())
+        missing = [col for col in ordered_columns if col not in df.columns]
+        if missing:
+            logger.warning(f"Consolidation skipped, missing columns: {missing}")
+            return df.reset_index(drop=True)
+
+        extra = [SOURCE_COLUMN] if SOURCE_COLUMN in df.columns else []
+        df = df[ordered_columns + extra].reset_index(drop=True)
+        raw_quantity, quantity, unparsed = self._quantities(df)
+
+        keys = pd.DataFrame({
+            "designation": _normalize_key(df[self.HEADERS["designation"]]),
+            "name": _normalize_key(df[self.HEADERS["name"]]),
+            "unit": _canonical_units(df[self.HEADERS["unit"]]),
+            "own": np.where(unparsed, np.arange(len(df)), -1),
+        })
+        # sort=False: номера групп идут в порядке первого появления позиции
+        group = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+
+        consolidated = self._aggregate(df, group, raw_quantity, quantity, unparsed)
+        if len(consolidated) < len(df):
+            logger.info(f"Consolidated {len(df)} rows into {len(consolidated)} positions")
+        return consolidated
+
+    def _fuzzy_merge(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Объединяет почти одинаковые позиции (опечатки, пробелы, латиница вместо кириллицы)
+        по сходству n-грамм «Обозначение + Наименование» (fuzzy_dedupe, MinHash LSH).
+        Сравниваются только позиции с одной единицей измерения, числовым количеством
+        и одинаковыми числами в тексте (размеры, номиналы).
+        Строка получает название первой из вариантов, остальные варианты
+        перечисляются в колонке FUZZY_AUDIT_COLUMN.
+        """
+        raw_quantity, quantity, unparsed = self._quantities(df)
+        texts = df[self.HEADERS["designation"]].astype(str) + " " + df[self.HEADERS["name"]].astype(str)
+        blocks = pd.factorize(_canonical_units(df[self.HEADERS["unit"]]))[0]
+        # позиции с нечисловым количеством — каждая в своём блоке
+        blocks[unparsed] = blocks.max(initial=0) + 1 + np.arange(unparsed.sum())
+
+        group = find_fuzzy_groups(texts.tolist(), blocks, self.fuzzy_threshold)
+        merged = self._aggregate(df, group, raw_quantity, quantity, unparsed)
+
+        first = ~pd.Series(group).duplicated().to_numpy()
+        variants = texts.str.strip().to_numpy()
+        merged[FUZZY_AUDIT_COLUMN] = _join_per_group(group[~first], variants[~first], len(merged))
+        if len(merged) < len(df):
+            logger.info(f"Fuzzy merge: {len(df)} positions into {len(merged)}")
+        return merged
+
+    def _quantities(self, df: pd.DataFrame) -> tuple[pd.Series, pd.Series, np.ndarray]:
+        raw_quantity = df[self.HEADERS["quantity"]].astype(str).str.strip()
+        quantity = parse_quantities(raw_quantity)
+        # нечисловое непустое количество делает строку отдельной позицией
+        unparsed = (quantity.isna() & raw_quantity.ne("")).to_numpy()
+        return raw_quantity, quantity, unparsed
+
+    def _aggregate(
+        self,
+        df: pd.DataFrame,
+        group: np.ndarray,
+        raw_quantity: pd.Series,
+        quantity: pd.Series,
+        unparsed: np.ndarray,
+    ) -> pd.DataFrame:
         """
-        df[self.HEADERS["quantity"]] = pd.to_numeric(
-            df[self.HEADERS["quantity"]], errors="coerce"
-        ).fillna(0)
-
-        consolidated = (
-            df.groupby(self.KEY_COLUMNS, as_index=False)
-            .agg({
-                self.HEADERS["quantity"]: "sum",
-                self.HEADERS["tech_spec"]: lambda x: " | ".join(
-                    sorted(set(map(str, x)))
-                ),
-            })
-        )
-
-        # Переставляем колонки в нужном порядке
-        ordered_columns = [
-            self.HEADERS["designation"],
-            self.HEADERS["name"],
-            self.HEADERS["unit"],
-            self.HEADERS["quantity"],
-            self.HEADERS["tech_spec"],
-        ]
-        consolidated = consolidated[ordered_columns]
-
-        return consolidated.reset_index(drop=True)
-
-    def merge_and_consolidate(self, csv_tables: list[str]) -> pd.DataFrame:
+        Одна строка на группу (номера групп — в порядке первого появления):
+        ключевые поля первой строки, сумма количеств, уникальные ТЗ.
+        """
+        quantity_col, tech_col = self.HEADERS["quantity"], self.HEADERS["tech_spec"]
+
+        first = ~pd.Series(group).duplicated().to_numpy()
+        consolidated = df.loc[first, self.KEY_COLUMNS].reset_index(drop=True)
+
+        sums = pd.Series(quantity.to_numpy()).groupby(group).sum(min_count=1)
+        consolidated[quantity_col] = _map_unique(sums, _format_sum).to_numpy()
+        has_text = unparsed[first]
+        consolidated.loc[has_text, quantity_col] = raw_quantity.to_numpy()[first][has_text]
+
+        consolidated[tech_col] = _join_per_group(group, df[tech_col].astype(str).to_numpy(), len(consolidated))
+        columns = list(self.HEADERS.values())
+        if SOURCE_COLUMN in df.columns:
+            consolidated[SOURCE_COLUMN] = _join_per_group(group, df[SOURCE_COLUMN].astype(str).to_numpy(), len(consolidated))
+            columns.append(SOURCE_COLUMN)
+        return consolidated[columns]
+
+    def merge_and_consolidate(
+        self, csv_tables: list[NormalizedTable], sources: Optional[list[str]] = None
+    ) -> pd.DataFrame:
         """
         Основной метод для объединения всех таблиц.
+        sources — имя исходного файла для каждой таблицы (пакетная обработка):
+        оно попадает в колонку SOURCE_COLUMN, у объединённых позиций — через TECH_SPEC_SEPARATOR.
         """
-        df = self._load_tables(csv_tables)
+        df = self._load_tables(csv_tables, sources)
         df = self._normalize_text(df)
-        # df = self._consolidate(df)
+        if self.consolidate:
+            df = self._consolidate(df)
+            if self.fuzzy and self.HEADERS["quantity"] in df.columns:
+                df = self._fuzzy_merge(df)
         return df
 
 # if __name__ == "__main__":
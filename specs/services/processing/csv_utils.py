@@ -0,0 +1,77 @@
+from typing import Optional
+
+from specs.services.processing.spec_table import NormalizedTable, SpecTable, as_csv
+
+
+def join_csv_tables(csv_list: list[NormalizedTable]) -> Optional[NormalizedTable]:
+    """
+    Склеивает несколько CSV с одинаковым заголовком в один:
+    заголовок берётся из первого CSV, у остальных он отбрасывается.
+    Типизированные таблицы (SpecTable) склеиваются без перевода в текст,
+    смесь с CSV приводится к CSV.
+    Если список пуст, возвращает None.
+    """
+    if not csv_list:
+        return None
+
+    if all(isinstance(table, SpecTable) for table in csv_list):
+        return SpecTable.concat(csv_list)
+    csv_list = [as_csv(table) for table in csv_list]
+
+    # Берем заголовок из первого CSV
+    header, *first_rows = csv_list[0].splitlines()
+
+    # Остальные CSV — берем только строки без заголовка
+    rows = first_rows.copy()
+    for csv in csv_list[1:]:
+        rows.extend(csv.splitlines()[1:])  # пропускаем заголовок
+
+    # Собираем обратно
+    return "\n".join([header] + rows)
+
+
+def _row_key(line: str) -> str:
+    return ";".join(" ".join(cell.split()) for cell in line.casefold().split(";"))
+
+
+def _overlap(previous: list[str], part: list[str], limit: int) -> int:
+    keys = [_row_key(line) for line in part[:limit]]
+    tail = [_row_key(line) for line in previous[-limit:]] if limit > 0 else []
+    for k in range(min(len(tail), len(keys)), 0, -1):
+        if tail[-k:] == keys[:k]:
+            return k
+    return 0
+
+
+def join_overlapping_csv_tables(
+    csv_list: list[NormalizedTable],
+    overlap_rows: Optional[list[int]] = None,
+    max_overlap_rows: int = 5,
+) -> Optional[NormalizedTable]:
+    """
+    Как join_csv_tables, но для частей одной таблицы, снятых с перекрытием
+    (плитки скана): если первые строки очередной части совпадают с последними
+    строками предыдущей части, дубли отбрасываются. Сравниваются только строки
+    зоны перекрытия: overlap_rows[i] — сколько строк могут повторяться на стыке
+    частей i и i+1 (по умолчанию max_overlap_rows); повторы внутри части сохраняются.
+    """
+    if not csv_list:
+        return None
+    if overlap_rows is None:
+        overlap_rows = [max_overlap_rows] * (len(csv_list) - 1)
+
+    if all(isinstance(table, SpecTable) for table in csv_list):
+        parts = [[";".join(row.as_row()) for row in table.rows] for table in csv_list]
+        merged = list(csv_list[0].rows)
+        for previous, part, table, limit in zip(parts, parts[1:], csv_list[1:], overlap_rows):
+            merged.extend(table.rows[_overlap(previous, part, limit):])
+        return SpecTable(rows=merged)
+
+    header, *rows = as_csv(csv_list[0]).splitlines()
+    previous = list(rows)
+    for table, limit in zip(csv_list[1:], overlap_rows):
+        part = as_csv(table).splitlines()[1:]  # пропускаем заголовок
+        rows.extend(part[_overlap(previous, part, limit):])
+        previous = part
+
+    return "\n".join([header] + rows)
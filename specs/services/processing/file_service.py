@@ -1,18 +1,15 @@
 import pandas as pd
-import os
+
+from specs.services.exporter.table_exporter import export_dataframe
 
 def save_final_dataframe(df: pd.DataFrame, output_path: str):
     """
     Сохраняет итоговую таблицу.
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, sep=";", index=False, encoding="utf-8")
-    return output_path
+    return export_dataframe(df, output_path, fmt="csv")
 
 def save_final_dataframe_xlsx(df: pd.DataFrame, output_path: str):
     """
-    Сохраняет итоговую таблицу в Excel (.xlsx).
+    Сохраняет итоговую таблицу в Excel (.xlsx) потоковой записью (exporter.table_exporter).
     """
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_excel(output_path, index=False)
-    return output_path
\ No newline at end of file
+    return export_dataframe(df, output_path, fmt="xlsx")
@@ -0,0 +1,173 @@
+"""
+Поиск почти одинаковых позиций («Болт М10х40 ГОСТ 7798» и «Болт М10x40 ГОСТ7798»).
+
+Текст позиции разбивается на символьные n-граммы, по ним считается MinHash-подпись,
+а подписи раскладываются по корзинам LSH (banding). Точное сходство Жаккара
+считается только для пар, попавших в общую корзину, поэтому время растёт почти
+линейно с числом строк, а не квадратично. Пары со сходством не ниже порога
+объединяются в группы (union-find).
+
+Числа в тексте (размеры, токи, сечения) должны совпадать: «М10х40» и «М12х40»,
+«16А» и «25А» похожи по n-граммам, но это разные позиции.
+"""
+import logging
+import os
+import re
+import zlib
+from itertools import combinations
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = float(os.getenv("CONSOLIDATION_FUZZY_THRESHOLD", "0.8"))
+NGRAM_SIZE = 3
+# 16 полос по 8 значений: пара с J=0.9 попадает в общую корзину почти всегда,
+# с J=0.8 — с вероятностью ~0.95, с J=0.5 — ~0.06
+NUM_PERM = 128
+BANDS = 16
+# Кандидаты, у которых доля совпавших значений подписи (оценка J) ниже порога
+# на столько, отбрасываются без точного подсчёта
+ESTIMATE_MARGIN = 0.15
+# Корзины крупнее этого — массовые совпадения (пустые/шаблонные тексты), их пары не сравниваются
+MAX_BUCKET_SIZE = 200
+
+_MAX_HASH = (1 << 32) - 1
+
+# латиница, похожая на кириллицу, -> кириллица (х/x в размерах, о/o, с/c в марках)
+_CONFUSABLES = str.maketrans("abcehkmoptxy", "авсенкмортху")
+_NOISE_RE = re.compile(r"[\W_]+")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)?")
+
+
+def fingerprint(text: str) -> str:
+    """
+    Текст для сравнения: регистр, ё/е, похожие латинские буквы, пробелы
+    и пунктуация не учитываются.
+    """
+    return _NOISE_RE.sub("", text.casefold().replace("ё", "е").translate(_CONFUSABLES))
+
+
+def numbers_key(text: str) -> str:
+    """
+    Числа текста по порядку («Болт М10х40 ГОСТ 7798-70» -> «10/40/7798/70»).
+    """
+    return "/".join(number.replace(",", ".") for number in _NUMBER_RE.findall(text))
+
+
+def shingles(text: str, size: int = NGRAM_SIZE) -> frozenset[str]:
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + size] for i in range(len(text) - size + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def minhash_signatures(shingle_sets: Sequence[frozenset], num_perm: int = NUM_PERM, seed: int = 1) -> np.ndarray:
+    """
+    MinHash-подписи (строка на множество). Хэши n-грамм всех строк лежат
+    в одном массиве, минимум по строкам берётся np.minimum.reduceat —
+    цикл только по перестановкам, не по строкам.
+    """
+    sizes = np.fromiter((len(s) for s in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+    signatures = np.full((len(shingle_sets), num_perm), _MAX_HASH, dtype=np.uint64)
+    if not sizes.sum():
+        return signatures
+
+    # n-граммы сильно повторяются между строками — crc32 считается по уникальным
+    codes, uniques = pd.factorize(pd.Series([g for s in shingle_sets for g in s], dtype=object))
+    unique_hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in uniques), dtype=np.uint64, count=len(uniques))
+    hashes = unique_hashes[codes]
+
+    # multiply-shift: (a * h + b) mod 2^64, старшие 32 бита — перестановка без деления
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    non_empty = sizes > 0
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))[non_empty]
+    for i in range(num_perm):
+        permuted = (a[i] * hashes + b[i]) >> np.uint64(32)
+        signatures[non_empty, i] = np.minimum.reduceat(permuted, offsets)
+    return signatures
+
+
+def candidate_pairs(signatures: np.ndarray, blocks: np.ndarray, bands: int = BANDS) -> np.ndarray:
+    """
+    Пары строк (i < j), совпавших хотя бы в одной полосе подписи и в одном блоке.
+    """
+    rows = signatures.shape[1] // bands
+    # значения полосы сворачиваются в один uint64 (переполнение допустимо): коллизия
+    # лишь добавит кандидата, которого отсеет проверка сходства
+    mixers = np.random.default_rng(0).integers(1, 1 << 63, rows + 1, dtype=np.uint64) | np.uint64(1)
+    found: list[tuple[int, int]] = []
+    for band in range(bands):
+        band_values = signatures[:, band * rows:(band + 1) * rows]
+        keys = blocks * mixers[-1] + (band_values * mixers[:rows]).sum(axis=1, dtype=np.uint64)
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.concatenate(([True], keys[order][1:] != keys[order][:-1])))
+        sizes = np.diff(np.append(starts, len(order)))
+        wanted = (sizes > 1) & (sizes <= MAX_BUCKET_SIZE)
+        for start, size in zip(starts[wanted].tolist(), sizes[wanted].tolist()):
+            found.extend(combinations(order[start:start + size].tolist(), 2))
+
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.unique(np.array(found, dtype=np.int64), axis=0)
+
+
+def estimated_similarity(signatures: np.ndarray, pairs: np.ndarray, chunk: int = 100_000) -> np.ndarray:
+    """
+    Оценка сходства Жаккара пар по доле совпавших значений MinHash-подписей.
+    """
+    estimates = np.empty(len(pairs))
+    for start in range(0, len(pairs), chunk):
+        part = pairs[start:start + chunk]
+        estimates[start:start + chunk] = (signatures[part[:, 0]] == signatures[part[:, 1]]).mean(axis=1)
+    return estimates
+
+
+def _find(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def find_fuzzy_groups(texts: Sequence[str], blocks: Sequence, threshold: float = DEFAULT_THRESHOLD) -> np.ndarray:
+    """
+    Номера групп почти одинаковых текстов (в порядке первого появления).
+    Сравниваются только строки одного блока (например, одной единицы измерения)
+    с одинаковыми числами в тексте; пустые тексты не объединяются ни с чем.
+    """
+    prints = [fingerprint(text) for text in texts]
+    sets = [shingles(p) for p in prints]
+    codes = pd.factorize(np.asarray(blocks))[0]
+    block_keys = [f"{code}|{numbers_key(text)}" for code, text in zip(codes.tolist(), texts)]
+    block_codes = pd.factorize(pd.Series(block_keys))[0].astype(np.uint64)
+
+    parent = list(range(len(texts)))
+    signatures = minhash_signatures(sets)
+    pairs = candidate_pairs(signatures, block_codes)
+    candidates = len(pairs)
+    pairs = pairs[estimated_similarity(signatures, pairs) >= threshold - ESTIMATE_MARGIN]
+    merged = 0
+    for i, j in pairs.tolist():
+        if prints[i] and (prints[i] == prints[j] or jaccard(sets[i], sets[j]) >= threshold):
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i != root_j:
+                # корень — самая ранняя строка, чтобы группа оставалась на её месте
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+                merged += 1
+
+    logger.info(
+        f"Fuzzy dedupe: {candidates} candidate pairs, {len(pairs)} checked, {merged} merges among {len(texts)} rows"
+    )
+    roots = [_find(parent, i) for i in range(len(texts))]
+    return pd.factorize(pd.Series(roots))[0]
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Лимиты одной загрузки (все файлы запроса, включая распакованные из архивов):
+# число файлов, общий и пофайловый размер после распаковки, байт
+BATCH_MAX_FILES = int(os.getenv("SPECS_BATCH_MAX_FILES", "200"))
+BATCH_MAX_BYTES = int(os.getenv("SPECS_BATCH_MAX_BYTES", str(500 * 1024 * 1024)))
+BATCH_MAX_FILE_BYTES = int(os.getenv("SPECS_BATCH_MAX_FILE_BYTES", str(100 * 1024 * 1024)))
+CHUNK_SIZE = 1024 * 1024
+# бит 11 флагов: имя записано в UTF-8, иначе — в кодировке DOS (в русских архивах cp866)
+_ZIP_UTF8_FLAG = 0x800
+
+
+@dataclass
+class IngestedFile:
+    path: str               # файл в хранилище, имя = sha256 содержимого
+    sha256: str
+    size: int
+    original_name: str
+    is_duplicate: bool      # файл с таким содержимым уже лежал в хранилище
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.original_name)[1].lower()
+
+
+def ingest_stream(chunks: Iterable[bytes], original_name: str, upload_dir: str) -> IngestedFile:
+    """
+    Однократно записывает загрузку в spool-файл, попутно считая sha256,
+    и переименовывает его в <sha256><ext>. Одинаковые файлы хранятся один раз,
+    а одноимённые загрузки разных пользователей не перетирают друг друга.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    ext = os.path.splitext(original_name)[1].lower()
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, spool_path = tempfile.mkstemp(dir=upload_dir, prefix=".spool-", suffix=ext)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            for chunk in chunks:
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+
+        sha256 = digest.hexdigest()
+        final_path = os.path.join(upload_dir, f"{sha256}{ext}")
+
+        is_duplicate = os.path.exists(final_path)
+        if is_duplicate:
+            os.remove(spool_path)
+        else:
+            os.replace(spool_path, final_path)
+    except BaseException:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+        raise
+
+    logger.info(f"Ingested {original_name} ({size} bytes) as {os.path.basename(final_path)}"
+                f"{' (duplicate)' if is_duplicate else ''}")
+    return IngestedFile(
+        path=final_path,
+        sha256=sha256,
+        size=size,
+        original_name=original_name,
+        is_duplicate=is_duplicate,
+    )
+
+
+class IngestBudget:
+    """
+    Остаток лимитов на один запрос загрузки. Размер проверяется заранее
+    (заявленный в архиве или форме) и ещё раз по мере записи: заголовку
+    ZIP-архива верить нельзя.
+    """
+
+    def __init__(self, files: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.files = BATCH_MAX_FILES if files is None else files
+        self.bytes = BATCH_MAX_BYTES if max_bytes is None else max_bytes
+
+    def _limit(self) -> int:
+        return min(BATCH_MAX_FILE_BYTES, self.bytes)
+
+    def check(self, name: str, declared_size: int):
+        if self.files <= 0:
+            raise ValueError(f"Upload contains more than {BATCH_MAX_FILES} files")
+        if declared_size > self._limit():
+            raise ValueError(f"{name}: file is too large ({declared_size} bytes)")
+
+    def limit_stream(self, name: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        limit, size = self._limit(), 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"{name}: file is too large (more than {limit} bytes)")
+            yield chunk
+
+    def ingest(self, chunks: Iterable[bytes], name: str, upload_dir: str, declared_size: int = 0) -> IngestedFile:
+        """
+        ingest_stream с учётом лимитов: при превышении — ValueError, spool-файл удаляется.
+        """
+        self.check(name, declared_size)
+        ingested = ingest_stream(self.limit_stream(name, chunks), name, upload_dir)
+        self.files -= 1
+        self.bytes -= ingested.size
+        return ingested
+
+
+def _read_chunks(stream: BinaryIO) -> Iterator[bytes]:
+    while chunk := stream.read(CHUNK_SIZE):
+        yield chunk
+
+
+def _member_name(info: zipfile.ZipInfo) -> str:
+    name = info.filename
+    if not info.flag_bits & _ZIP_UTF8_FLAG:
+        # zipfile декодирует такие имена как cp437
+        try:
+            name = name.encode("cp437").decode("cp866")
+        except UnicodeError:
+            pass
+    # только имя файла: каталоги архива (и «../») в хранилище не попадают
+    return os.path.basename(name.replace("\\", "/"))
+
+
+def ingest_zip(
+    archive: BinaryIO | str,
+    upload_dir: str,
+    extensions: Iterable[str],
+    budget: Optional[IngestBudget] = None,
+) -> list[IngestedFile]:
+    """
+    Сохраняет файлы ZIP-архива с поддерживаемыми расширениями так же, как
+    ingest_stream (по одному разу, имя = sha256). Каталоги, скрытые файлы
+    и файлы с другими расширениями пропускаются.
+    budget — лимиты запроса (общие для всех его файлов); превышение — ValueError.
+    """
+    extensions = tuple(extensions)
+    budget = budget or IngestBudget()
+    ingested = []
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            name = _member_name(info)
+            if info.is_dir() or not name or name.startswith(".") or not name.lower().endswith(extensions):
+                continue
+            with zf.open(info) as member:
+                ingested.append(budget.ingest(_read_chunks(member), name, upload_dir, info.file_size))
+
+    logger.info(f"Ingested {len(ingested)} files from archive")
+    return ingested
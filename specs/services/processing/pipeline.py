@@ -0,0 +1,203 @@
+import dataclasses
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from specs.services.ai.ai_helper import AIHelper, get_ai_helper
+from specs.services.ai.streaming import stream_rows_to
+from specs.services.ai.usage import TokenUsage, collect_usage, merge_usage
+from specs.services.parser.registry import parse_source
+from specs.services.parser.source import SpecSource
+from specs.services.processing.artifacts import STAGE_CONSOLIDATED, STAGE_TABLES, RunArtifacts, record_responses_to
+from specs.services.processing.consolidator_v2 import ConsolidatorV2
+from specs.services.processing.file_service import save_final_dataframe_xlsx
+from specs.services.processing.row_log import RowLog
+from specs.services.processing.spec_table import NormalizedTable
+from specs.services.utils.concurrency import collect_skipped_parts, map_concurrently, record_skipped_part
+
+logger = logging.getLogger(__name__)
+
+# Сколько файлов пакета разбирается одновременно (процессов в пуле)
+DEFAULT_BATCH_WORKERS = int(os.getenv("BATCH_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+
+@dataclass(frozen=True)
+class SourceFile:
+    path: str   # файл на диске
+    name: str   # исходное имя: по нему выбирается парсер, оно же — в колонке «Источник»
+
+
+def parse_file(source: SpecSource, filename: str, ai_helper: Optional[AIHelper] = None) -> list[NormalizedTable]:
+    """
+    Выбирает парсер по содержимому и расширению имени файла (registry)
+    и возвращает список CSV-таблиц.
+    source — путь к файлу или буфер с его содержимым.
+    ai_helper — общий для процесса по умолчанию (get_ai_helper).
+    """
+    return parse_source(source, filename, ai_helper or get_ai_helper())
+
+
+def process_file(
+    file_path: str,
+    output_path: str,
+    filename: Optional[str] = None,
+    ai_helper: Optional[AIHelper] = None,
+    artifacts: Optional[RunArtifacts] = None,
+) -> pd.DataFrame:
+    """
+    Полный пайплайн для одного файла:
+    парсинг -> GPT-нормализация -> консолидация -> сохранение в Excel.
+    Парсеры получают путь к файлу и читают его сами (потоково, где умеют),
+    а не копию всего файла в памяти.
+    С artifacts результаты этапов сохраняются на диск, и повторный вызов
+    продолжает с последнего завершённого этапа (ответы GPT тоже не запрашиваются заново).
+    """
+    if artifacts is not None and artifacts.completed(STAGE_CONSOLIDATED):
+        logger.info(f"Resuming {file_path} from consolidated artifacts")
+        df = artifacts.load_frame()
+    else:
+        csv_tables = _normalized_tables(file_path, filename, ai_helper, artifacts)
+
+        consolidator = ConsolidatorV2()
+        df = consolidator.merge_and_consolidate(csv_tables)
+        if artifacts is not None and artifacts.completed(STAGE_TABLES):
+            artifacts.save_frame(df)
+
+    save_final_dataframe_xlsx(df, output_path)
+    logger.info(f"Processed {file_path}: {len(df)} rows -> {output_path}")
+    return df
+
+
+def _normalized_tables(
+    file_path: str,
+    filename: Optional[str],
+    ai_helper: Optional[AIHelper],
+    artifacts: Optional[RunArtifacts],
+) -> list[NormalizedTable]:
+    if artifacts is None:
+        return parse_file(file_path, filename or file_path, ai_helper)
+
+    if artifacts.completed(STAGE_TABLES):
+        logger.info(f"Resuming {file_path} from normalized tables artifacts")
+        return artifacts.load_tables()
+
+    with collect_skipped_parts() as skipped, record_responses_to(artifacts):
+        csv_tables = parse_file(file_path, filename or file_path, ai_helper)
+
+    # с пропущенными частями этап не завершён: перезапуск допросит только их
+    if not skipped:
+        artifacts.save_tables(csv_tables)
+    return csv_tables
+
+
+def process_files(
+    sources: list[SourceFile],
+    output_path: str,
+    row_log: Optional[RowLog] = None,
+    artifacts: Optional[RunArtifacts] = None,
+    max_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Пакетный пайплайн: все файлы разбираются параллельно (в пуле процессов),
+    их таблицы проходят одну общую консолидацию с колонкой исходного файла
+    и сохраняются в один Excel.
+    Файл, который не удалось разобрать, пропускается (учитывается в collect_skipped_parts);
+    если не разобран ни один — пробрасывается ошибка.
+    """
+    if artifacts is not None and artifacts.completed(STAGE_CONSOLIDATED):
+        logger.info(f"Resuming batch of {len(sources)} files from consolidated artifacts")
+        df = artifacts.load_frame()
+    else:
+        if artifacts is not None and artifacts.completed(STAGE_TABLES):
+            logger.info(f"Resuming batch of {len(sources)} files from normalized tables artifacts")
+            csv_tables, table_sources = artifacts.load_tables(), artifacts.load_sources()
+        else:
+            with collect_skipped_parts() as skipped:
+                parsed = _parse_sources(sources, row_log, artifacts, max_workers or DEFAULT_BATCH_WORKERS)
+            csv_tables = [table for _, tables in parsed for table in tables]
+            table_sources = [source.name for source, tables in parsed for _ in tables]
+            if artifacts is not None and not skipped:
+                artifacts.save_tables(csv_tables, sources=table_sources)
+
+        consolidator = ConsolidatorV2()
+        df = consolidator.merge_and_consolidate(csv_tables, sources=table_sources)
+        if artifacts is not None and artifacts.completed(STAGE_TABLES):
+            artifacts.save_frame(df)
+
+    save_final_dataframe_xlsx(df, output_path)
+    logger.info(f"Processed batch of {len(sources)} files: {len(df)} rows -> {output_path}")
+    return df
+
+
+def _parse_sources(
+    sources: list[SourceFile],
+    row_log: Optional[RowLog],
+    artifacts: Optional[RunArtifacts],
+    max_workers: int,
+) -> list[tuple[SourceFile, list[NormalizedTable]]]:
+    """
+    Разбирает файлы пакета, порядок результатов — как у sources.
+    Один файл или один воркер — в текущем процессе (потоки map_concurrently),
+    иначе — в пуле процессов: разбор docx/xlsx/pdf упирается в CPU и GIL.
+    """
+    if max_workers <= 1 or len(sources) <= 1:
+        def parse(source: SourceFile) -> list[NormalizedTable]:
+            with record_responses_to(artifacts):
+                return parse_file(source.path, source.name)
+
+        results = map_concurrently(parse, sources)
+        return [(source, tables) for source, tables in zip(sources, results) if tables is not None]
+
+    # контекстные переменные (журнал строк, артефакты, учёт токенов) в дочерние
+    # процессы не передаются: туда уходят пути, пропуски и токены возвращаются с результатом
+    row_log_path = str(row_log.path) if row_log is not None else None
+    artifacts_root = str(artifacts.root) if artifacts is not None else None
+
+    # spawn: веб-процесс многопоточный, fork в нём небезопасен
+    context = multiprocessing.get_context("spawn")
+    workers = min(max_workers, len(sources))
+    parsed = []
+    errors = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(_parse_source_in_worker, source, row_log_path, artifacts_root) for source in sources]
+        for source, future in zip(sources, futures):
+            try:
+                tables, skipped, usage = future.result()
+            except Exception as e:
+                logger.warning(f"Batch file {source.name} failed: {e}")
+                errors.append((source, e))
+                continue
+            for description in skipped:
+                record_skipped_part(f"{source.name}: {description}")
+            merge_usage(TokenUsage(*usage))
+            parsed.append((source, tables))
+
+    if not parsed and errors:
+        raise errors[-1][1]
+    for source, e in errors:
+        record_skipped_part(f"{source.name}: {e}")
+    return parsed
+
+
+def _parse_source_in_worker(
+    source: SourceFile,
+    row_log_path: Optional[str],
+    artifacts_root: Optional[str],
+) -> tuple[list[NormalizedTable], list[str], tuple]:
+    """
+    Разбор одного файла пакета в дочернем процессе.
+    Возвращает таблицы, пропущенные части и расход токенов (кортежем TokenUsage).
+    """
+    row_sink = RowLog(row_log_path).append if row_log_path else None
+    artifacts = RunArtifacts(artifacts_root) if artifacts_root else None
+
+    with collect_skipped_parts() as skipped, collect_usage() as usage, \
+            stream_rows_to(row_sink), record_responses_to(artifacts):
+        tables = parse_file(source.path, source.name)
+    return tables, skipped, dataclasses.astuple(usage)
+
@@ -0,0 +1,45 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+class RowLog:
+    """
+    Журнал строк результата запуска (JSON Lines на диске).
+    Воркер дописывает строки по мере их получения от GPT, а представление
+    run_live_rows (runs/<id>/live/?offset=N) отдаёт новые строки начиная
+    с позиции из предыдущего ответа. Через файл это работает
+    и с воркерами-потоками, и с отдельными процессами run_spec_workers.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_run(cls, media_root: str, run_id: int) -> "RowLog":
+        return cls(os.path.join(media_root, "runs", str(run_id), "rows.jsonl"))
+
+    def append(self, rows: list[list[str]]):
+        lines = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+    def read_from(self, offset: int = 0) -> tuple[list[list[str]], int]:
+        """
+        Строки, дописанные после offset (в байтах), и новая позиция.
+        Недописанная последняя строка остаётся до следующего чтения.
+        """
+        if not self.path.exists():
+            return [], offset
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        complete = data[:data.rfind(b"\n") + 1]
+        rows = [json.loads(line) for line in complete.decode("utf-8").splitlines() if line]
+        return rows, offset + len(complete)
@@ -0,0 +1,234 @@
+import logging
+import os
+import re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_HEADER = "Обозначение;Наименование;Ед. изм.;Требуемое кол-во, в ед. изм.;Техническое задание"
+
+# Синонимы заголовков входных таблиц (в нормализованном виде, см. _normalize_header)
+HEADER_SYNONYMS = {
+    "designation": [
+        "обозначение", "артикул", "арт", "код", "код заказа", "код товара", "каталожный номер",
+        "номер по каталогу", "партномер", "part number", "p/n", "pn", "гост", "гост/ту",
+    ],
+    "name": [
+        "наименование", "наименование товара", "наименование позиции", "наименование продукции",
+        "наименование материала", "наименование оборудования", "название", "товар", "номенклатура",
+        "наименование и техническая характеристика",
+    ],
+    "unit": [
+        "ед изм", "ед", "единица", "единица измерения", "ед измерения", "единицы измерения",
+    ],
+    "quantity": [
+        "кол-во", "количество", "кол", "требуемое кол-во", "требуемое количество",
+        "требуемое кол-во в ед изм", "кол-во в ед изм",
+    ],
+    "tech_spec": [
+        "техническое задание", "технические характеристики", "характеристики", "характеристика",
+        "описание", "примечание", "примечания", "тз", "параметры",
+    ],
+    # колонки, которые по правилам SYSTEM_PROMPT в результат не попадают
+    "skip": [
+        "№", "n", "no", "№ п/п", "п/п", "№ пп", "поз", "позиция", "цена", "цена за ед", "цена за шт",
+        "сумма", "стоимость", "ндс", "валюта", "скидка", "сумма без ндс", "сумма с ндс", "срок поставки",
+    ],
+}
+
+# Словарь единиц измерения (без точек, в нижнем регистре)
+UNITS = {
+    "шт", "штук", "штука", "кг", "г", "т", "тн", "м", "мм", "см", "км", "м2", "м²", "м3", "м³", "пог м", "п м",
+    "л", "мл", "компл", "комплект", "кмп", "к-т", "упак", "уп", "пара", "пар", "рул", "рулон", "лист",
+    "бухта", "набор", "кор", "коробка", "меш", "мешок", "бут", "бочка", "квт", "вт", "час", "ч",
+}
+
+# Написания одной единицы -> каноническое (ключ — после _normalize_unit)
+UNIT_SYNONYMS = {
+    **dict.fromkeys(("шт", "штук", "штука", "штуки"), "шт"),
+    **dict.fromkeys(("т", "тн", "тонна"), "т"),
+    **dict.fromkeys(("м2", "м²", "кв м"), "м2"),
+    **dict.fromkeys(("м3", "м³", "куб м"), "м3"),
+    **dict.fromkeys(("пог м", "п м"), "пог м"),
+    **dict.fromkeys(("компл", "комплект", "кмп", "к-т"), "компл"),
+    **dict.fromkeys(("упак", "уп", "упаковка"), "упак"),
+    **dict.fromkeys(("пара", "пар"), "пара"),
+    **dict.fromkeys(("рул", "рулон"), "рул"),
+    **dict.fromkeys(("кор", "коробка"), "кор"),
+    **dict.fromkeys(("меш", "мешок"), "меш"),
+    **dict.fromkeys(("час", "ч"), "ч"),
+}
+
+QUANTITY_RE = re.compile(r"^\d{1,3}(?:[\s ]\d{3})*(?:[.,]\d+)?$|^\d+(?:[.,]\d+)?$")
+NUMBERING_RE = re.compile(r"^\s*\d+(?:\.\d+)*\s*[.)\-]\s+")
+# строки итогов и финансовых условий (см. «ФИЛЬТРАЦИЯ ЛИШНЕЙ ИНФОРМАЦИИ» в SYSTEM_PROMPT)
+# целыми словами: «Сумматор импульсов» — позиция, а не строка «Сумма»
+SERVICE_ROW_RE = re.compile(r"^(итого|всего|в том числе|ндс|сумма|оплата|доставка|срок)(?=\W|$)", re.IGNORECASE)
+
+
+def _normalize_header(value: str) -> str:
+    value = value.lower().replace("ё", "е")
+    value = re.sub(r"[.,:]", " ", value)
+    return " ".join(value.split())
+
+
+def _normalize_unit(value: str) -> str:
+    return " ".join(value.lower().replace(".", " ").split())
+
+
+def canonical_unit(value: str) -> str:
+    """
+    Единица измерения для сравнения: "шт.", "Штук", "штука" -> "шт".
+    """
+    unit = _normalize_unit(value)
+    return UNIT_SYNONYMS.get(unit, unit)
+
+
+def _clean_cell(value: str) -> str:
+    return " ".join(str(value).replace(";", ",").split())
+
+
+class RuleBasedNormalizer:
+    """
+    Локальная нормализация «хороших» таблиц без GPT.
+    Сопоставляет колонки по словарю синонимов заголовков, проверяет единицы
+    измерения и количества и собирает CSV в формате SYSTEM_PROMPT.
+    Если хоть что-то не распознано уверенно — возвращает None,
+    и таблица уходит в AIHelper как раньше.
+    """
+
+    HEADER_SEARCH_ROWS = 5
+
+    def __init__(self, enabled: Optional[bool] = None):
+        if enabled is None:
+            enabled = os.getenv("RULES_FAST_PATH_ENABLED", "True") == "True"
+        self.enabled = enabled
+
+    def try_normalize(self, rows: list[list[str]]) -> Optional[str]:
+        """
+        Принимает таблицу как список строк (первые строки могут быть шапкой документа).
+        Возвращает CSV из 5 колонок или None, если таблицу надо отдать в GPT.
+        """
+        if not self.enabled or not rows:
+            return None
+
+        for header_idx, row in enumerate(rows[:self.HEADER_SEARCH_ROWS]):
+            mapping = self._map_header(row)
+            if mapping is not None:
+                break
+        else:
+            return None
+
+        records = self._map_rows(rows[header_idx + 1:], mapping)
+        if not records:
+            return None
+
+        logger.info(f"Rule-based fast path: {len(records)} rows mapped without GPT")
+        return "\n".join([OUTPUT_HEADER] + [self._format_record(r) for r in records])
+
+    # --- Внутренние методы ---
+
+    def _match_column(self, cell: str) -> Optional[str]:
+        """
+        Возвращает целевое поле для заголовка колонки, "skip", "" для пустой ячейки
+        или None, если заголовок неизвестен.
+        """
+        header = _normalize_header(cell)
+        if not header:
+            return ""
+
+        for target, synonyms in HEADER_SYNONYMS.items():
+            if header in synonyms:
+                return target
+
+        # «Кол-во, шт.» / «Наименование товара (работ)» — синоним + уточнение
+        for target, synonyms in HEADER_SYNONYMS.items():
+            for synonym in synonyms:
+                if len(synonym) > 2 and header.startswith(synonym + " "):
+                    return target
+        return None
+
+    def _map_header(self, row: list[str]) -> Optional[dict]:
+        # width и unmapped — чтобы не потерять данные строк вне распознанных колонок
+        mapping = {"default_unit": "", "width": len(row), "unmapped": []}
+        for idx, cell in enumerate(row):
+            target = self._match_column(cell)
+            if target is None:
+                return None
+            if target == "":
+                mapping["unmapped"].append(idx)
+                continue
+            if target == "skip":
+                continue
+            if target in mapping:
+                return None  # две колонки претендуют на одно поле — неоднозначно
+            mapping[target] = idx
+
+            if target == "quantity":
+                # «Кол-во, шт.» — единица измерения зашита в заголовок
+                tail = _normalize_unit(_normalize_header(cell).split(" ", 1)[-1])
+                if tail in UNITS:
+                    mapping["default_unit"] = cell.split(",")[-1].strip()
+
+        if "name" not in mapping or "quantity" not in mapping:
+            return None
+        return mapping
+
+    def _map_rows(self, rows: list[list[str]], mapping: dict) -> Optional[list[dict]]:
+        def cell(row, field):
+            idx = mapping.get(field)
+            if idx is None or idx >= len(row):
+                return ""
+            return _clean_cell(row[idx])
+
+        records = []
+        for row in rows:
+            if not any(str(v).strip() for v in row):
+                continue
+            # ячейки за пределами шапки или под пустым заголовком: разбивка строки
+            # не совпадает с шапкой («Кабель ВВГ,1,5»), такую таблицу разбирает GPT
+            extra = list(row[mapping["width"]:]) + [row[idx] for idx in mapping["unmapped"] if idx < len(row)]
+            if any(str(v).strip() for v in extra):
+                return None
+
+            name = NUMBERING_RE.sub("", cell(row, "name")).replace('"', "").strip()
+            quantity = cell(row, "quantity")
+            unit = cell(row, "unit")
+            tech_spec = cell(row, "tech_spec")
+            designation = cell(row, "designation")
+
+            if name and SERVICE_ROW_RE.match(name):
+                continue
+
+            if not name:
+                # строка-продолжение: дописываем в тех. задание предыдущей позиции
+                if quantity or unit or not records:
+                    return None
+                extra = ", ".join(v for v in (designation, tech_spec) if v)
+                if extra:
+                    prev = records[-1]
+                    prev["tech_spec"] = ", ".join(v for v in (prev["tech_spec"], extra) if v)
+                continue
+
+            if quantity and not QUANTITY_RE.match(quantity):
+                return None
+            if unit and _normalize_unit(unit) not in UNITS:
+                return None
+            if quantity and not unit:
+                unit = mapping["default_unit"] or "шт."
+            if not quantity:
+                unit = ""
+
+            records.append({
+                "designation": designation,
+                "name": name,
+                "unit": unit,
+                "quantity": quantity,
+                "tech_spec": tech_spec,
+            })
+        return records
+
+    @staticmethod
+    def _format_record(record: dict) -> str:
+        tech_spec = '"' + record["tech_spec"].replace('"', '""') + '"'
+        return ";".join([record["designation"], record["name"], record["unit"], record["quantity"], tech_spec])
@@ -0,0 +1,82 @@
+"""
+Типизированная нормализованная таблица — ответ GPT в режиме structured outputs
+(JSON по схеме вместо CSV). Превращается в DataFrame без разбора текста.
+"""
+import csv
+import io
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+from pydantic import BaseModel, ConfigDict
+
+from specs.services.processing.rule_mapper import OUTPUT_HEADER
+
+OUTPUT_COLUMNS = OUTPUT_HEADER.split(";")
+
+
+def format_quantity(quantity: Optional[float]) -> str:
+    if quantity is None:
+        return ""
+    return str(int(quantity)) if float(quantity).is_integer() else str(quantity)
+
+
+def rows_to_csv(rows: list[list[str]]) -> str:
+    """
+    CSV в шаблоне (заголовок + строки) с корректным экранированием кавычками.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";", lineterminator="\n")
+    writer.writerow(OUTPUT_COLUMNS)
+    writer.writerows(rows)
+    return buf.getvalue().rstrip("\n")
+
+
+class SpecRow(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    designation: str
+    name: str
+    unit: str
+    quantity: Optional[float]
+    tech_spec: str
+
+    def as_row(self) -> list[str]:
+        return [self.designation, self.name, self.unit, format_quantity(self.quantity), self.tech_spec]
+
+
+class SpecTable(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    rows: list[SpecRow]
+
+    def __bool__(self) -> bool:
+        # как и пустой CSV, таблица без строк считается «нет результата»
+        return bool(self.rows)
+
+    @classmethod
+    def concat(cls, tables: Iterable["SpecTable"]) -> "SpecTable":
+        return cls(rows=[row for table in tables for row in table.rows])
+
+    @classmethod
+    def response_format(cls) -> dict:
+        """
+        Параметр text.format для Responses API (строгая JSON-схема).
+        """
+        return {"type": "json_schema", "name": "spec_table", "schema": cls.model_json_schema(), "strict": True}
+
+    def as_rows(self) -> list[list[str]]:
+        return [row.as_row() for row in self.rows]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.as_rows(), columns=OUTPUT_COLUMNS, dtype=str)
+
+    def to_csv(self) -> str:
+        return rows_to_csv(self.as_rows())
+
+
+# Результат нормализации: CSV-текст (обычный режим, быстрый путь правил) или SpecTable
+NormalizedTable = Union[str, SpecTable]
+
+
+def as_csv(table: NormalizedTable) -> str:
+    return table.to_csv() if isinstance(table, SpecTable) else table
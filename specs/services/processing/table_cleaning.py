@@ -0,0 +1,60 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def non_empty_mask(df: pd.DataFrame) -> np.ndarray:
+    """
+    Булева матрица формы df.shape: True там, где ячейка непуста после strip().
+    Считается один раз векторными строковыми операциями pandas по колонкам;
+    NaN/None считаются пустыми.
+    """
+    mask = np.zeros(df.shape, dtype=bool)
+    for j in range(df.shape[1]):
+        col = df.iloc[:, j]
+        if col.hasnans:
+            col = col.fillna("")
+        col = col.astype(str)
+        mask[:, j] = ~(col.eq("") | col.str.isspace()).to_numpy(dtype=bool)
+    return mask
+
+
+def find_header_row(df: pd.DataFrame, mask: Optional[np.ndarray] = None) -> int:
+    """
+    Позиция строки, похожей на заголовок: >= 2 непустых ячеек и НЕ только числа.
+    Кандидаты отбираются по маске, проверка на «только числа» делается
+    лишь для них (обычно это первая же строка-кандидат).
+    """
+    if mask is None:
+        mask = non_empty_mask(df)
+
+    values = df.to_numpy()
+    for i in np.flatnonzero(mask.sum(axis=1) >= 2):
+        non_empty = [str(v).strip() for v in values[i][mask[i]]]
+        if not all(s.isdigit() for s in non_empty):
+            return int(i)
+    return 0  # fallback — первая строка
+
+
+def clean_table(table: pd.DataFrame, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    Убирает из таблицы мусорные строки и колонки:
+    - строки, где заполнено меньше 2 ячеек;
+    - колонки, пустые целиком или с 5 и более пустыми ячейками;
+    - строки, где после отбора колонок осталось 3 и более пустых ячеек.
+    Все фильтры выводятся из одной маски непустых ячеек.
+    """
+    if mask is None:
+        mask = non_empty_mask(table)
+
+    rows = mask.sum(axis=1) >= 2
+    sub = mask[rows]
+
+    empty_in_col = (~sub).sum(axis=0)
+    cols = sub.any(axis=0) & (empty_in_col < 5)
+
+    rows_idx = np.flatnonzero(rows)
+    keep_rows = rows_idx[(~sub[:, cols]).sum(axis=1) < 3]
+
+    return table.iloc[keep_rows, np.flatnonzero(cols)]
@@ -0,0 +1,97 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Максимум одновременных запросов к GPT из одного документа
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+
+_skipped_parts: contextvars.ContextVar[Optional[list[str]]] = contextvars.ContextVar("skipped_parts", default=None)
+# Сколько потоков уже работает во внешних map_concurrently (произведение их ширин)
+_pool_width: contextvars.ContextVar[int] = contextvars.ContextVar("pool_width", default=1)
+
+
+@contextmanager
+def collect_skipped_parts() -> Iterator[list[str]]:
+    """
+    Собирает описания частей документа (листов, пачек, изображений),
+    пропущенных из-за ошибок, пока остальные части обработаны успешно.
+    Работает и во вложенных map_concurrently — контекст передаётся в потоки.
+    Вложенный сбор дополнительно передаёт пропуски во внешний.
+    """
+    outer = _skipped_parts.get()
+    skipped: list[str] = []
+    token = _skipped_parts.set(skipped)
+    try:
+        yield skipped
+    finally:
+        _skipped_parts.reset(token)
+        if outer is not None:
+            outer.extend(skipped)
+
+
+def record_skipped_part(description: str):
+    skipped = _skipped_parts.get()
+    if skipped is not None:
+        skipped.append(description)
+
+
+def map_concurrently(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: Optional[int] = None,
+) -> list[Optional[R]]:
+    """
+    Выполняет func для каждого элемента в пуле потоков с ограничением
+    числа одновременных вызовов.
+    - порядок результатов совпадает с порядком входа;
+    - ошибка одного элемента логируется, а на его месте возвращается None;
+    - если упали все элементы — пробрасывается последнее исключение
+      (None, который func вернула сама, ошибкой не считается);
+    - вложенный вызов (файлы × листы) получает долю DEFAULT_MAX_CONCURRENCY
+      на поток внешнего пула, чтобы число потоков не росло произведением.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    outer_width = _pool_width.get()
+    limit = max_workers or DEFAULT_MAX_CONCURRENCY
+    if outer_width > 1:
+        limit = min(limit, max(1, DEFAULT_MAX_CONCURRENCY // outer_width))
+    max_workers = max(1, min(limit, len(items)))
+    width = outer_width * max_workers
+
+    def run(item: T) -> R:
+        _pool_width.set(width)
+        return func(item)
+
+    results: list[Optional[R]] = [None] * len(items)
+    last_error: Optional[BaseException] = None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # у каждой задачи своя копия контекста (collect_skipped_parts виден в потоке)
+        futures = [pool.submit(contextvars.copy_context().run, run, item) for item in items]
+        failed = []
+        for idx, future in enumerate(futures):
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                logger.warning(f"Item {idx + 1}/{len(items)} failed: {e}")
+                failed.append(f"{idx + 1}/{len(items)}: {e}")
+                last_error = e
+
+    if last_error is not None and len(failed) == len(items):
+        raise last_error
+
+    for description in failed:
+        record_skipped_part(description)
+
+    return results
@@ -0,0 +1,87 @@
+import base64
+import logging
+import os
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Union
+
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+# Длинная сторона, до которой уменьшается изображение перед отправкой в GPT:
+# больше для распознавания таблиц не нужно, а лишние пиксели — это трафик и токены
+IMAGE_MAX_LONG_EDGE = int(os.getenv("IMAGE_MAX_LONG_EDGE", "2000"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "True") == "True"
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """
+    Изображение, подготовленное к отправке в GPT: base64 без префикса 'data:'
+    и MIME-тип выбранной кодировки.
+    """
+    b64: str
+    mime_type: str
+    original_size: int
+    encoded_size: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.original_size - self.encoded_size
+
+
+def _encode(image: Image.Image, fmt: str, **params) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+
+def prepare_image(
+    source: Union[Image.Image, bytes],
+    original_size: Optional[int] = None,
+    max_long_edge: int = IMAGE_MAX_LONG_EDGE,
+    grayscale: bool = IMAGE_GRAYSCALE,
+) -> PreparedImage:
+    """
+    Уменьшает изображение до max_long_edge по длинной стороне, переводит
+    в оттенки серого и кодирует в самый компактный из форматов
+    PNG / JPEG / WebP (для таблиц с ровным фоном часто выигрывает PNG,
+    для фотографий — JPEG/WebP).
+    source — байты файла или уже открытое изображение; original_size —
+    размер исходного файла, если source передан изображением (для статистики).
+    """
+    if isinstance(source, bytes):
+        original_size = len(source)
+        image = Image.open(BytesIO(source))
+        image.load()
+    else:
+        image = source
+
+    image = image.convert("L" if grayscale else "RGB")
+    if max(image.size) > max_long_edge:
+        image = image.copy()
+        image.thumbnail((max_long_edge, max_long_edge), Image.LANCZOS)
+
+    candidates = {
+        "image/png": _encode(image, "PNG", optimize=True),
+        "image/jpeg": _encode(image, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True),
+    }
+    if features.check("webp"):
+        candidates["image/webp"] = _encode(image, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+
+    mime_type, data = min(candidates.items(), key=lambda item: len(item[1]))
+
+    prepared = PreparedImage(
+        b64=base64.b64encode(data).decode("utf-8"),
+        mime_type=mime_type,
+        original_size=original_size if original_size is not None else len(data),
+        encoded_size=len(data),
+    )
+    logger.debug(
+        f"Image {image.width}x{image.height} encoded as {mime_type}: "
+        f"{prepared.original_size} -> {prepared.encoded_size} bytes"
+    )
+    return prepared
@@ -0,0 +1,104 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_TILE_HEIGHT = int(os.getenv("JPG_TILE_HEIGHT", "1600"))
+DEFAULT_TILE_OVERLAP = int(os.getenv("JPG_TILE_OVERLAP", "60"))
+
+# Пиксель темнее этого порога считается «чернилами»
+INK_THRESHOLD = 160
+# Строка пикселей — пробел между строками таблицы, если чернил в ней меньше этой доли
+GAP_MAX_INK = 0.005
+# ... или линия разметки таблицы, если чернил больше этой доли
+RULE_MIN_INK = 0.6
+
+
+def find_cut_rows(image: Image.Image) -> np.ndarray:
+    """
+    Горизонтальная проекция: индексы строк пикселей, по которым можно резать
+    изображение, не задевая текст, — пустые промежутки и линии разметки таблицы.
+    """
+    gray = np.asarray(image.convert("L"))
+    ink = (gray < INK_THRESHOLD).mean(axis=1)
+    return np.flatnonzero((ink <= GAP_MAX_INK) | (ink >= RULE_MIN_INK))
+
+
+def plan_tiles(height: int, cut_rows: np.ndarray, tile_height: int, overlap: int) -> list[tuple[int, int]]:
+    """
+    Делит высоту на полосы (top, bottom) длиной около tile_height.
+    Граница ставится на ближайшую к желаемой допустимую строку реза
+    (в пределах 50–120% высоты плитки). Следующая плитка начинается с самой
+    ранней строки реза в пределах overlap пикселей над границей: строки
+    таблицы из зоны перекрытия попадают в обе плитки целиком, а не разрезанными.
+    """
+    tiles = []
+    top = 0
+    while top < height:
+        desired = top + tile_height
+        if desired >= height:
+            tiles.append((top, height))
+            break
+
+        lo, hi = top + tile_height // 2, min(top + int(tile_height * 1.2), height)
+        candidates = cut_rows[(cut_rows >= lo) & (cut_rows <= hi)]
+        bottom = int(candidates[np.argmin(np.abs(candidates - desired))]) if len(candidates) else desired
+
+        tiles.append((top, bottom))
+        top = max(_next_top(cut_rows, bottom, overlap), top + 1)
+    return tiles
+
+
+def _next_top(cut_rows: np.ndarray, bottom: int, overlap: int) -> int:
+    window = cut_rows[(cut_rows >= bottom - overlap) & (cut_rows < bottom)]
+    if len(window):
+        return int(window[0])
+    # промежутка рядом нет: граница режет текст, перекрытие хотя бы показывает строку целиком
+    return bottom if np.isin(bottom, cut_rows) else max(bottom - overlap, 0)
+
+
+def overlap_lines(cut_rows: np.ndarray, bands: list[tuple[int, int]]) -> list[int]:
+    """
+    Для каждой пары соседних полос — число строк текста в зоне их перекрытия:
+    больше строк таблицы в обеих плитках сразу оказаться не может.
+    """
+    counts = []
+    for (_, bottom), (next_top, _) in zip(bands, bands[1:]):
+        is_text = ~np.isin(np.arange(next_top, bottom), cut_rows)
+        # строка текста начинается там, где промежуток сменяется текстом
+        counts.append(int(np.count_nonzero(np.diff(is_text.astype(np.int8), prepend=0) == 1)))
+    return counts
+
+
+def plan_image_tiles(
+    image: Image.Image,
+    tile_height: int = DEFAULT_TILE_HEIGHT,
+    overlap: int = DEFAULT_TILE_OVERLAP,
+) -> tuple[list[tuple[int, int]], list[int]]:
+    """
+    Полосы плиток для скана и число строк текста в каждом перекрытии (overlap_lines).
+    Невысокое изображение — одна полоса.
+    """
+    height = image.height
+    if height <= tile_height * 1.2:
+        return [(0, height)], []
+
+    cut_rows = find_cut_rows(image)
+    bands = plan_tiles(height, cut_rows, tile_height, overlap)
+    return bands, overlap_lines(cut_rows, bands)
+
+
+def split_into_tiles(
+    image: Image.Image,
+    tile_height: int = DEFAULT_TILE_HEIGHT,
+    overlap: int = DEFAULT_TILE_OVERLAP,
+) -> list[Image.Image]:
+    """
+    Режет высокий скан на перекрывающиеся горизонтальные плитки по промежуткам
+    между строками таблицы. Невысокое изображение возвращается как есть.
+    """
+    if image.height <= tile_height * 1.2:
+        return [image]
+
+    bands, _ = plan_image_tiles(image, tile_height, overlap)
+    return [image.crop((0, top, image.width, bottom)) for top, bottom in bands]
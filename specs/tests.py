@@ -1,8 +1,1329 @@
-from django.test import TestCase
+import itertools
+import os
+import re
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+import pandas as pd
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 
+from specs.models import ProcessingRun
+
+NORMALIZED_HEADER = "Обозначение;Наименование;Ед. изм.;Требуемое кол-во, в ед. изм.;Техническое задание"
+
+
+class FakeAIHelper:
+    """
+    Подмена AIHelper: вместо GPT возвращает вход в 5-колоночном шаблоне
+    (вторая колонка входа -> Наименование) и запоминает все вызовы.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def normalize_table_from_csv(self, csv_text: str) -> str:
+        self.calls.append(csv_text)
+        rows = [line.split(";") for line in csv_text.splitlines()[1:] if line.strip()]
+        return "\n".join([NORMALIZED_HEADER] + [f";{row[1]};шт.;{row[-1]};" for row in rows])
+
+    def normalize_table_from_text(self, table: list[list[str]]) -> str:
+        return self.normalize_table_from_csv("\n".join(";".join(row) for row in table))
+
+
 class SimplePageTests(TestCase):
     def test_index_status_code(self):
         resp = self.client.get(reverse('specs:index'))
         self.assertEqual(resp.status_code, 200)
         self.assertContains(resp, 'SmartSpec')
+
+
+class ProcessingRunJobTests(TestCase):
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+
+    def _fake_process_file(self, file_path, output_path, **kwargs):
+        df = pd.DataFrame([{"Наименование": "Болт", "Ед. изм.": "шт."}])
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        df.to_excel(output_path, index=False)
+        return df
+
+    def test_upload_returns_run_and_status_reports_result(self):
+        upload = SimpleUploadedFile("spec.txt", "Болт;шт.;2".encode("utf-8"))
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.jobs.process_file", side_effect=self._fake_process_file):
+            resp = self.client.post(reverse('specs:index'), {'specfile': upload})
+            self.assertEqual(resp.status_code, 200)
+
+            run = ProcessingRun.objects.get()
+            self.assertEqual(run.status, ProcessingRun.STATUS_DONE)
+
+            status = self.client.get(reverse('specs:run_status', args=[run.id])).json()
+            rows = self.client.get(status['rows_url']).json()
+
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['row_count'], 1)
+        self.assertEqual(rows['rows'][0][1], 'Болт')
+        self.assertTrue(status['result_file_url'].endswith('.xlsx'))
+
+    def test_zip_batch_consolidates_files_with_source_column(self):
+        import zipfile
+
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("specs/first.txt", "Наименование;Ед. изм.;Кол-во\nБолт М8;шт.;2\nГайка М8;шт;5\n")
+            zf.writestr("second.txt", "Наименование;Ед. изм.;Кол-во\nболт  м8;штук;3\n")
+            zf.writestr("readme.md", "не спецификация")
+        upload = SimpleUploadedFile("specs.zip", archive.getvalue())
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.services.processing.pipeline.DEFAULT_BATCH_WORKERS", 1), \
+                mock.patch("specs.services.processing.pipeline.get_ai_helper"):
+            resp = self.client.post(reverse('specs:batch_upload'), {'specfile': upload})
+            self.assertEqual(resp.status_code, 202)
+            self.assertEqual(resp.json()['files'], ["first.txt", "second.txt"])
+
+            run = ProcessingRun.objects.get()
+            rows = self.client.get(reverse('specs:run_rows', args=[run.id])).json()
+
+        self.assertEqual(run.status, ProcessingRun.STATUS_DONE)
+        self.assertTrue(run.result_file.startswith("output/batch_"))
+        self.assertEqual(rows['columns'][-1], "Источник")
+        self.assertEqual(
+            [row[1:4] + row[-1:] for row in rows['rows']],
+            [["Болт М8", "шт.", "5", "first.txt | second.txt"], ["Гайка М8", "шт", "5", "first.txt"]],
+        )
+
+    def test_batch_limits_apply_to_whole_request_and_uncompressed_size(self):
+        import zipfile
+
+        from specs.services.processing import ingest
+
+        def archive(*names, size=10):
+            data = BytesIO()
+            with zipfile.ZipFile(data, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for name in names:
+                    zf.writestr(name, "0" * size)
+            return SimpleUploadedFile("specs.zip", data.getvalue())
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name), mock.patch.object(ingest, "BATCH_MAX_FILES", 3):
+            resp = self.client.post(reverse('specs:batch_upload'), {'specfile': [archive("a.txt", "b.txt"), archive("c.txt", "d.txt")]})
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("more than 3 files", resp.json()['error'])
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name), mock.patch.object(ingest, "BATCH_MAX_FILE_BYTES", 1000):
+            resp = self.client.post(reverse('specs:batch_upload'), {'specfile': archive("bomb.txt", size=10 ** 6)})
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn("too large", resp.json()['error'])
+
+            # заявленному размеру не верим: лимит проверяется и при записи
+            with self.assertRaises(ValueError):
+                ingest.IngestBudget().ingest(iter([b"0" * 600, b"0" * 600]), "a.txt", self.media_dir.name)
+        self.assertEqual(ProcessingRun.objects.count(), 0)
+        self.assertEqual([n for n in os.listdir(self.media_dir.name) if n.startswith(".spool")], [])
+
+    def test_runs_orphaned_by_dead_process_are_requeued(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        long_ago = timezone.now() - timedelta(hours=2)
+        stale = ProcessingRun.objects.create(status=ProcessingRun.STATUS_RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        # долгий запуск, воркер которого жив и отмечается, повторно не забирается
+        alive = ProcessingRun.objects.create(
+            status=ProcessingRun.STATUS_RUNNING, started_at=long_ago, heartbeat_at=timezone.now()
+        )
+        pending = ProcessingRun.objects.create()
+
+        with override_settings(SPECS_JOB_BACKEND="thread", SPECS_JOBS_EAGER=False, SPECS_JOB_STALE_TIMEOUT=300), \
+                mock.patch("specs.jobs.enqueue_run") as enqueue:
+            self.assertEqual(self.client.get(reverse('specs:run_status', args=[alive.id])).json()['status'], 'running')
+            status = self.client.get(reverse('specs:run_status', args=[stale.id])).json()
+
+        self.assertEqual(status['status'], ProcessingRun.STATUS_PENDING)
+        self.assertEqual(ProcessingRun.objects.get(pk=alive.id).status, ProcessingRun.STATUS_RUNNING)
+        self.assertEqual(sorted(call.args[0] for call in enqueue.call_args_list), [stale.id, pending.id])
+
+    def test_running_job_sends_heartbeats(self):
+        from specs import jobs
+
+        with override_settings(SPECS_JOB_HEARTBEAT_INTERVAL=0.01), mock.patch("specs.jobs.touch_run") as touch:
+            with jobs.heartbeat(42):
+                time.sleep(0.1)
+            calls = touch.call_count
+            time.sleep(0.05)
+
+        self.assertGreater(calls, 1)
+        self.assertEqual(touch.call_count, calls)
+        touch.assert_called_with(42)
+
+    def test_duplicate_upload_reuses_previous_result(self):
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.jobs.process_file", side_effect=self._fake_process_file) as process:
+            for name in ("spec.txt", "spec_copy.txt"):
+                upload = SimpleUploadedFile(name, "Болт;шт.;2".encode("utf-8"))
+                self.client.post(reverse('specs:index'), {'specfile': upload})
+
+        first, second = ProcessingRun.objects.order_by("id")
+        self.assertEqual(process.call_count, 1)
+        self.assertEqual(first.input_path, second.input_path)
+        self.assertEqual(second.status, ProcessingRun.STATUS_DONE)
+        self.assertEqual(second.result_file, first.result_file)
+
+    def test_failed_run_keeps_error_message(self):
+        upload = SimpleUploadedFile("spec.txt", b"data")
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.jobs.process_file", side_effect=ValueError("broken table")):
+            self.client.post(reverse('specs:index'), {'specfile': upload})
+
+        run = ProcessingRun.objects.get()
+        self.assertEqual(run.status, ProcessingRun.STATUS_FAILED)
+        self.assertIn("broken table", run.message)
+
+    def test_run_with_skipped_parts_is_partial_and_not_reused(self):
+        from specs.services.utils.concurrency import map_concurrently
+
+        def process_with_failed_batch(file_path, output_path, **kwargs):
+            def normalize(batch):
+                if batch == 2:
+                    raise RuntimeError("api down")
+                return batch
+
+            map_concurrently(normalize, [1, 2, 3])
+            return self._fake_process_file(file_path, output_path)
+
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.jobs.process_file", side_effect=process_with_failed_batch) as process:
+            for name in ("spec.txt", "spec_copy.txt"):
+                upload = SimpleUploadedFile(name, "Болт;шт.;2".encode("utf-8"))
+                self.client.post(reverse('specs:index'), {'specfile': upload})
+
+        first = ProcessingRun.objects.order_by("id").first()
+        self.assertEqual(first.status, ProcessingRun.STATUS_DONE)
+        self.assertTrue(first.partial)
+        self.assertIn("частично", first.message)
+        self.assertEqual(process.call_count, 2)
+
+    def test_result_rows_are_paginated_sorted_and_filtered(self):
+        from specs.results import store_rows
+
+        run = ProcessingRun.objects.create(status=ProcessingRun.STATUS_DONE, result_file="output/r.xlsx")
+        df = pd.DataFrame({
+            "Обозначение": [f"ГОСТ {i}" for i in range(250)],
+            "Наименование": ["Болт" if i % 2 else "Гайка" for i in range(250)],
+            "Требуемое кол-во, в ед. изм.": [str(i) for i in range(250)],
+        })
+        store_rows(run, df)
+        url = reverse('specs:run_rows', args=[run.id])
+
+        with override_settings(SPECS_RESULTS_MAX_PAGE_SIZE=100):
+            first = self.client.get(url, {'page_size': 100000}).json()
+        self.assertEqual(first['count'], 250)
+        self.assertEqual(len(first['rows']), 100)
+        self.assertEqual(first['columns'][1], 'Наименование')
+
+        page = self.client.get(url, {'q': 'болт', 'sort': '-quantity', 'page_size': 10, 'page': 2}).json()
+        self.assertEqual(page['count'], 125)
+        self.assertEqual([row[3] for row in page['rows'][:2]], ['229', '227'])
+
+        self.assertEqual(self.client.get(url, {'designation': 'гост 24'}).json()['count'], 11)
+
+    def test_claimed_run_is_not_executed_twice(self):
+        from specs.jobs import claim_next_run, claim_run
+
+        run = ProcessingRun.objects.create(input_filename="spec.txt")
+        self.assertEqual(claim_next_run(), run.id)
+        self.assertFalse(claim_run(run.id))
+        self.assertIsNone(claim_next_run())
+
+
+class MapConcurrentlyTests(SimpleTestCase):
+    def test_preserves_order_and_isolates_failures(self):
+        from specs.services.utils.concurrency import map_concurrently
+
+        def work(x):
+            if x == 3:
+                raise RuntimeError("bad table")
+            time.sleep(0.01 * (5 - x))
+            return x * 10
+
+        self.assertEqual(map_concurrently(work, range(5), max_workers=3), [0, 10, 20, None, 40])
+
+    def test_raises_when_every_item_failed(self):
+        from specs.services.utils.concurrency import map_concurrently
+
+        def work(x):
+            raise RuntimeError("api down")
+
+        with self.assertRaises(RuntimeError):
+            map_concurrently(work, [1, 2])
+
+    def test_empty_results_with_one_failure_do_not_raise(self):
+        from specs.services.utils.concurrency import collect_skipped_parts, map_concurrently
+
+        def work(x):
+            # пустые листы дают None, один лист падает
+            if x == 1:
+                raise RuntimeError("bad sheet")
+            return None
+
+        with collect_skipped_parts() as skipped:
+            self.assertEqual(map_concurrently(work, [1, 2, 3]), [None, None, None])
+        self.assertEqual(len(skipped), 1)
+
+    def test_nested_pools_share_the_thread_budget(self):
+        import threading
+
+        from specs.services.utils.concurrency import map_concurrently
+
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def leaf(x):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return x
+
+        with mock.patch("specs.services.utils.concurrency.DEFAULT_MAX_CONCURRENCY", 8):
+            results = map_concurrently(lambda _: map_concurrently(leaf, range(8)), range(4))
+
+        self.assertEqual(results, [list(range(8))] * 4)
+        self.assertLessEqual(peak, 8)
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite3")
+
+    def test_hit_after_set_with_normalized_text_key(self):
+        from specs.services.ai.response_cache import ResponseCache
+
+        cache = ResponseCache(self.path, system_prompt="prompt")
+        key = cache.make_key("gpt", "csv", "Болт ;  шт.\n\n")
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, "csv-result")
+        self.assertEqual(cache.get(cache.make_key("gpt", "csv", "Болт ; шт.")), "csv-result")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_prompt_change_invalidates_entries(self):
+        from specs.services.ai.response_cache import ResponseCache
+
+        cache = ResponseCache(self.path, system_prompt="v1")
+        cache.set(cache.make_key("gpt", "csv", "data"), "old")
+
+        cache = ResponseCache(self.path, system_prompt="v2")
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertIsNone(cache.get(cache.make_key("gpt", "csv", "data")))
+
+    def test_ttl_and_lru_eviction(self):
+        from specs.services.ai.response_cache import ResponseCache
+
+        cache = ResponseCache(self.path, system_prompt="p", ttl_seconds=0, max_bytes=None)
+        cache.set("k", "v")
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("k"))
+
+        cache = ResponseCache(self.path, system_prompt="p", max_bytes=10)
+        cache.set("a", "12345")
+        cache.set("b", "12345")
+        cache.get("a")
+        cache.set("c", "12345")
+        self.assertEqual(cache.get("a"), "12345")
+        self.assertIsNone(cache.get("b"))
+
+
+def make_text_pdf(pages: list[list[str]]) -> bytes:
+    """
+    Минимальный PDF со стандартным шрифтом Helvetica: по строке текста на line.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "14 TL", "50 800 Td"]
+        for line in lines:
+            ops.append(f"({line}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{num} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return out.encode("latin-1")
+
+
+class ExcelChunkingTests(SimpleTestCase):
+    def test_large_sheet_is_normalized_in_ordered_batches(self):
+        from specs.services.parser.excel_parser import ExcelParser
+        from specs.services.processing.rule_mapper import RuleBasedNormalizer
+
+        rows = [["№", "Наименование", "Кол-во"]] + [[str(i), f"Позиция {i}", str(i)] for i in range(1, 301)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "bom.xlsx")
+            pd.DataFrame(rows).to_excel(path, index=False, header=False)
+
+            ai = FakeAIHelper()
+            parser = ExcelParser(
+                path, ai_helper=ai, max_chunk_tokens=300, rule_normalizer=RuleBasedNormalizer(enabled=False)
+            )
+            result = parser.parse_all_sheets()
+
+        self.assertGreater(len(ai.calls), 1)
+        for csv_text in ai.calls:
+            self.assertTrue(csv_text.startswith("№;Наименование;Кол-во"))
+
+        lines = result.splitlines()
+        self.assertEqual(lines[0], NORMALIZED_HEADER)
+        self.assertEqual(lines.count(NORMALIZED_HEADER), 1)
+        self.assertEqual([line.split(";")[1] for line in lines[1:]], [f"Позиция {i}" for i in range(1, 301)])
+
+
+class RuleBasedNormalizerTests(SimpleTestCase):
+    def setUp(self):
+        from specs.services.processing.rule_mapper import RuleBasedNormalizer
+        self.rules = RuleBasedNormalizer(enabled=True)
+
+    def test_maps_well_formed_table_without_gpt(self):
+        rows = [
+            ["Спецификация оборудования", "", "", ""],
+            ["№ п/п", "Наименование", "Кол-во, шт.", "Примечание"],
+            ["1", "Болт М10х40", "1 500", "ГОСТ 7798"],
+            ["", "", "", "оцинкованный"],
+            ["2", "Гайка М10", "20", ""],
+            ["", "Итого", "", ""],
+        ]
+        self.assertEqual(
+            self.rules.try_normalize(rows).splitlines(),
+            [
+                NORMALIZED_HEADER,
+                ';Болт М10х40;шт.;1 500;"ГОСТ 7798, оцинкованный"',
+                ';Гайка М10;шт.;20;""',
+            ],
+        )
+
+    def test_unrecognized_table_falls_back_to_gpt(self):
+        self.assertIsNone(self.rules.try_normalize([["Позиция заказа", "Что-то"], ["1", "2"]]))
+        self.assertIsNone(self.rules.try_normalize([["Наименование", "Кол-во"], ["Кабель", "около 10"]]))
+        self.assertIsNone(self.rules.try_normalize([["Наименование", "Ед. изм.", "Кол-во"], ["Кабель", "бочонок", "1"]]))
+
+    def test_service_words_match_whole_words(self):
+        rows = [
+            ["Наименование", "Кол-во"],
+            ["Сумматор импульсов СИ-8", "2"],
+            ["Сумма: 15 000 руб.", ""],
+            ["Доставка", "1"],
+            ["НДС 20%", ""],
+        ]
+        self.assertEqual(
+            [line.split(";")[1] for line in self.rules.try_normalize(rows).splitlines()[1:]],
+            ["Сумматор импульсов СИ-8"],
+        )
+
+    def test_total_row_with_quantity_is_skipped(self):
+        rows = [
+            ["№", "Наименование", "Ед. изм.", "Кол-во"],
+            ["1", "Болт М10", "шт.", "150"],
+            ["", "Итого", "", "150"],
+        ]
+        self.assertEqual(self.rules.try_normalize(rows).splitlines(), [NORMALIZED_HEADER, ';Болт М10;шт.;150;""'])
+
+    def test_rows_wider_than_header_fall_back_to_gpt(self):
+        from specs.services.parser.txt_parser import TxtParser
+
+        ai = FakeAIHelper()
+        TxtParser("Наименование,Кол-во\nКабель ВВГ,1,5\n".encode("utf-8"), ai_helper=ai, rule_normalizer=self.rules).normalize()
+
+        self.assertEqual(len(ai.calls), 1)
+        self.assertIsNone(self.rules.try_normalize([["Наименование", "", "Кол-во"], ["Кабель", "ВВГ", "1"]]))
+
+    def test_txt_parser_uses_fast_path(self):
+        from specs.services.parser.txt_parser import TxtParser
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "spec.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("Артикул;Наименование;Ед. изм.;Количество\n7610.95;Пресс PGU9500E;шт.;1\n")
+
+            ai = FakeAIHelper()
+            result = TxtParser(path, ai_helper=ai, rule_normalizer=self.rules).normalize()
+
+        self.assertEqual(ai.calls, [])
+        self.assertEqual(result.splitlines()[1], '7610.95;Пресс PGU9500E;шт.;1;""')
+
+
+class ExcelWorkbookLoadingTests(SimpleTestCase):
+    def test_streaming_and_default_loading_give_same_sheets(self):
+        from specs.services.parser.excel_parser import ExcelParser
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "estimate.xlsx")
+            with pd.ExcelWriter(path) as writer:
+                pd.DataFrame([["Наименование", "Кол-во"], ["Болт", 2]]).to_excel(
+                    writer, sheet_name="Лист1", index=False, header=False
+                )
+                pd.DataFrame([["Наименование", "Кол-во"], ["Гайка", 1.5]]).to_excel(
+                    writer, sheet_name="Лист2", index=False, header=False
+                )
+
+            default = ExcelParser(path, ai_helper=FakeAIHelper(), streaming=False).load_sheets()
+            streamed = ExcelParser(path, ai_helper=FakeAIHelper(), streaming=True).load_sheets()
+            merged = ExcelParser(path, ai_helper=FakeAIHelper()).parse_all_sheets()
+
+        self.assertEqual(list(default), ["Лист1", "Лист2"])
+        for name in default:
+            self.assertEqual(default[name].values.tolist(), streamed[name].values.tolist())
+        self.assertEqual([line.split(";")[1] for line in merged.splitlines()[1:]], ["Болт", "Гайка"])
+
+
+class TableCleaningTests(SimpleTestCase):
+    def test_mask_header_and_filters(self):
+        from specs.services.processing.table_cleaning import clean_table, find_header_row, non_empty_mask
+
+        df = pd.DataFrame([
+            ["1", "2", "", ""],
+            ["Наименование", " ", "Кол-во", ""],
+            ["Болт", "", "2", ""],
+            ["  ", "", "", ""],
+            ["Гайка", "", "5", None],
+        ])
+        mask = non_empty_mask(df)
+        self.assertEqual(mask[1].tolist(), [True, False, True, False])
+        self.assertEqual(find_header_row(df, mask), 1)
+
+        table = clean_table(df.iloc[2:], mask[2:])
+        self.assertEqual(table.values.tolist(), [["Болт", "2"], ["Гайка", "5"]])
+
+
+class PDFStreamingTests(SimpleTestCase):
+    def test_page_parallel_extraction_keeps_order_and_multiline_rows(self):
+        from specs.services.parser.pdf_parser import PDFParser
+
+        pages = []
+        for page in range(20):
+            lines = [f"{page * 3 + i + 1} Item{page * 3 + i + 1} 2 10,00 USD 0 20,00" for i in range(3)]
+            lines.append("continued on next page")
+            pages.append(lines)
+        pdf = make_text_pdf(pages)
+
+        ai = FakeAIHelper()
+        parser = PDFParser(
+            pdf, ai_helper=ai, mode="text", max_workers=2, pages_per_batch=4, max_chunk_tokens=200
+        )
+        result = parser.parse()
+
+        self.assertGreater(len(ai.calls), 1)
+        names = [re.search(r"Item\d+", line).group() for line in result.splitlines()[1:]]
+        self.assertEqual(names, [f"Item{i}" for i in range(1, 61)])
+        self.assertIn("continued on next page", "".join(ai.calls))
+
+    def test_pool_workers_get_a_path_instead_of_pdf_bytes(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from specs.services.parser.pdf_parser import PDFParser
+
+        sources = []
+
+        class RecordingPool(ThreadPoolExecutor):
+            def __init__(self, max_workers, mp_context):
+                super().__init__(max_workers)
+
+            def submit(self, fn, *args):
+                sources.append(args[0])
+                return super().submit(fn, *args)
+
+        pdf = make_text_pdf([[f"{page + 1} Item{page + 1} 2 10,00 USD 0 20,00"] for page in range(20)])
+        parser = PDFParser(pdf, ai_helper=FakeAIHelper(), mode="text", max_workers=2, pages_per_batch=4)
+        with mock.patch("specs.services.parser.pdf_parser.ProcessPoolExecutor", RecordingPool):
+            result = parser.parse()
+
+        self.assertEqual(len(result.splitlines()), 21)
+        self.assertEqual(len(sources), 5)
+        self.assertEqual(len(set(sources)), 1)
+        self.assertIsInstance(sources[0], str)
+        self.assertFalse(os.path.exists(sources[0]))
+
+    def test_tables_spanning_pages_are_stitched(self):
+        from specs.services.parser.pdf_parser import PDFParser
+
+        header = ["№", "Наименование", "Кол-во"]
+        pages = [
+            [[["Поставщик", "ООО Ромашка"]], [header, ["1", "Болт", "2"]]],
+            [[header, ["2", "Гайка", "4"]], [["Итого", "", "6"], ["НДС", "", "1"]]],
+            [[["3", "Шайба", "8"]]],
+        ]
+        tables = PDFParser._stitch_tables(pages)
+
+        self.assertEqual(tables[0], [["Поставщик", "ООО Ромашка"]])
+        self.assertEqual(tables[1], [header, ["1", "Болт", "2"], ["2", "Гайка", "4"]])
+        self.assertEqual(tables[2], [["Итого", "", "6"], ["НДС", "", "1"], ["3", "Шайба", "8"]])
+
+    def test_table_with_own_header_on_next_page_is_not_stitched(self):
+        from specs.services.parser.pdf_parser import PDFParser
+
+        pages = [
+            [[["№", "Наименование", "Кол-во"], ["1", "Болт", "2"]]],
+            [[["Код", "Работа", "Часы"], ["7", "Монтаж", "3"]]],
+        ]
+        tables = PDFParser._stitch_tables(pages)
+
+        self.assertEqual(len(tables), 2)
+
+    def test_aligned_text_is_not_taken_for_a_table(self):
+        from specs.services.parser.pdf_pages import _looks_like_text_table
+
+        prose = [["Настоящее", "предложение", "действует"], ["в", "течение", "месяца"], ["с", "даты", "выдачи"]]
+        table = [["Наименование", "Ед.", "Кол-во"], ["Болт", "шт", "2"], ["Гайка", "шт", "10"]]
+
+        self.assertFalse(_looks_like_text_table(prose))
+        self.assertTrue(_looks_like_text_table(table))
+
+    def test_auto_mode_reads_each_page_once(self):
+        from specs.services.parser import pdf_parser
+        from specs.services.parser.pdf_parser import PDFParser
+
+        pdf = make_text_pdf([[f"{page + 1} Item{page + 1}"] for page in range(3)])
+        extractor = mock.Mock(wraps=pdf_parser.extract_page_content)
+        with mock.patch.object(pdf_parser, "extract_page_content", extractor), \
+                mock.patch.object(pdf_parser, "extract_page_tables", side_effect=AssertionError), \
+                mock.patch.object(pdf_parser, "extract_page_lines", side_effect=AssertionError):
+            result = PDFParser(pdf, ai_helper=FakeAIHelper(), mode="auto", pages_per_batch=8).parse()
+
+        self.assertEqual(extractor.call_count, 1)
+        self.assertEqual(len(result.splitlines()), 4)
+
+    def test_only_ambiguous_tables_go_to_gpt(self):
+        from specs.services.parser.pdf_parser import PDFParser
+        from specs.services.processing.rule_mapper import RuleBasedNormalizer
+
+        tables = [
+            [["Наименование", "Кол-во"], ["Болт", "2"]],
+            [["Позиция заказа", "Что поставить", "Сколько"], ["1", "Гайка", "4"]],
+        ]
+        ai = FakeAIHelper()
+        parser = PDFParser(
+            make_text_pdf([["x"]]), ai_helper=ai, mode="tables", rule_normalizer=RuleBasedNormalizer(enabled=True)
+        )
+        with mock.patch.object(PDFParser, "extract_tables", return_value=tables):
+            result = parser.parse()
+
+        self.assertEqual(len(ai.calls), 1)
+        self.assertEqual([line.split(";")[1] for line in result.splitlines()[1:]], ["Болт", "Гайка"])
+
+
+class ImageTilingTests(SimpleTestCase):
+    @staticmethod
+    def make_scan(rows: int, row_height: int = 40, gap: int = 20):
+        from PIL import Image, ImageDraw
+
+        image = Image.new("RGB", (600, rows * (row_height + gap)), "white")
+        draw = ImageDraw.Draw(image)
+        for i in range(rows):
+            top = i * (row_height + gap)
+            draw.rectangle((20, top, 300, top + row_height - 1), fill="black")
+        return image
+
+    def test_tiles_are_cut_between_rows_with_overlap(self):
+        from specs.services.utils.image_tiling import find_cut_rows, plan_tiles
+
+        image = self.make_scan(rows=100)
+        bands = plan_tiles(image.height, find_cut_rows(image), tile_height=1000, overlap=30)
+
+        self.assertGreater(len(bands), 1)
+        self.assertEqual(bands[0][0], 0)
+        self.assertEqual(bands[-1][1], image.height)
+        for (_, bottom), (next_top, _) in zip(bands, bands[1:]):
+            # обе границы плиток — в промежутках между строками, соседняя плитка перекрывает стык
+            self.assertGreaterEqual(bottom % 60, 40)
+            self.assertGreaterEqual(next_top % 60, 40)
+            self.assertTrue(bottom - 30 <= next_top <= bottom)
+
+    def test_overlap_holds_whole_text_lines(self):
+        from specs.services.utils.image_tiling import find_cut_rows, overlap_lines, plan_tiles
+
+        image = self.make_scan(rows=100)
+        cut_rows = find_cut_rows(image)
+        bands = plan_tiles(image.height, cut_rows, tile_height=1000, overlap=70)
+
+        lines = overlap_lines(cut_rows, bands)
+        self.assertEqual(len(lines), len(bands) - 1)
+        for ((_, bottom), (next_top, _)), count in zip(zip(bands, bands[1:]), lines):
+            # в перекрытие 70 px помещается ровно одна строка высотой 40 px целиком
+            self.assertGreaterEqual(next_top % 60, 40)
+            self.assertEqual(count, 1)
+
+    def test_small_image_is_not_split(self):
+        from specs.services.utils.image_tiling import split_into_tiles
+
+        image = self.make_scan(rows=10)
+        self.assertEqual(split_into_tiles(image, tile_height=1000), [image])
+
+    def test_overlapping_tiles_are_merged_without_duplicates(self):
+        from specs.services.processing.csv_utils import join_overlapping_csv_tables
+
+        first = "\n".join([NORMALIZED_HEADER, ";Болт;шт.;1;", ";Гайка;шт.;2;"])
+        second = "\n".join([NORMALIZED_HEADER, "; гайка ;шт.;2;", ";Шайба;шт.;3;"])
+
+        merged = join_overlapping_csv_tables([first, second])
+
+        self.assertEqual(merged.splitlines(), [NORMALIZED_HEADER, ";Болт;шт.;1;", ";Гайка;шт.;2;", ";Шайба;шт.;3;"])
+
+    def test_repeated_rows_outside_overlap_are_kept(self):
+        from specs.services.processing.csv_utils import join_overlapping_csv_tables
+
+        first = "\n".join([NORMALIZED_HEADER, ";Болт;шт.;1;", ";Гайка;шт.;2;"])
+        second = "\n".join([NORMALIZED_HEADER, ";Гайка;шт.;2;", ";Гайка;шт.;2;", ";Шайба;шт.;3;"])
+
+        # стык без перекрытия: одинаковые соседние позиции — настоящие, не дубли
+        self.assertEqual(len(join_overlapping_csv_tables([first, second], [0]).splitlines()), 6)
+        # в перекрытии одна строка: отбрасывается только она
+        self.assertEqual(
+            join_overlapping_csv_tables([first, second], [1]).splitlines(),
+            [NORMALIZED_HEADER, ";Болт;шт.;1;", ";Гайка;шт.;2;", ";Гайка;шт.;2;", ";Шайба;шт.;3;"],
+        )
+
+    def test_tall_scan_is_sent_as_concurrent_tiles(self):
+        from specs.services.parser.jpg_parser import JpgParser
+
+        buf = BytesIO()
+        self.make_scan(rows=100).save(buf, format="JPEG")
+        tile_numbers = itertools.count(1)
+        ai = mock.Mock()
+        ai.extract_table_from_image_b64.side_effect = lambda image_b64, mime_type: f"{NORMALIZED_HEADER}\n;Плитка {next(tile_numbers)};шт.;1;"
+
+        csv_text = JpgParser(buf.getvalue(), ai_helper=ai, tile_height=1000).parse()
+
+        self.assertGreater(ai.extract_table_from_image_b64.call_count, 1)
+        self.assertEqual(len(csv_text.splitlines()), ai.extract_table_from_image_b64.call_count + 1)
+
+
+class ImagePreparationTests(SimpleTestCase):
+    def test_large_scan_is_downscaled_to_smaller_payload(self):
+        import base64
+        from PIL import Image
+        from specs.services.utils.image_prep import prepare_image
+
+        buf = BytesIO()
+        ImageTilingTests.make_scan(rows=80).convert("RGB").resize((3000, 4800)).save(buf, format="PNG")
+
+        prepared = prepare_image(buf.getvalue(), max_long_edge=1000)
+        decoded = Image.open(BytesIO(base64.b64decode(prepared.b64)))
+
+        self.assertEqual(max(decoded.size), 1000)
+        self.assertEqual(prepared.mime_type, Image.MIME[decoded.format])
+        self.assertGreater(prepared.saved_bytes, 0)
+
+
+@mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"})
+class ClientRegistryTests(SimpleTestCase):
+    def setUp(self):
+        from specs.services.ai.client_registry import reset_clients
+
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_client_is_shared_per_key(self):
+        from specs.services.ai.client_registry import get_client
+
+        self.assertIs(get_client(), get_client())
+        self.assertIsNot(get_client(), get_client(api_key="other-key"))
+
+    def test_health_check_result_is_cached(self):
+        from openai.resources.models import Models
+        from specs.services.ai.client_registry import check_health
+
+        with mock.patch.object(Models, "list", side_effect=RuntimeError("down")) as models_list:
+            self.assertFalse(check_health())
+            self.assertFalse(check_health())
+            self.assertEqual(models_list.call_count, 1)
+
+            models_list.side_effect = None
+            self.assertTrue(check_health(force=True))
+            self.assertEqual(models_list.call_count, 2)
+
+
+class ResilientCallerTests(SimpleTestCase):
+    @staticmethod
+    def connection_error():
+        import httpx
+        from openai import APIConnectionError
+
+        return APIConnectionError(request=httpx.Request("POST", "https://api.test/v1/responses"))
+
+    def make_caller(self, **kwargs):
+        from specs.services.ai.resilience import CircuitBreaker, ResilientCaller, TokenBucket
+
+        params = {"bucket": TokenBucket(rate=0), "breaker": CircuitBreaker(failure_threshold=3, reset_timeout=60),
+                  "max_attempts": 3, "base_delay": 0, "deadline": 5}
+        params.update(kwargs)
+        return ResilientCaller(**params)
+
+    def test_transient_errors_are_retried(self):
+        func = mock.Mock(side_effect=[self.connection_error(), self.connection_error(), "ok"])
+
+        self.assertEqual(self.make_caller().call(func), "ok")
+        self.assertEqual(func.call_count, 3)
+
+    def test_request_errors_are_not_retried(self):
+        func = mock.Mock(side_effect=ValueError("bad request"))
+
+        with self.assertRaises(ValueError):
+            self.make_caller().call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_circuit_opens_and_fails_fast(self):
+        from specs.services.ai.resilience import AIServiceError, CircuitOpenError
+
+        caller = self.make_caller()
+        func = mock.Mock(side_effect=self.connection_error())
+
+        with self.assertRaises(AIServiceError):
+            caller.call(func)
+        with self.assertRaises(CircuitOpenError):
+            caller.call(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_probe_is_released_when_no_call_was_made(self):
+        from specs.services.ai.resilience import CircuitBreaker, DeadlineExceededError
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        bucket = mock.Mock()
+        bucket.acquire.return_value = False
+        caller = self.make_caller(breaker=breaker, bucket=bucket)
+
+        # пробный вызов не дождался лимитера — следующий вызов снова пробный, а не CircuitOpenError
+        with self.assertRaises(DeadlineExceededError):
+            caller.call(mock.Mock())
+        bucket.acquire.return_value = True
+        self.assertEqual(caller.call(mock.Mock(return_value="ok")), "ok")
+
+    def test_local_errors_do_not_close_circuit(self):
+        from specs.services.ai.resilience import CircuitBreaker, CircuitOpenError
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        caller = self.make_caller(breaker=breaker)
+
+        with self.assertRaises(TypeError):
+            caller.call(mock.Mock(side_effect=TypeError("bug")))
+
+        # цепь по-прежнему разомкнута: без нового пробного слота вызов отклоняется
+        breaker.reset_timeout = 60
+        with self.assertRaises(CircuitOpenError):
+            caller.call(mock.Mock())
+
+    def test_rate_limit_errors_do_not_open_circuit(self):
+        import httpx
+        from openai import RateLimitError
+
+        from specs.services.ai.resilience import AIServiceError
+
+        response = httpx.Response(429, request=httpx.Request("POST", "https://api.test/v1/responses"))
+        caller = self.make_caller(max_attempts=4)
+
+        with self.assertRaises(AIServiceError):
+            caller.call(mock.Mock(side_effect=RateLimitError("slow down", response=response, body=None)))
+        # цепь не разомкнута: следующий вызов доходит до API
+        self.assertEqual(caller.call(mock.Mock(return_value="ok")), "ok")
+
+    def test_token_bucket_limits_rate(self):
+        from specs.services.ai.resilience import TokenBucket
+
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            self.assertTrue(bucket.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        self.assertFalse(bucket.acquire(timeout=0))
+
+
+class FakeBatchClient:
+    """
+    Заглушка files/batches API: задание «выполняется» сразу,
+    на каждый запрос отвечает CSV из FakeAIHelper.
+    """
+
+    def __init__(self):
+        self.files = mock.Mock()
+        self.batches = mock.Mock()
+        self.uploaded = {}
+
+        self.files.create.side_effect = self._create_file
+        self.files.content.side_effect = lambda file_id: mock.Mock(text=self.uploaded[file_id])
+        self.batches.create.side_effect = lambda input_file_id, **kwargs: mock.Mock(id=f"batch-{input_file_id}")
+        self.batches.retrieve.side_effect = self._retrieve
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{len(self.uploaded)}"
+        self.uploaded[file_id] = file.read().decode("utf-8")
+        return mock.Mock(id=file_id)
+
+    def _retrieve(self, batch_id):
+        import json
+
+        fake_ai = FakeAIHelper()
+        results = []
+        for line in self.uploaded[batch_id.removeprefix("batch-")].splitlines():
+            request = json.loads(line)
+            csv_text = request["body"]["input"][1]["content"][0]["text"].split(":\n", 1)[1]
+            text = fake_ai.normalize_table_from_csv("header\n" + csv_text)
+            body = {"output": [{"type": "message", "content": [{"type": "output_text", "text": text}]}]}
+            results.append(json.dumps({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}}))
+
+        self.uploaded["file-out"] = "\n".join(results)
+        return mock.Mock(id=batch_id, status="completed", output_file_id="file-out", error_file_id=None)
+
+
+@mock.patch.dict(os.environ, {"AI_CACHE_ENABLED": "False"})
+class BatchArchiveCommandTests(SimpleTestCase):
+    def test_archive_is_normalized_through_one_batch(self):
+        from django.core.management import call_command
+
+        client = FakeBatchClient()
+        with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir, \
+                mock.patch("specs.services.ai.ai_helper.get_client", return_value=client):
+            for name, rows in (("a.txt", "1;Болт;2\n2;Гайка;5"), ("b.txt", "1;Шайба;7"), ("sub/a.txt", "1;Винт;3")):
+                os.makedirs(os.path.dirname(os.path.join(input_dir, name)), exist_ok=True)
+                with open(os.path.join(input_dir, name), "w", encoding="utf-8") as f:
+                    f.write(rows)
+
+            call_command("process_archive", input_dir, output_dir=output_dir, poll_interval=0, stdout=StringIO())
+
+            result = pd.read_excel(os.path.join(output_dir, "a_1_consolidated.xlsx"), dtype=str)
+            self.assertTrue(os.path.exists(os.path.join(output_dir, "b_2_consolidated.xlsx")))
+            # одноимённый файл из подпапки не перетирает результат первого
+            nested = pd.read_excel(os.path.join(output_dir, "a_3_consolidated.xlsx"), dtype=str)
+
+        self.assertEqual(client.batches.create.call_count, 1)
+        self.assertEqual(sorted(result["Наименование"]), ["Болт", "Гайка"])
+        self.assertEqual(list(nested["Наименование"]), ["Винт"])
+
+    def test_collect_and_answer_runs_send_the_same_pdf_requests(self):
+        from specs.services.ai.batch import BatchAIHelper
+        from specs.services.parser.pdf_parser import PDFParser
+        from specs.services.processing.rule_mapper import RuleBasedNormalizer
+
+        # таблица не распознаётся правилами и содержит повторяющиеся строки
+        tables = [[["Позиция заказа", "Что поставить", "Сколько"], ["1", "Гайка", "4"], ["1", "Гайка", "4"]]]
+        pdf = make_text_pdf([["x"]])
+
+        def parse(ai):
+            parser = PDFParser(pdf, ai_helper=ai, mode="auto", rule_normalizer=RuleBasedNormalizer(enabled=True))
+            with mock.patch("specs.services.parser.pdf_parser.extract_page_content", return_value=[(tables, [])]):
+                return parser.parse()
+
+        collector = BatchAIHelper(cache=None, client=mock.Mock(), structured=False)
+        parse(collector)
+        # без запасного разбора текста и без сжатия дублей
+        self.assertEqual(len(collector.requests), 1)
+        [body] = collector.requests.values()
+        self.assertEqual(body["input"][1]["content"][0]["text"].count("Гайка"), 2)
+
+        answer = f"{NORMALIZED_HEADER}\n;Гайка;шт.;4;\n;Гайка;шт.;4;"
+        answering = BatchAIHelper(
+            answers={key: answer for key in collector.requests}, cache=None, client=mock.Mock(), structured=False
+        )
+        self.assertEqual(parse(answering), answer)
+
+
+class StreamingRowsTests(TestCase):
+    def test_rows_are_parsed_as_soon_as_lines_complete(self):
+        from specs.services.ai.streaming import CsvRowAssembler
+
+        assembler = CsvRowAssembler()
+        self.assertEqual(assembler.feed(NORMALIZED_HEADER[:20]), [])
+        self.assertEqual(assembler.feed(NORMALIZED_HEADER[20:] + "\n;Болт;шт.;2;"), [])
+        self.assertEqual(assembler.feed('"ГОСТ\n7798"\n;Гайка'), [["", "Болт", "шт.", "2", "ГОСТ\n7798"]])
+        self.assertEqual(assembler.feed(";шт.;5;"), [])
+        self.assertEqual(assembler.close(), [["", "Гайка", "шт.", "5", ""]])
+
+    def test_streamed_response_rows_reach_sink(self):
+        from specs.services.ai.ai_helper import AIHelper
+        from specs.services.ai.streaming import stream_rows_to
+
+        deltas = [NORMALIZED_HEADER + "\n;Бо", "лт;шт.;2;\n;Гайка;шт.;5;"]
+        events = [mock.Mock(type="response.output_text.delta", delta=d) for d in deltas]
+        stream = mock.MagicMock()
+        stream.__enter__.return_value = iter(events)
+        client = mock.Mock()
+        client.responses.create.return_value = stream
+
+        received = []
+        with stream_rows_to(received.extend):
+            text = AIHelper(cache=None, client=client).normalize_table_from_csv("Болт;2")
+
+        self.assertEqual(text, "".join(deltas))
+        self.assertEqual([row[1] for row in received], ["Болт", "Гайка"])
+        self.assertTrue(client.responses.create.call_args.kwargs["stream"])
+
+    def test_live_rows_are_polled_from_offset(self):
+        from specs.services.processing.row_log import RowLog
+
+        with tempfile.TemporaryDirectory() as media_dir, override_settings(MEDIA_ROOT=media_dir):
+            run = ProcessingRun.objects.create(input_filename="spec.txt", status=ProcessingRun.STATUS_RUNNING)
+            row_log = RowLog.for_run(media_dir, run.id)
+            row_log.append([["", "Болт", "шт.", "2", ""]])
+            url = reverse('specs:run_live_rows', args=[run.id])
+
+            first = self.client.get(url).json()
+            row_log.append([["", "Гайка", "шт.", "5", ""]])
+            ProcessingRun.objects.filter(pk=run.id).update(status=ProcessingRun.STATUS_DONE)
+            second = self.client.get(url, {'offset': first['offset']}).json()
+
+        self.assertEqual(first['rows'], [["", "Болт", "шт.", "2", ""]])
+        self.assertFalse(first['finished'])
+        self.assertEqual(second['rows'], [["", "Гайка", "шт.", "5", ""]])
+        self.assertTrue(second['finished'])
+
+
+class StructuredOutputTests(SimpleTestCase):
+    ROWS = [
+        {"designation": "ГОСТ 7798", "name": "Болт; М10", "unit": "шт.", "quantity": 2, "tech_spec": 'оцинк. "Ц"'},
+        {"designation": "", "name": "Гайка", "unit": "шт.", "quantity": 1500.5, "tech_spec": ""},
+    ]
+
+    def make_helper(self, output_text: str):
+        from specs.services.ai.ai_helper import AIHelper
+
+        client = mock.Mock()
+        client.responses.create.return_value = mock.Mock(output_text=output_text, usage=None)
+        return AIHelper(cache=None, client=client, structured=True), client
+
+    def test_json_rows_become_dataframe_without_csv(self):
+        import json
+        from specs.services.processing.consolidator_v2 import ConsolidatorV2
+        from specs.services.processing.spec_table import SpecTable
+
+        helper, client = self.make_helper(json.dumps({"rows": self.ROWS}, ensure_ascii=False))
+        table = helper.normalize_table_from_csv("Болт;2")
+
+        self.assertIsInstance(table, SpecTable)
+        self.assertEqual(client.responses.create.call_args.kwargs["text"]["format"]["type"], "json_schema")
+
+        with mock.patch("specs.services.processing.consolidator_v2.pd.read_csv") as read_csv:
+            df = ConsolidatorV2().merge_and_consolidate([table])
+        read_csv.assert_not_called()
+        self.assertEqual(df["Наименование"].tolist(), ["Болт; М10", "Гайка"])
+        self.assertEqual(df["Требуемое кол-во, в ед. изм."].tolist(), ["2", "1500.5"])
+
+    def test_tables_join_typed_and_mix_with_csv(self):
+        from specs.services.processing.csv_utils import join_csv_tables
+        from specs.services.processing.spec_table import SpecTable
+
+        table = SpecTable.model_validate({"rows": self.ROWS})
+        self.assertEqual(len(join_csv_tables([table, table]).rows), 4)
+
+        mixed = join_csv_tables([table, NORMALIZED_HEADER + "\n;Шайба;шт.;3;"])
+        df = pd.read_csv(StringIO(mixed), sep=";", dtype=str, keep_default_na=False)
+        self.assertEqual(df["Наименование"].tolist(), ["Болт; М10", "Гайка", "Шайба"])
+        self.assertEqual(df["Техническое задание"].tolist()[0], 'оцинк. "Ц"')
+
+    def test_schema_violation_is_an_error(self):
+        from pydantic import ValidationError
+
+        helper, _ = self.make_helper('{"rows": [{"name": "Болт"}]}')
+        with self.assertRaises(ValidationError):
+            helper.normalize_table_from_csv("Болт;2")
+
+
+class PromptBuilderTests(SimpleTestCase):
+    def test_rows_are_compacted_and_deduplicated(self):
+        from specs.services.ai.prompt_builder import build_table_prompt
+
+        prompt = build_table_prompt([
+            ["Наименование ", "", "Кол-во", ""],
+            ["Болт   М10", None, "2", ""],
+            ["", "", "", ""],
+            ["Болт М10", "", "2", ""],
+            ["Гайка", "", "5"],
+        ])
+
+        self.assertEqual(prompt.text, "Наименование;Кол-во\nБолт М10;2\nГайка;5")
+        self.assertEqual(prompt.counts, (1, 2, 1))
+
+    def test_rows_next_to_continuation_rows_are_not_deduplicated(self):
+        from specs.services.ai.prompt_builder import build_table_prompt, expand_result
+
+        rows = [["1. Болт М10", "2"], ["ГОСТ 7798", ""], ["2. Болт М12", "3"], ["ГОСТ 7798", ""], ["Шайба", "1"]]
+        prompt = build_table_prompt(rows + [["Шайба", "1"]])
+
+        self.assertEqual(prompt.counts, (1, 1, 1, 1, 2))
+        answer = NORMALIZED_HEADER + "\n;Болт М10;шт.;2;ГОСТ 7798\n;Болт М12;шт.;3;ГОСТ 7798\n;Шайба;шт.;1;"
+        # модель склеила продолжения: строк ответа меньше, чем входных, но шайба находится по наименованию
+        self.assertEqual(
+            expand_result(answer, prompt).splitlines()[1:],
+            [";Болт М10;шт.;2;ГОСТ 7798", ";Болт М12;шт.;3;ГОСТ 7798", ";Шайба;шт.;1;", ";Шайба;шт.;1;"],
+        )
+
+    def test_ambiguous_or_lost_rows_are_not_expanded(self):
+        from specs.services.ai.prompt_builder import build_table_prompt, expand_result
+
+        prompt = build_table_prompt([["Болт М10", "2"], ["Болт М10", "2"], ["Болт М10 оцинк.", "4"], ["Гайка", "5"]])
+        self.assertEqual(prompt.counts, (2, 1, 1))
+
+        # «Болт М10» подходит к двум входным строкам
+        answer = NORMALIZED_HEADER + "\n;Болт М10;шт.;2;\n;Болт М10 оцинк.;шт.;4;\n;Гайка;шт.;5;"
+        self.assertIsNone(expand_result(answer, prompt))
+        # модель потеряла повторявшуюся строку — кратность не должна уйти на соседнюю
+        self.assertIsNone(expand_result(NORMALIZED_HEADER + "\n;Гайка;шт.;5;", prompt))
+
+    def test_cells_with_separator_are_quoted(self):
+        from specs.services.ai.prompt_builder import build_table_prompt
+
+        prompt = build_table_prompt([["Наименование", "Кол-во"], ["Кабель ВВГ; 3х2,5", "10"]])
+
+        self.assertEqual(prompt.text, 'Наименование;Кол-во\n"Кабель ВВГ; 3х2,5";10')
+
+    def make_helper(self, *outputs):
+        from specs.services.ai.ai_helper import AIHelper
+
+        usage = mock.Mock(input_tokens=100, output_tokens=20, input_tokens_details=mock.Mock(cached_tokens=64))
+        client = mock.Mock()
+        client.responses.create.side_effect = [mock.Mock(output_text=text, usage=usage) for text in outputs]
+        return AIHelper(cache=None, client=client, structured=False), client
+
+    def test_duplicate_rows_are_expanded_in_answer(self):
+        from specs.services.ai.usage import collect_usage
+
+        helper, client = self.make_helper(NORMALIZED_HEADER + "\n;Болт;шт.;2;\n;Гайка;шт.;5;")
+        with collect_usage() as usage, self.assertLogs("specs.services.ai.usage", "INFO") as logs:
+            csv_text = helper.normalize_table_from_text([["Наименование", "Кол-во"], ["Болт", "2"], ["Болт", "2"], ["Гайка", "5"]])
+
+        self.assertEqual(csv_text.splitlines()[1:], [";Болт;шт.;2;", ";Болт;шт.;2;", ";Гайка;шт.;5;"])
+        body = client.responses.create.call_args.kwargs
+        self.assertEqual(body["input"][1]["content"][0]["text"].count("Болт"), 1)
+        self.assertTrue(body["prompt_cache_key"].startswith("smartspec-"))
+        self.assertEqual((usage.calls, usage.input_tokens, usage.cached_tokens), (1, 100, 64))
+        self.assertIn("AI call (text)", "\n".join(logs.output))
+
+    def test_unmatched_answer_is_resent_without_dedupe(self):
+        helper, client = self.make_helper(
+            NORMALIZED_HEADER + "\n;Болт и гайка;компл.;2;",
+            NORMALIZED_HEADER + "\n;Болт;шт.;2;\n;Болт;шт.;2;\n;Гайка;шт.;5;\n;Шайба;шт.;1;",
+        )
+        csv_text = helper.normalize_table_from_text([["Болт", "2"], ["Болт", "2"], ["Гайка", "5"], ["Шайба", "1"]])
+
+        self.assertEqual(client.responses.create.call_count, 2)
+        self.assertEqual(len(csv_text.splitlines()), 5)
+
+
+class ParserRegistryTests(SimpleTestCase):
+    def test_format_is_sniffed_from_content_before_extension(self):
+        import zipfile
+
+        from specs.services.parser.registry import guess_format
+
+        docx = BytesIO()
+        with zipfile.ZipFile(docx, "w") as zf:
+            zf.writestr("word/document.xml", "<w:document/>")
+
+        self.assertEqual(guess_format(b"%PDF-1.7\n...", "scan.xls"), "pdf")
+        self.assertEqual(guess_format(docx.getvalue(), "spec.xlsx"), "docx")
+        self.assertEqual(guess_format("Болт;шт;2".encode("utf-8"), "spec"), "txt")
+        self.assertEqual(guess_format(b"\x00\x01binary", "spec.xlsx"), "excel")
+        with self.assertRaises(ValueError):
+            guess_format(b"\x00\x01binary", "spec.bin")
+
+    def test_file_on_disk_is_parsed_from_its_path(self):
+        from PIL import Image
+
+        from specs.services.parser.source import read_source
+        from specs.services.processing.pipeline import parse_file
+
+        ai = mock.Mock()
+        ai.extract_table_from_image_b64.return_value = f"{NORMALIZED_HEADER}\n;Болт;шт.;1;"
+        with tempfile.TemporaryDirectory() as tmp:
+            # JPEG, сохранённый под чужим расширением
+            path = os.path.join(tmp, "scan.pdf")
+            Image.new("RGB", (50, 50), "white").save(path, format="JPEG")
+
+            with mock.patch("specs.services.parser.jpg_parser.read_source", wraps=read_source) as read:
+                tables = parse_file(path, "scan.pdf", ai_helper=ai)
+
+        self.assertEqual(read.call_args.args[0], path)
+        self.assertEqual(len(tables), 1)
+
+    def test_web_import_does_not_load_parser_dependencies(self):
+        import subprocess
+        import sys
+
+        from django.conf import settings
+
+        script = (
+            "import os, sys, django\n"
+            "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartspec.settings')\n"
+            "django.setup()\n"
+            "import specs.urls\n"
+            "print(sorted(m for m in ('pdfplumber', 'pypdfium2', 'docx', 'wand') if m in sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
+
+class ConsolidationTests(SimpleTestCase):
+    def test_duplicates_are_merged_by_normalized_keys(self):
+        from specs.services.processing.consolidator_v2 import ConsolidatorV2
+
+        first = NORMALIZED_HEADER + "\nГОСТ-1;Болт  М8;шт.;1 500,5;оцинк.\n;Кабель;м;по потребности;"
+        second = (
+            NORMALIZED_HEADER + "\nгост-1;болт м8;Штук;2;сталь\nГОСТ-1;Болт М8;шт;;оцинк."
+            "\n;Кабель;м;по потребности;\n;Гайка;кг;1,5;"
+        )
+        df = ConsolidatorV2(consolidate=True).merge_and_consolidate([first, second])
+
+        self.assertEqual(list(df["Наименование"]), ["Болт  М8", "Кабель", "Кабель", "Гайка"])
+        self.assertEqual(list(df["Требуемое кол-во, в ед. изм."]), ["1502.5", "по потребности", "по потребности", "1.5"])
+        self.assertEqual(df.loc[0, "Ед. изм."], "шт.")
+        self.assertEqual(df.loc[0, "Техническое задание"], "оцинк. | сталь")
+
+    def test_consolidation_can_be_disabled(self):
+        from specs.services.processing.consolidator_v2 import ConsolidatorV2
+
+        table = NORMALIZED_HEADER + "\n;Болт;шт;1;\n;болт;шт.;2;"
+        self.assertEqual(len(ConsolidatorV2(consolidate=False).merge_and_consolidate([table])), 2)
+        self.assertEqual(len(ConsolidatorV2(consolidate=True).merge_and_consolidate([table])), 1)
+
+    def test_fuzzy_merge_joins_spelling_variants_with_audit(self):
+        from specs.services.processing.consolidator_v2 import FUZZY_AUDIT_COLUMN, ConsolidatorV2
+
+        table = (
+            NORMALIZED_HEADER + "\n;Болт М10х40 ГОСТ 7798;шт;2;\n;Болт М10x40 ГОСТ7798;шт.;3;"
+            "\n;Болт М10x40 ГОСТ7798;кг;1;\n;Гайка М10;шт;4;"
+        )
+        df = ConsolidatorV2(consolidate=True, fuzzy=True).merge_and_consolidate([table])
+
+        self.assertEqual(list(df["Наименование"]), ["Болт М10х40 ГОСТ 7798", "Болт М10x40 ГОСТ7798", "Гайка М10"])
+        self.assertEqual(list(df["Требуемое кол-во, в ед. изм."]), ["5", "1", "4"])
+        self.assertEqual(list(df[FUZZY_AUDIT_COLUMN]), ["Болт М10x40 ГОСТ7798", "", ""])
+
+    def test_fuzzy_merge_keeps_different_sizes_and_ratings_apart(self):
+        from specs.services.processing.fuzzy_dedupe import find_fuzzy_groups
+
+        pairs = [
+            ("Болт М10х40 ГОСТ 7798-70 оцинкованный", "Болт М12х40 ГОСТ 7798-70 оцинкованный"),
+            ("Выключатель автоматический ВА47-29 1P 16А", "Выключатель автоматический ВА47-29 1P 25А"),
+            ("Кабель ВВГнг(А)-LS 3х2,5", "Кабель ВВГнг(А)-LS 3х1,5"),
+        ]
+        for first, second in pairs:
+            with self.subTest(first=first):
+                groups = find_fuzzy_groups([first, second], ["шт", "шт"], threshold=0.8)
+                self.assertEqual(len(set(groups)), 2)
+
+    def test_fuzzy_groups_compare_only_candidate_pairs(self):
+        from specs.services.processing import fuzzy_dedupe
+
+        texts = [f"Труба {i} мм ГОСТ {1000 + i * 7}" for i in range(2000)] + ["труба 5 мм гост1035"]
+        with mock.patch.object(fuzzy_dedupe, "jaccard", wraps=fuzzy_dedupe.jaccard) as jaccard:
+            groups = fuzzy_dedupe.find_fuzzy_groups(texts, ["м"] * len(texts), threshold=0.8)
+
+        self.assertEqual(groups[-1], groups[5])
+        self.assertEqual(len(set(groups)), 2000)
+        self.assertLess(jaccard.call_count, len(texts) * 5)
+
+
+class TableExportTests(SimpleTestCase):
+    def test_streamed_xlsx_has_styled_header_and_sampled_widths(self):
+        from openpyxl import load_workbook
+
+        from specs.services.exporter.table_exporter import column_widths, export_dataframe
+
+        df = pd.DataFrame({
+            "Наименование": ["Болт"] * 3000 + ["Очень длинное наименование позиции"],
+            "Требуемое кол-во, в ед. изм.": ["2"] * 3001,
+        })
+        with tempfile.TemporaryDirectory() as output_dir:
+            path = export_dataframe(df, os.path.join(output_dir, "out", "result.xlsx"))
+            sheet = load_workbook(path).active
+
+            self.assertEqual(sheet.freeze_panes, "A2")
+            self.assertTrue(sheet["A1"].font.bold)
+            self.assertEqual(sheet.max_row, len(df) + 1)
+            self.assertEqual(pd.read_excel(path, dtype=str)["Наименование"].iloc[-1], df["Наименование"].iloc[-1])
+
+            export_dataframe(df, os.path.join(output_dir, "result.csv"))
+            self.assertEqual(len(pd.read_csv(os.path.join(output_dir, "result.csv"), sep=";")), len(df))
+
+        # последняя строка попадает в выборку для подбора ширины
+        self.assertEqual(column_widths(df, sample_size=100)[0], len(df["Наименование"].iloc[-1]) + 2)
+
+
+class RunArtifactsTests(TestCase):
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+
+    def test_explicit_none_disables_cache(self):
+        from specs.services.ai.ai_helper import AIHelper
+
+        with mock.patch("specs.services.ai.ai_helper.get_default_cache") as default_cache:
+            self.assertIsNone(AIHelper(cache=None, client=mock.Mock()).cache)
+            self.assertIs(AIHelper(client=mock.Mock()).cache, default_cache.return_value)
+
+    def test_retried_run_reuses_answers_and_reexports_without_processing(self):
+        from django.core.management import call_command
+
+        from specs.jobs import execute_run, retry_run
+        from specs.services.ai.ai_helper import AIHelper
+
+        input_path = os.path.join(self.media_dir.name, "spec.txt")
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.write("Болт М8 оцинк\nГайка М8 сталь\n")
+
+        answer = mock.Mock(output_text=NORMALIZED_HEADER + "\n;Болт М8;шт.;2;\n;Гайка М8;шт.;5;", usage=None)
+        client = mock.Mock()
+        client.responses.create.side_effect = [RuntimeError("api down"), answer]
+        helper = AIHelper(cache=None, client=client, resilience=mock.Mock(call=lambda func: func(10)))
+
+        run = ProcessingRun.objects.create(input_filename="spec.txt", input_path=input_path)
+        with override_settings(MEDIA_ROOT=self.media_dir.name, SPECS_JOBS_EAGER=True), \
+                mock.patch("specs.services.ai.ai_helper.AI_STREAMING_ENABLED", False), \
+                mock.patch("specs.services.processing.pipeline.get_ai_helper", return_value=helper):
+            execute_run(run.id)
+            run.refresh_from_db()
+            self.assertEqual(run.status, ProcessingRun.STATUS_FAILED)
+
+            self.assertTrue(retry_run(run.id))
+            run.refresh_from_db()
+            self.assertEqual(run.status, ProcessingRun.STATUS_DONE)
+            self.assertFalse(retry_run(run.id))
+
+            # новый прогон того же запуска берёт ответ GPT из артефактов
+            ProcessingRun.objects.filter(pk=run.id).update(status=ProcessingRun.STATUS_FAILED)
+            os.remove(os.path.join(self.media_dir.name, "runs", str(run.id), "artifacts", "manifest.json"))
+            retry_run(run.id)
+
+            call_command("export_run", run.id, format="csv", stdout=StringIO())
+
+        self.assertEqual(client.responses.create.call_count, 2)
+        exported = pd.read_csv(os.path.join(self.media_dir.name, "output", f"spec_{run.id}_consolidated.csv"), sep=";")
+        self.assertEqual(list(exported["Наименование"]), ["Болт М8", "Гайка М8"])
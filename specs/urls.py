@@ -4,4 +4,9 @@ from . import views
 app_name = 'specs'
 urlpatterns = [
     path('', views.index, name='index'),
+    path('batch/', views.batch_upload, name='batch_upload'),
+    path('runs/<int:run_id>/', views.run_status, name='run_status'),
+    path('runs/<int:run_id>/live/', views.run_live_rows, name='run_live_rows'),
+    path('runs/<int:run_id>/rows/', views.run_rows, name='run_rows'),
+    path('runs/<int:run_id>/retry/', views.run_retry, name='run_retry'),
 ]
@@ -1,100 +1,190 @@
 import os
-import traceback
+import zipfile
 
 from django.conf import settings
-from django.shortcuts import render
-
-from specs.services.parser.docx_parser import DocxParser
-from specs.services.parser.excel_parser import ExcelParser
-from specs.services.parser.jpg_parser import JpgParser
-from specs.services.parser.pdf_parser import PDFParser
-from specs.services.parser.txt_parser import TxtParser
-from specs.services.processing.consolidator_v2 import ConsolidatorV2
-from specs.services.processing.file_service import save_final_dataframe_xlsx
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+
+from specs.jobs import is_stale, recover_runs, retry_run, submit_batch, submit_upload
+from specs.models import ProcessingRun
+from specs.results import ensure_rows, query_rows
+from specs.services.parser.registry import SUPPORTED_EXTENSIONS
+from specs.services.processing.ingest import IngestBudget, ingest_zip
+from specs.services.processing.row_log import RowLog
+
+
+def _ingest_uploads(files) -> list:
+    """
+    Сохраняет загруженные файлы; ZIP-архивы распаковываются (поддерживаемые файлы из них).
+    Лимиты числа и размера файлов (IngestBudget) — общие на весь запрос.
+    """
+    upload_dir = os.path.join(settings.MEDIA_ROOT, "uploads")
+    budget = IngestBudget()
+    ingested = []
+    for uploaded_file in files:
+        if os.path.splitext(uploaded_file.name)[1].lower() == ".zip":
+            ingested.extend(ingest_zip(uploaded_file, upload_dir, SUPPORTED_EXTENSIONS, budget))
+        else:
+            ingested.append(budget.ingest(uploaded_file.chunks(), uploaded_file.name, upload_dir, uploaded_file.size))
+    return ingested
+
+
+def _submit_uploads(files) -> ProcessingRun:
+    """
+    Один файл — обычный запуск, несколько файлов или архив — пакетный
+    (одна общая консолидация с колонкой исходного файла).
+    """
+    ingested = _ingest_uploads(files)
+    if not ingested:
+        raise ValueError("Нет файлов поддерживаемых форматов.")
+    is_archive = any(f.name.lower().endswith(".zip") for f in files)
+    if len(ingested) == 1 and not is_archive:
+        return submit_upload(ingested[0])
+    return submit_batch(ingested)
 
 
 def index(request):
     uploaded_file = None
     message = None
-    result_file_url = None
-    table_html = None
-
-    if request.method == 'POST' and request.FILES.get('specfile'):
-        uploaded_file = request.FILES['specfile']
+    run = None
 
-        # === 1. Сохраняем файл ===
-        upload_dir = os.path.join(settings.MEDIA_ROOT, "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-
-        file_path = os.path.join(upload_dir, uploaded_file.name)
-        with open(file_path, "wb+") as dest:
-            for chunk in uploaded_file.chunks():
-                dest.write(chunk)
+    files = request.FILES.getlist('specfile') if request.method == 'POST' else []
+    if files:
+        uploaded_file = files[0]
 
+        # === 1. Сохраняем файлы (один проход, имя = sha256 содержимого) ===
+        # === 2. Ставим в очередь — обработка идёт в фоновом воркере ===
         try:
-            # === 2. Определяем расширение ===
-            ext = os.path.splitext(file_path)[1].lower()
-
-            if ext == ".docx":
-                parser = DocxParser(file_path)
-                csv_tables = parser.parse_all()
-            elif ext in [".xls", ".xlsx"]:
-                parser = ExcelParser(file_path)
-                merged_csv = parser.parse_all_sheets()
-                csv_tables = [merged_csv] if merged_csv else []
-            elif ext == ".txt":
-                parser = TxtParser(file_path)
-                csv_tables = [parser.normalize()]
-            elif ext == ".pdf":
-                parser = PDFParser(file_path)
-                csv_tables = [parser.parse()]
-            elif ext in [".jpg", ".jpeg"]:
-                parser = JpgParser(file_path)
-                csv_tables = [parser.parse()]
-            else:
-                raise ValueError(f"Unsupported file type: {ext}")
-
-            # === 3. Консолидация ===
-            consolidator = ConsolidatorV2()
-            df = consolidator.merge_and_consolidate(csv_tables)
-
-            # === 4. Генерация HTML и Excel ===
-            table_html = df.to_html(classes="table table-striped table-bordered", index=False)
-
-            output_dir = os.path.join(settings.MEDIA_ROOT, "output")
-            os.makedirs(output_dir, exist_ok=True)
-
-            base_name = os.path.splitext(os.path.basename(file_path))[0]
-            output_path = os.path.join(output_dir, f"{base_name}_consolidated.xlsx")
-            save_final_dataframe_xlsx(df, output_path)
-
-            # === 5. Ссылка для скачивания ===
-            result_file_url = os.path.relpath(output_path, settings.MEDIA_ROOT)
-            result_file_url = settings.MEDIA_URL + result_file_url.replace("\\", "/")
-
-            message = f"Файл {uploaded_file.name} успешно обработан!"
-
-        except Exception as e:
-            print("❌ Ошибка при обработке файла:", e)
-            traceback.print_exc()
-
-            # fallback, если зависание из-за AI
-            if "openai" in str(e).lower() or "httpx" in str(e).lower():
-                message = "⚠️ Ошибка соединения с AI. Попробуйте позже или проверьте API-ключ."
+            run = _submit_uploads(files)
+        except (ValueError, zipfile.BadZipFile) as e:
+            message = f"Не удалось принять файлы: {e}"
+        else:
+            if run.status == ProcessingRun.STATUS_DONE:
+                message = run.message
+            elif run.sources:
+                message = f"Пакет из {len(run.sources)} файлов принят в обработку (запуск #{run.id})."
             else:
-                message = f"Ошибка при обработке: {str(e)}"
-
-    # === GET-запрос ===
-    elif request.method == 'GET':
-        uploaded_file = None
-        message = None
-        result_file_url = None
-        table_html = None
+                message = f"Файл {uploaded_file.name} принят в обработку (запуск #{run.id})."
 
     return render(request, 'specs/index.html', {
         'title': 'SmartSpec',
         'message': message,
-        'result_file_url': result_file_url,
-        'table_html': table_html,
+        'run_id': run.id if run else None,
         'uploaded_filename': uploaded_file.name if uploaded_file else None
     })
+
+
+@require_POST
+def batch_upload(request):
+    """
+    Пакетная загрузка (JSON): несколько файлов specfile и/или ZIP-архивов.
+    Все позиции консолидируются в одну таблицу с колонкой исходного файла.
+    """
+    files = request.FILES.getlist('specfile')
+    if not files:
+        return JsonResponse({'error': 'Файлы не переданы.'}, status=400)
+    try:
+        run = _submit_uploads(files)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'id': run.id,
+        'files': [source['name'] for source in run.sources] or [run.input_filename],
+        'status_url': reverse('specs:run_status', args=[run.id]),
+    }, status=202)
+
+
+def run_status(request, run_id):
+    """
+    Статус запуска для поллинга со страницы. Когда обработка завершена,
+    дополнительно отдаёт число строк, адрес постраничного API строк и ссылку на xlsx.
+    """
+    run = get_object_or_404(ProcessingRun, pk=run_id)
+    if is_stale(run):
+        # процесс, который вёл запуск, умер — запуск возвращается в очередь
+        recover_runs()
+        run.refresh_from_db()
+
+    data = {
+        'id': run.id,
+        'status': run.status,
+        'finished': run.is_finished,
+        'partial': run.partial,
+        'message': run.message,
+        'input_filename': run.input_filename,
+        'result_file_url': None,
+        'rows_url': None,
+        'row_count': None,
+        'retry_url': None,
+    }
+
+    if run.status == ProcessingRun.STATUS_FAILED or run.partial:
+        data['retry_url'] = reverse('specs:run_retry', args=[run.id])
+
+    if run.status == ProcessingRun.STATUS_DONE and run.result_file:
+        ensure_rows(run)
+        data['rows_url'] = reverse('specs:run_rows', args=[run.id])
+        data['row_count'] = run.rows.count()
+        data['result_file_url'] = settings.MEDIA_URL + run.result_file
+
+    return JsonResponse(data)
+
+
+@require_POST
+def run_retry(request, run_id):
+    """
+    Повтор упавшего или частичного запуска с места сбоя (артефакты запуска).
+    """
+    run = get_object_or_404(ProcessingRun, pk=run_id)
+    if not retry_run(run.id):
+        return JsonResponse({'error': 'Этот запуск нельзя повторить.'}, status=409)
+    return JsonResponse({'id': run.id, 'status_url': reverse('specs:run_status', args=[run.id])})
+
+
+def _int_param(request, name: str, default: int) -> int:
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def run_rows(request, run_id):
+    """
+    Страница строк результата (JSON).
+    Параметры: page, page_size, sort (поле, «-поле» — по убыванию),
+    q (обозначение или наименование), name, designation.
+    """
+    run = get_object_or_404(ProcessingRun, pk=run_id)
+    if run.status != ProcessingRun.STATUS_DONE:
+        return JsonResponse({'error': 'Результат ещё не готов.'}, status=409)
+
+    ensure_rows(run)
+    page = query_rows(
+        run,
+        page=_int_param(request, 'page', 1),
+        page_size=_int_param(request, 'page_size', settings.SPECS_RESULTS_PAGE_SIZE),
+        sort=request.GET.get('sort', 'position'),
+        query=request.GET.get('q', '').strip(),
+        name=request.GET.get('name', '').strip(),
+        designation=request.GET.get('designation', '').strip(),
+    )
+    return JsonResponse(page.as_dict())
+
+
+def run_live_rows(request, run_id):
+    """
+    Строки результата, полученные от GPT после offset (байтовая позиция в журнале
+    строк запуска), новая позиция и статус. Страница опрашивает его, пока запуск
+    не завершится; каждый запрос короткий и не держит воркер веб-сервера.
+    """
+    run = get_object_or_404(ProcessingRun, pk=run_id)
+    row_log = RowLog.for_run(settings.MEDIA_ROOT, run.id)
+    rows, offset = row_log.read_from(max(0, _int_param(request, 'offset', 0)))
+    return JsonResponse({
+        'rows': rows,
+        'offset': offset,
+        'status': run.status,
+        'finished': run.is_finished,
+    })